@@ -0,0 +1,50 @@
+"""Time online backups of chinook and in-memory snapshots as fixtures.
+
+Usage:
+    python -m benchmarks.bench_backup [repeat]
+"""
+
+
+import os
+import sys
+import tempfile
+import time
+from typing import Any, Callable
+
+from python import db
+
+CHINOOK = os.path.join("data", "chinook.sqlite")
+
+
+def timed(repeat: int, run: Callable[[], Any]) -> float:
+    """Return milliseconds per call of run()."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        run()
+    return (time.perf_counter() - start) * 1000 / repeat
+
+
+def main(argv: list[str]) -> None:
+    """Print backup times for several step sizes and a snapshot."""
+    repeat = int(argv[1]) if len(argv) > 1 else 20
+    directory = tempfile.mkdtemp(prefix="db-backup-")
+    target = os.path.join(directory, "chinook.bak")
+    try:
+        for pages, sleep in ((-1, 0.0), (256, 0.0), (16, 0.0),
+                             (256, 0.001)):
+            ms = timed(repeat, lambda: db.backup(CHINOOK, target, pages,
+                                                 sleep))
+            print(f"backup pages={pages:<5} sleep={sleep:<6} {ms:8.2f} ms")
+        ms = timed(repeat, lambda: db.backup(CHINOOK, target, verify=True))
+        print(f"backup verify=True              {ms:8.2f} ms")
+        ms = timed(repeat, lambda: db.snapshot(CHINOOK).close())
+        print(f"snapshot to :memory:            {ms:8.2f} ms")
+    finally:
+        db.close_all_pools()
+        for name in os.listdir(directory):
+            os.remove(os.path.join(directory, name))
+        os.rmdir(directory)
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,57 @@
+"""Compare row-wise and column-wise fetching for an aggregate report.
+
+Usage:
+    python -m benchmarks.bench_columns [db_file] [copies]
+"""
+
+
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Tuple
+
+from python import db
+
+# invoice_items repeated copies times
+SQL = "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n " \
+      "WHERE i < ?) SELECT InvoiceId, TrackId, UnitPrice, Quantity " \
+      "FROM invoice_items, n;"
+
+
+def measure(fetch: Callable[[], Any]) -> Tuple[Any, float, int, int]:
+    """Return the result, seconds, peak and retained bytes of fetch()."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fetch()
+    seconds = time.perf_counter() - start
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, seconds, peak, retained
+
+
+def main(argv: list[str]) -> None:
+    """Print fetch time, memory and revenue sum time of both modes."""
+    db_file = argv[1] if len(argv) > 1 else "data/chinook.sqlite"
+    copies = int(argv[2]) if len(argv) > 2 else 200
+    rows, *row_stats = measure(
+        lambda: db.select_many_rows(db_file, SQL, (copies,)))
+    start = time.perf_counter()
+    sum(row[2] * row[3] for row in rows)
+    row_sum = time.perf_counter() - start
+    del rows
+    columns, *column_stats = measure(
+        lambda: db.select_columns(db_file, SQL, (copies,)))
+    start = time.perf_counter()
+    sum(map(float.__mul__, columns["UnitPrice"].values,
+            map(float, columns["Quantity"].values)))
+    column_sum = time.perf_counter() - start
+    for name, (seconds, peak, retained), total in (
+            ("select_many_rows", row_stats, row_sum),
+            ("select_columns", column_stats, column_sum)):
+        print(f"{name:17} fetch {seconds:6.3f} s  peak "
+              f"{peak / 2 ** 20:7.1f} MiB  retained "
+              f"{retained / 2 ** 20:7.1f} MiB  sum {total:6.3f} s")
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,51 @@
+"""Time path queries on a document collection before and after indexing.
+
+Usage:
+    python -m benchmarks.bench_docstore [documents] [queries]
+"""
+
+
+import os
+import random
+import sys
+import time
+
+from python import db
+from python.docstore import Collection
+
+DB_FILE = "bench_docstore.db"
+
+
+def query_time(people: Collection, cities: list[str]) -> float:
+    """Return milliseconds per find() on address.city."""
+    start = time.perf_counter()
+    for city in cities:
+        people.find({"address.city": city})
+    return (time.perf_counter() - start) * 1000 / len(cities)
+
+
+def main(argv: list[str]) -> None:
+    """Print find() latency on a JSON path without and with an index."""
+    count = int(argv[1]) if len(argv) > 1 else 100000
+    queries = int(argv[2]) if len(argv) > 2 else 50
+    people = Collection(DB_FILE, "people")
+    people.insert_many({"name": f"person{i}", "age": i % 90,
+                        "address": {"city": f"city{i % 5000}"}}
+                       for i in range(count))
+    cities = [f"city{random.randrange(5000)}" for _ in range(queries)]
+    try:
+        scan = query_time(people, cities)
+        people.create_index("address.city")
+        seek = query_time(people, cities)
+        print(f"json_extract scan: {scan:8.3f} ms/query")
+        print(f"indexed path:      {seek:8.3f} ms/query")
+        print(f"speedup:           {scan / seek:8.1f}x")
+    finally:
+        db.close_all_pools()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(DB_FILE + suffix):
+                os.remove(DB_FILE + suffix)
+
+
+if __name__ == "__main__":
+    main(sys.argv)
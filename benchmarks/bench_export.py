@@ -0,0 +1,72 @@
+"""Compare select_many_rows + csv writing with streaming export.
+
+Exports a synthetic table in every format, then dumps several copies of
+it sequentially and concurrently, printing MB/s.
+
+Usage:
+    python -m benchmarks.bench_export [rows] [tables]
+"""
+
+
+import csv
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from python import db, export
+
+
+def build(db_file: str, rows: int, tables: int) -> list[str]:
+    """Create tables copies of a synthetic table of rows rows."""
+    names = [f"items{i}" for i in range(tables)]
+    data = [(i, f"item {i}", i % 100, i / 7) for i in range(rows)]
+    for name in names:
+        db.create_table(db_file, f"CREATE TABLE {name} (id INTEGER PRIMARY "
+                                 "KEY, name TEXT, qty INTEGER, price REAL);")
+        db.insert_many_rows(db_file, f"INSERT INTO {name} VALUES "
+                                     "(?, ?, ?, ?);", data)
+    return names
+
+
+def naive(db_file: str, table: str, path: str) -> float:
+    """Export with select_many_rows and csv.writer, return seconds."""
+    start = time.perf_counter()
+    rows = db.select_many_rows(db_file, f"SELECT * FROM {table};", ())
+    with open(path, "w", newline="", encoding="utf-8") as out:
+        csv.writer(out).writerows(rows)
+    return time.perf_counter() - start
+
+
+def main(argv: list[str]) -> None:
+    """Print export throughput per format and for parallel dumps."""
+    rows = int(argv[1]) if len(argv) > 1 else 500000
+    tables = int(argv[2]) if len(argv) > 2 else 4
+    directory = tempfile.mkdtemp(prefix="db-export-")
+    db_file = os.path.join(directory, "bench.db")
+    try:
+        names = build(db_file, rows, tables)
+        seconds = naive(db_file, names[0], os.path.join(directory, "n.csv"))
+        size = os.path.getsize(os.path.join(directory, "n.csv"))
+        print(f"{'select_many_rows csv':24} {size / 1e6 / seconds:8.1f} MB/s")
+        for suffix in ("tsv", "csv", "jsonl", "csv.gz"):
+            stats = export.export_table(
+                db_file, names[0], os.path.join(directory, "t." + suffix))
+            print(f"{'export ' + suffix:24} {stats.mb_per_sec:8.1f} MB/s")
+        for workers in (1, tables):
+            start = time.perf_counter()
+            stats_list = export.export_tables(
+                db_file, names, os.path.join(directory, f"w{workers}"),
+                workers=workers)
+            seconds = time.perf_counter() - start
+            total = sum(item.bytes for item in stats_list)
+            print(f"{f'export_tables x{workers}':24} "
+                  f"{total / 1e6 / seconds:8.1f} MB/s")
+    finally:
+        db.close_all_pools()
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main(sys.argv)
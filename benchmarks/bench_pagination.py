@@ -0,0 +1,70 @@
+"""Benchmark page latency of LIMIT/OFFSET against keyset pagination.
+
+Usage:
+    python -m benchmarks.bench_pagination [rows] [page_size]
+"""
+
+
+import os
+import sys
+import time
+
+from python import db
+
+DB_FILE = "bench_pagination.db"
+
+
+def offset_page(page: int, page_size: int) -> float:
+    """Time one page read with LIMIT/OFFSET.
+
+    Returns:
+        float: seconds
+    """
+    sql = "SELECT * FROM events ORDER BY id LIMIT ? OFFSET ?;"
+    start = time.perf_counter()
+    db.select_many_rows(DB_FILE, sql, (page_size, page * page_size))
+    return time.perf_counter() - start
+
+
+def keyset_pages(pages: list[int], page_size: int) -> dict[int, float]:
+    """Walk the table with select_page, timing the requested pages.
+
+    Returns:
+        dict: page number to seconds
+    """
+    times = {}
+    token = None
+    for page in range(max(pages) + 1):
+        start = time.perf_counter()
+        _, token = db.select_page(DB_FILE, "events", ["id"], page_size,
+                                  token)
+        if page in pages:
+            times[page] = time.perf_counter() - start
+    return times
+
+
+def main(argv: list[str]) -> None:
+    """Print milliseconds per page at increasing depths."""
+    rows = int(argv[1]) if len(argv) > 1 else 200000
+    page_size = int(argv[2]) if len(argv) > 2 else 20
+    db.create_table(DB_FILE, "CREATE TABLE IF NOT EXISTS events "
+                             "(id INTEGER PRIMARY KEY, name TEXT);")
+    db.insert_many_rows(DB_FILE, "INSERT INTO events (name) VALUES (?);",
+                        [(f"event{i}",) for i in range(rows)])
+    try:
+        last = rows // page_size - 1
+        pages = sorted({0, 10, 100, 1000, last} & set(range(last + 1)))
+        keyset = keyset_pages(pages, page_size)
+        print(f"{'page':>8} {'offset ms':>10} {'keyset ms':>10}")
+        for page in pages:
+            print(f"{page:>8} {offset_page(page, page_size) * 1000:>10.3f} "
+                  f"{keyset[page] * 1000:>10.3f}")
+    finally:
+        db.close_all_pools()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(DB_FILE + suffix):
+                os.remove(DB_FILE + suffix)
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,45 @@
+"""Benchmark helper calls/sec with and without connection pooling.
+
+Usage:
+    python -m benchmarks.bench_pool [db_file] [calls]
+"""
+
+
+import sys
+import time
+
+from python import db
+
+
+def calls_per_second(db_file: str, calls: int) -> float:
+    """Time point lookups on the tracks table through select_one_row.
+
+    Args:
+        db_file (str): database file path
+        calls (int): number of select_one_row calls to make
+
+    Returns:
+        float: calls per second
+    """
+    sql = "SELECT Name, UnitPrice FROM tracks WHERE TrackId = ?;"
+    start = time.perf_counter()
+    for i in range(calls):
+        db.select_one_row(db_file, sql, (i % 3000 + 1,))
+    return calls / (time.perf_counter() - start)
+
+
+def main(argv: list[str]) -> None:
+    """Print calls/sec before (connect per call) and after (pooled)."""
+    db_file = argv[1] if len(argv) > 1 else "data/chinook.sqlite"
+    calls = int(argv[2]) if len(argv) > 2 else 5000
+    db.configure_pool(enabled=False)
+    before = calls_per_second(db_file, calls)
+    db.configure_pool(enabled=True)
+    after = calls_per_second(db_file, calls)
+    print(f"connect per call: {before:10.0f} calls/sec")
+    print(f"pooled:           {after:10.0f} calls/sec")
+    print(f"speedup:          {after / before:10.1f}x")
+
+
+if __name__ == "__main__":
+    main(sys.argv)
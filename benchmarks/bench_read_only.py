@@ -0,0 +1,76 @@
+"""Measure point-lookup latency read-write vs read-only, mmap on and off.
+
+Lookups go through select_one_row on pooled connections. The synthetic
+database is larger than the default page cache, so most lookups touch
+pages that must be fetched from the OS page cache: with mmap they are
+read through the mapping, without it with one read() call per page.
+
+Usage:
+    python -m benchmarks.bench_read_only [rows] [lookups]
+"""
+
+
+import os
+import random
+import sys
+import time
+
+from python import db
+
+DB_FILE = "bench_read_only.db"
+SQL = "SELECT * FROM items WHERE id = ?;"
+
+
+def latency(ids: list[int]) -> tuple[float, float]:
+    """Time select_one_row for each id.
+
+    Returns:
+        tuple: (mean, 99th percentile) in microseconds
+    """
+    times = []
+    for item in ids:
+        start = time.perf_counter()
+        db.select_one_row(DB_FILE, SQL, (item,))
+        times.append(time.perf_counter() - start)
+    times.sort()
+    return (sum(times) / len(times) * 1e6,
+            times[int(len(times) * 0.99)] * 1e6)
+
+
+def main(argv: list[str]) -> None:
+    """Print mean and p99 lookup latency for each open mode."""
+    rows = int(argv[1]) if len(argv) > 1 else 300000
+    lookups = int(argv[2]) if len(argv) > 2 else 20000
+    db.create_table(DB_FILE, "CREATE TABLE IF NOT EXISTS items (id INTEGER "
+                             "PRIMARY KEY, name TEXT, payload TEXT);")
+    db.insert_many_rows(DB_FILE, "INSERT INTO items (name, payload) "
+                                 "VALUES (?, ?);",
+                        [(f"item{i}", "x" * 200) for i in range(rows)])
+    ids = [random.randint(1, rows) for _ in range(lookups)]
+    # name, read-only, mmap_size, immutable
+    modes = [
+        ("read-write", False, 0, False),
+        ("ro, mmap off", True, 0, False),
+        ("ro, mmap 1 GiB", True, 1 << 30, False),
+        ("ro immutable, mmap", True, 1 << 30, True),
+    ]
+    try:
+        print(f"{'mode':20} {'mean us':>8} {'p99 us':>8}")
+        for name, read_only, mmap_size, immutable in modes:
+            if read_only:
+                db.use_read_only(DB_FILE, mmap_size, immutable)
+            else:
+                db.use_profile("default", DB_FILE)
+            latency(ids[:1000])
+            mean, p99 = latency(ids)
+            print(f"{name:20} {mean:8.1f} {p99:8.1f}")
+    finally:
+        db.use_profile("default", DB_FILE)
+        db.close_all_pools()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(DB_FILE + suffix):
+                os.remove(DB_FILE + suffix)
+
+
+if __name__ == "__main__":
+    main(sys.argv)
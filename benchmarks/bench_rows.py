@@ -0,0 +1,48 @@
+"""Compare memory per row and build time of the row factories.
+
+Usage:
+    python -m benchmarks.bench_rows [db_file] [copies]
+"""
+
+
+import sys
+import time
+import tracemalloc
+
+from python import db
+
+# tracks repeated copies times
+SQL = "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n " \
+      "WHERE i < ?) SELECT TrackId, Name, AlbumId, Milliseconds, " \
+      "UnitPrice FROM tracks, n;"
+
+
+def measure(db_file: str, copies: int, rows: str) -> tuple[float, float]:
+    """Fetch every row with select_many_rows.
+
+    Returns:
+        tuple: (microseconds per row, bytes retained per row)
+    """
+    db.select_many_rows(db_file, SQL, (1,), rows=rows)
+    start = time.perf_counter()
+    result = db.select_many_rows(db_file, SQL, (copies,), rows=rows)
+    seconds = time.perf_counter() - start
+    tracemalloc.start()
+    result = db.select_many_rows(db_file, SQL, (copies,), rows=rows)
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return seconds * 1e6 / len(result), retained / len(result)
+
+
+def main(argv: list[str]) -> None:
+    """Print time and memory per row for each row factory."""
+    db_file = argv[1] if len(argv) > 1 else "data/chinook.sqlite"
+    copies = int(argv[2]) if len(argv) > 2 else 50
+    print(f"{'rows':6} {'us/row':>7} {'bytes/row':>10}")
+    for rows in db.ROW_FACTORIES:
+        micros, size = measure(db_file, copies, rows)
+        print(f"{rows:6} {micros:7.2f} {size:10.0f}")
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,38 @@
+"""Compare peak memory of select_many_rows and iter_rows on a full scan.
+
+Usage:
+    python -m benchmarks.bench_stream [db_file]
+"""
+
+
+import sys
+import tracemalloc
+from typing import Any, Callable
+
+from python import db
+
+
+def peak_bytes(scan: Callable[[], Any]) -> int:
+    """Return the peak traced allocation while running scan()."""
+    tracemalloc.start()
+    scan()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def main(argv: list[str]) -> None:
+    """Print peak memory for both APIs over invoice_items and tracks."""
+    db_file = argv[1] if len(argv) > 1 else "data/chinook.sqlite"
+    for table in ("invoice_items", "tracks"):
+        sql = f"SELECT * FROM {table};"
+        eager = peak_bytes(
+            lambda: len(db.select_many_rows(db_file, sql, ())))
+        lazy = peak_bytes(
+            lambda: sum(1 for _ in db.iter_rows(db_file, sql, (), 500)))
+        print(f"{table:14} select_many_rows {eager / 1024:9.0f} KiB"
+              f"   iter_rows {lazy / 1024:9.0f} KiB")
+
+
+if __name__ == "__main__":
+    main(sys.argv)
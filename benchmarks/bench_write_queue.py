@@ -0,0 +1,62 @@
+"""Benchmark single-row inserts with and without the write-behind queue.
+
+Usage:
+    python -m benchmarks.bench_write_queue [db_file] [rows]
+"""
+
+
+import os
+import sys
+import time
+
+from python import db
+from python.write_queue import WriteBehindQueue
+
+SQL = "INSERT INTO events (name) VALUES (?);"
+
+
+def direct(db_file: str, rows: int) -> float:
+    """Insert rows one commit at a time with db.insert_one_row.
+
+    Returns:
+        float: rows per second
+    """
+    start = time.perf_counter()
+    for i in range(rows):
+        db.insert_one_row(db_file, SQL, (f"event{i}",))
+    return rows / (time.perf_counter() - start)
+
+
+def queued(db_file: str, rows: int, durability: str) -> float:
+    """Insert rows through a WriteBehindQueue and wait for the last one.
+
+    Returns:
+        float: rows per second
+    """
+    start = time.perf_counter()
+    with WriteBehindQueue(db_file, durability=durability) as writes:
+        for i in range(rows):
+            writes.insert_one_row(SQL, (f"event{i}",))
+    return rows / (time.perf_counter() - start)
+
+
+def main(argv: list[str]) -> None:
+    """Print rows/sec of direct inserts and of each durability level."""
+    db_file = argv[1] if len(argv) > 1 else "bench_write_queue.db"
+    rows = int(argv[2]) if len(argv) > 2 else 500
+    db.create_table(db_file, "CREATE TABLE IF NOT EXISTS events "
+                             "(id INTEGER PRIMARY KEY, name TEXT);")
+    try:
+        print(f"insert_one_row:   {direct(db_file, rows):10.0f} rows/sec")
+        for durability in ("full", "normal", "off"):
+            rate = queued(db_file, rows, durability)
+            print(f"queued {durability:<9} {rate:10.0f} rows/sec")
+    finally:
+        db.close_all_pools()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(db_file + suffix):
+                os.remove(db_file + suffix)
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,366 @@
+"""Benchmark suite for the db.py helpers with regression checks.
+
+Runs every benchmark repeat times on a synthetic database of --rows rows
+(created in a temporary directory) and on data/chinook.sqlite, and
+writes the results to a JSON file. With --compare the results are
+checked against an earlier run: a benchmark regresses when its median
+throughput drops by more than --threshold, and the exit status is 1.
+
+Usage:
+    python -m benchmarks.suite [-o results.json] [--rows N] [--repeat N]
+                               [--compare baseline.json] [--threshold F]
+                               [--only NAME ...]
+
+Example:
+    python -m benchmarks.suite -o baseline.json
+    ... change db.py ...
+    python -m benchmarks.suite -o new.json --compare baseline.json
+"""
+
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from python import db
+
+CHINOOK = os.path.join("data", "chinook.sqlite")
+
+# setup(context) returns the timed callable, which returns its op count
+Setup = Callable[["Context"], Callable[[], int]]
+BENCHMARKS: Dict[str, Setup] = {}
+
+
+class Context:
+    """Settings and database paths shared by the benchmarks.
+
+    Args:
+        directory (str): temporary directory for synthetic databases
+        rows (int): rows in the synthetic table
+        chinook (str): path of the chinook database
+    """
+
+    def __init__(self, directory: str, rows: int, chinook: str) -> None:
+        self.directory = directory
+        self.rows = rows
+        self.chinook = chinook
+        self.random = random.Random(42)
+        self._count = 0
+
+    def fresh_db(self, rows: int = 0) -> str:
+        """Return a new database file with an items table of rows rows."""
+        self._count += 1
+        db_file = os.path.join(self.directory, f"bench{self._count}.db")
+        db.create_table(db_file, "CREATE TABLE items (id INTEGER PRIMARY "
+                                 "KEY, name TEXT NOT NULL, qty INTEGER, "
+                                 "price REAL);")
+        if rows:
+            db.insert_many_rows(db_file, INSERT, make_rows(rows))
+        return db_file
+
+    def shared_db(self) -> str:
+        """Return the synthetic database of self.rows rows (built once)."""
+        db_file = os.path.join(self.directory, "shared.db")
+        if not os.path.exists(db_file):
+            os.rename(self.fresh_db(self.rows), db_file)
+        return db_file
+
+
+INSERT = "INSERT INTO items (name, qty, price) VALUES (?, ?, ?);"
+
+
+def make_rows(count: int) -> List[Any]:
+    """Return count deterministic synthetic rows."""
+    return [(f"item{i}", i % 100, (i % 1000) / 10) for i in range(count)]
+
+
+def benchmark(name: str) -> Callable[[Setup], Setup]:
+    """Register a benchmark setup function under name."""
+    def register(setup: Setup) -> Setup:
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+@benchmark("insert_one_row")
+def bench_insert_one_row(context: Context) -> Callable[[], int]:
+    """Single-row inserts, one commit each."""
+    db_file = context.fresh_db()
+    rows = make_rows(50)
+
+    def run() -> int:
+        for row in rows:
+            db.insert_one_row(db_file, INSERT, row)
+        return len(rows)
+    return run
+
+
+def _insert_many(batch_size: int) -> Setup:
+    def setup(context: Context) -> Callable[[], int]:
+        db_file = context.fresh_db()
+        batch = make_rows(batch_size)
+        # at most 100 commits so small batches don't take minutes
+        batches = max(1, min(100, 10000 // batch_size))
+
+        def run() -> int:
+            for _ in range(batches):
+                db.insert_many_rows(db_file, INSERT, batch)
+            return batches * batch_size
+        return run
+    return setup
+
+
+for _size in (10, 100, 1000, 10000):
+    benchmark(f"insert_many_rows[{_size}]")(_insert_many(_size))
+
+
+@benchmark("select_one_row")
+def bench_point_lookup(context: Context) -> Callable[[], int]:
+    """Primary-key lookups on the synthetic table."""
+    db_file = context.shared_db()
+    ids = [context.random.randint(1, context.rows) for _ in range(5000)]
+    sql = "SELECT * FROM items WHERE id = ?;"
+
+    def run() -> int:
+        for item in ids:
+            db.select_one_row(db_file, sql, (item,))
+        return len(ids)
+    return run
+
+
+@benchmark("select_many_rows[range]")
+def bench_range_scan(context: Context) -> Callable[[], int]:
+    """Range scans of 100 rows, counted in rows."""
+    db_file = context.shared_db()
+    starts = [context.random.randint(1, max(1, context.rows - 100))
+              for _ in range(500)]
+    sql = "SELECT * FROM items WHERE id BETWEEN ? AND ?;"
+
+    def run() -> int:
+        return sum(len(db.select_many_rows(db_file, sql, (start, start + 99)))
+                   for start in starts)
+    return run
+
+
+@benchmark("iter_rows[full]")
+def bench_full_scan(context: Context) -> Callable[[], int]:
+    """Streaming full scan of the synthetic table, counted in rows."""
+    db_file = context.shared_db()
+
+    def run() -> int:
+        return sum(1 for _ in db.iter_rows(db_file, "SELECT * FROM items;",
+                                           ()))
+    return run
+
+
+@benchmark("update_record")
+def bench_update(context: Context) -> Callable[[], int]:
+    """Single-row updates by primary key, one commit each."""
+    db_file = context.fresh_db(1000)
+    ids = [context.random.randint(1, 1000) for _ in range(50)]
+    sql = "UPDATE items SET qty = qty + 1 WHERE id = ?;"
+
+    def run() -> int:
+        for item in ids:
+            db.update_record(db_file, sql, (item,))
+        return len(ids)
+    return run
+
+
+@benchmark("delete_record")
+def bench_delete(context: Context) -> Callable[[], int]:
+    """Single-row deletes by primary key, one commit each."""
+    db_file = context.fresh_db(1000)
+    sql = "DELETE FROM items WHERE id = ?;"
+
+    def run() -> int:
+        for item in range(1, 51):
+            db.delete_record(db_file, sql, (item,))
+        return 50
+    return run
+
+
+@benchmark("update_many")
+def bench_update_many(context: Context) -> Callable[[], int]:
+    """Updates by primary key through executemany in one transaction."""
+    db_file = context.fresh_db(10000)
+    rows = [(i % 7, i) for i in range(1, 10001)]
+    sql = "UPDATE items SET qty = ? WHERE id = ?;"
+
+    def run() -> int:
+        return db.update_many(db_file, sql, rows)
+    return run
+
+
+@benchmark("update_many_staged")
+def bench_update_many_staged(context: Context) -> Callable[[], int]:
+    """Updates by primary key through a staged UPDATE ... FROM."""
+    db_file = context.fresh_db(10000)
+    rows = [(i, i % 7) for i in range(1, 10001)]
+
+    def run() -> int:
+        return db.update_many_staged(db_file, "items", ["id"], ["qty"], rows)
+    return run
+
+
+@benchmark("upsert[10% changed]")
+def bench_upsert(context: Context) -> Callable[[], int]:
+    """Re-import of 10k rows where every tenth row changed."""
+    db_file = context.fresh_db(10000)
+    rows = [(i, name, qty + (i % 10 == 0), price)
+            for i, (name, qty, price) in enumerate(make_rows(10000), 1)]
+    columns = ["id", "name", "qty", "price"]
+
+    def run() -> int:
+        db.upsert(db_file, "items", columns, ["id"], rows)
+        return len(rows)
+    return run
+
+
+@benchmark("chinook.track_lookup")
+def bench_chinook_lookup(context: Context) -> Callable[[], int]:
+    """Track lookups joined with their album and genre."""
+    sql = ("SELECT t.Name, a.Title, g.Name FROM tracks t "
+           "JOIN albums a ON a.AlbumId = t.AlbumId "
+           "JOIN genres g ON g.GenreId = t.GenreId WHERE t.TrackId = ?;")
+    ids = [context.random.randint(1, 3503) for _ in range(5000)]
+
+    def run() -> int:
+        for item in ids:
+            db.select_one_row(context.chinook, sql, (item,))
+        return len(ids)
+    return run
+
+
+@benchmark("chinook.invoice_report")
+def bench_chinook_report(context: Context) -> Callable[[], int]:
+    """Revenue per country aggregate, counted in queries."""
+    sql = ("SELECT i.BillingCountry, sum(ii.UnitPrice * ii.Quantity) "
+           "FROM invoices i JOIN invoice_items ii "
+           "ON ii.InvoiceId = i.InvoiceId GROUP BY i.BillingCountry;")
+
+    def run() -> int:
+        for _ in range(50):
+            db.select_many_rows(context.chinook, sql, ())
+        return 50
+    return run
+
+
+def run_benchmark(name: str, context: Context,
+                  repeat: int) -> Dict[str, Any]:
+    """Run one benchmark repeat times, each with a fresh setup.
+
+    Returns:
+        dict: ops per run, per-run seconds and median ops per second
+    """
+    times = []
+    ops = 0
+    for _ in range(repeat):
+        run = BENCHMARKS[name](context)
+        start = time.perf_counter()
+        ops = run()
+        times.append(time.perf_counter() - start)
+        db.close_all_pools()
+    median = statistics.median(times)
+    return {
+        "ops": ops,
+        "seconds": times,
+        "median_s": median,
+        "ops_per_sec": ops / median if median else float("inf"),
+        "stdev_s": statistics.stdev(times) if len(times) > 1 else 0.0,
+    }
+
+
+def run_suite(rows: int, repeat: int,
+              only: Optional[List[str]] = None,
+              chinook: str = CHINOOK) -> Dict[str, Any]:
+    """Run the selected benchmarks (all by default).
+
+    Returns:
+        dict: {"meta": {...}, "results": {name: {...}}}
+    """
+    names = [name for name in BENCHMARKS
+             if not only or any(name.startswith(o) for o in only)]
+    if not os.path.exists(chinook):
+        names = [name for name in names if not name.startswith("chinook")]
+    directory = tempfile.mkdtemp(prefix="db-bench-")
+    try:
+        context = Context(directory, rows, chinook)
+        results = {}
+        for name in names:
+            results[name] = run_benchmark(name, context, repeat)
+            print(f"{name:28} {results[name]['ops_per_sec']:12.0f} ops/s",
+                  file=sys.stderr)
+    finally:
+        db.close_all_pools()
+        shutil.rmtree(directory, ignore_errors=True)
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "rows": rows,
+            "repeat": repeat,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any],
+            threshold: float) -> List[str]:
+    """Return a line per benchmark and mark throughput regressions.
+
+    A benchmark regresses when its median ops/sec is more than threshold
+    (a fraction) below the baseline's.
+
+    Returns:
+        list[str]: report lines; regressions start with "REGRESSION"
+    """
+    lines = []
+    for name, result in current["results"].items():
+        old = baseline["results"].get(name)
+        if old is None:
+            lines.append(f"new         {name}")
+            continue
+        change = result["ops_per_sec"] / old["ops_per_sec"] - 1
+        status = "REGRESSION" if change < -threshold else "ok"
+        lines.append(f"{status:11} {name:28} {old['ops_per_sec']:12.0f} -> "
+                     f"{result['ops_per_sec']:12.0f} ops/s "
+                     f"({change:+.1%})")
+    return lines
+
+
+def main(argv: List[str]) -> int:
+    """Command line entry, returns the exit status."""
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.suite")
+    parser.add_argument("-o", "--output", default="bench-results.json")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--only", nargs="*")
+    parser.add_argument("--compare")
+    parser.add_argument("--threshold", type=float, default=0.10)
+    args = parser.parse_args(argv[1:])
+    results = run_suite(args.rows, args.repeat, args.only)
+    with open(args.output, "w", encoding="utf-8") as out:
+        json.dump(results, out, indent=2)
+    if args.compare is None:
+        return 0
+    with open(args.compare, encoding="utf-8") as baseline_file:
+        baseline = json.load(baseline_file)
+    lines = compare(results, baseline, args.threshold)
+    print("\n".join(lines))
+    return 1 if any(line.startswith("REGRESSION") for line in lines) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
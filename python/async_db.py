@@ -0,0 +1,262 @@
+"""asyncio front-end for db.py.
+
+AsyncDB mirrors the db.py helpers as coroutines that run on a bounded
+thread pool, so SQLite disk I/O never blocks the event loop. Each worker
+thread reuses its own pooled connection (the connection pool prefers the
+connection a thread used last); keep db.configure_pool(max_size=...) at
+least as large as max_workers so workers don't wait on each other.
+
+Example:
+    from python.async_db import AsyncDB
+
+    async def main() -> None:
+        async with AsyncDB(max_workers=4) as adb:
+            row = await adb.select_one_row("data/chinook.sqlite",
+                                           "SELECT * FROM tracks "
+                                           "WHERE TrackId = ?;", (1,))
+            async for row in adb.iter_rows("data/chinook.sqlite",
+                                           "SELECT * FROM tracks;", ()):
+                ...
+            print(adb.metrics())
+"""
+
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from types import TracebackType
+from typing import Any, AsyncGenerator, Callable, Dict, List, Optional
+from typing import Tuple, Type, TypeVar
+
+from . import db
+
+T = TypeVar("T")
+
+_END = object()
+
+
+class ExecutorMetrics:
+    """Queue depth and wait/run times of an AsyncDB executor.
+
+    wait time is measured from submission until a worker picks the call
+    up, run time while the worker executes it.
+    """
+
+    def __init__(self) -> None:
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.run_total = 0.0
+        self._lock = threading.Lock()
+
+    def submitted(self) -> None:
+        """Count a call entering the queue."""
+        with self._lock:
+            self.queued += 1
+
+    def started(self, waited: float) -> None:
+        """Move a call from the queue to a worker."""
+        with self._lock:
+            self.queued -= 1
+            self.running += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+
+    def finished(self, ran: float) -> None:
+        """Count a call as completed."""
+        with self._lock:
+            self.running -= 1
+            self.completed += 1
+            self.run_total += ran
+
+    def snapshot(self) -> Dict[str, float]:
+        """Return the metrics as a dict."""
+        with self._lock:
+            done = self.completed or 1
+            return {
+                "queue_depth": self.queued,
+                "running": self.running,
+                "completed": self.completed,
+                "wait_avg": self.wait_total / done,
+                "wait_max": self.wait_max,
+                "run_avg": self.run_total / done,
+            }
+
+
+class _Stream:
+    """Worker side of AsyncDB.stream_rows: runs db.stream_rows on one
+    thread and hands the batches to the event loop through a queue."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop,
+                 batches: "asyncio.Queue[Any]",
+                 stop: threading.Event) -> None:
+        self.loop = loop
+        self.batches = batches
+        self.stop = stop
+
+    def put(self, item: Any) -> None:
+        """Wait until the queue takes item, unless the reader stopped."""
+        if not self.stop.is_set():
+            asyncio.run_coroutine_threadsafe(self.batches.put(item),
+                                             self.loop).result()
+
+    def produce(self, *args: Any) -> None:
+        """Put every batch of db.stream_rows(*args), then _END or the
+        exception raised."""
+        try:
+            with closing(db.stream_rows(*args)) as stream:
+                for batch in stream:
+                    self.put(batch)
+                    if self.stop.is_set():
+                        return
+            self.put(_END)
+        except BaseException as err:
+            self.put(err)
+
+
+class AsyncDB:
+    """Coroutine versions of the db.py helpers.
+
+    Args:
+        max_workers (int): number of worker threads, i.e. the maximum
+            number of SQLite calls running at once.
+    """
+
+    def __init__(self, max_workers: int = 4) -> None:
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix="async-db")
+        self._metrics = ExecutorMetrics()
+
+    async def __aenter__(self) -> "AsyncDB":
+        return self
+
+    async def __aexit__(self, exc_type: Optional[Type[BaseException]],
+                        exc: Optional[BaseException],
+                        traceback: Optional[TracebackType]) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        """Wait for running calls and stop the worker threads."""
+        await asyncio.get_running_loop().run_in_executor(
+            None, self._executor.shutdown)
+
+    def metrics(self) -> Dict[str, float]:
+        """Return queue depth, running calls and wait/run times.
+
+        Returns:
+            dict: queue_depth, running, completed, wait_avg, wait_max
+            and run_avg (seconds)
+        """
+        return self._metrics.snapshot()
+
+    async def run(self, func: Callable[..., T], *args: Any) -> T:
+        """Run func(*args) on a worker thread and await its result."""
+        submitted = time.perf_counter()
+        self._metrics.submitted()
+
+        def job() -> T:
+            started = time.perf_counter()
+            self._metrics.started(started - submitted)
+            try:
+                return func(*args)
+            finally:
+                self._metrics.finished(time.perf_counter() - started)
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, job)
+
+    async def create_table(self, db_file: str,
+                           create_table_sql: str) -> None:
+        """See db.create_table."""
+        await self.run(db.create_table, db_file, create_table_sql)
+
+    async def insert_one_row(self, db_file: str, insert_row_sql: str,
+                             row: Tuple[Any, ...]) -> Optional[int]:
+        """See db.insert_one_row."""
+        return await self.run(db.insert_one_row, db_file, insert_row_sql,
+                              row)
+
+    async def insert_many_rows(self, db_file: str, insert_rows_sql: str,
+                               rows: List[Any]) -> Optional[int]:
+        """See db.insert_many_rows."""
+        return await self.run(db.insert_many_rows, db_file,
+                              insert_rows_sql, rows)
+
+    async def select_one_row(self, db_file: str, select_row_sql: str,
+                             where: Tuple[Any, ...],
+                             rows: str = "tuple") -> Any:
+        """See db.select_one_row."""
+        return await self.run(db.select_one_row, db_file, select_row_sql,
+                              where, rows)
+
+    async def select_many_rows(self, db_file: str, select_rows_sql: str,
+                               where: Tuple[Any, ...],
+                               rows: str = "tuple") -> Any:
+        """See db.select_many_rows."""
+        return await self.run(db.select_many_rows, db_file,
+                              select_rows_sql, where, rows)
+
+    async def update_record(self, db_file: str, update_sql: str,
+                            where: Tuple[Any, ...]) -> Optional[int]:
+        """See db.update_record."""
+        return await self.run(db.update_record, db_file, update_sql, where)
+
+    async def delete_record(self, db_file: str, delete_sql: str,
+                            where: Tuple[Any]) -> int:
+        """See db.delete_record."""
+        return await self.run(db.delete_record, db_file, delete_sql, where)
+
+    async def execute_non_query(self, db_file: str, sql: str) -> None:
+        """See db.execute_non_query."""
+        await self.run(db.execute_non_query, db_file, sql)
+
+    async def stream_rows(self, db_file: str, select_rows_sql: str,
+                          where: Tuple[Any, ...], batch_size: int = 1000,
+                          rows: str = "tuple"
+                          ) -> AsyncGenerator[List[Any], None]:
+        """Asynchronously yield batches of rows; see db.stream_rows.
+
+        The whole stream runs as one call on one worker thread, since
+        the connection behind it may only be used by the thread that
+        opened it. That worker fetches one batch ahead and is busy until
+        the iteration finishes or the async generator is closed.
+        """
+        batches: "asyncio.Queue[Any]" = asyncio.Queue(maxsize=1)
+        stop = threading.Event()
+        stream = _Stream(asyncio.get_running_loop(), batches, stop)
+        producer = asyncio.ensure_future(self.run(
+            stream.produce, db_file, select_rows_sql, where, batch_size,
+            rows))
+        try:
+            while True:
+                item = await batches.get()
+                if item is _END:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+            # unblock a put() waiting for room so the worker sees stop
+            while not batches.empty():
+                batches.get_nowait()
+            await producer
+
+    async def iter_rows(self, db_file: str, select_rows_sql: str,
+                        where: Tuple[Any, ...], batch_size: int = 1000,
+                        rows: str = "tuple"
+                        ) -> AsyncGenerator[Any, None]:
+        """Asynchronously yield rows; see db.iter_rows."""
+        batches = self.stream_rows(db_file, select_rows_sql, where,
+                                   batch_size, rows)
+        try:
+            async for batch in batches:
+                for row in batch:
+                    yield row
+        finally:
+            await batches.aclose()
@@ -0,0 +1,422 @@
+"""Bulk loader for tab-separated data files.
+
+Streams TSV files such as the ones in SupplyChainDB/ into SQLite tables.
+Column types are inferred from a sample of rows under the header and every
+row is validated against them while loading. Each table is loaded in one
+transaction with executemany() in chunks, using PRAGMAs tuned for loading,
+and indexes are (re)created only after the rows are in.
+
+Example:
+    from python import bulk_load
+
+    stats = bulk_load.load_directory("supply.db", "SupplyChainDB")
+    print(bulk_load.format_report(stats))
+
+or from the command line:
+
+    python -m python.bulk_load supply.db SupplyChainDB
+"""
+
+
+import csv
+import glob
+import os
+import re
+import sqlite3
+import sys
+import time
+from dataclasses import dataclass, field
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence
+from typing import TextIO, Tuple
+
+from . import db
+
+# PRAGMAs applied to the loading connection. journal_mode is left alone
+# when the database already uses WAL since leaving WAL is persistent.
+LOAD_PRAGMAS: Dict[str, Any] = {
+    "journal_mode": "MEMORY",
+    "synchronous": "OFF",
+    "cache_size": -64000,
+    "temp_store": "MEMORY",
+}
+
+_INTEGER = re.compile(r"-?(0|[1-9][0-9]*)")
+_REAL = re.compile(r"-?(0|[1-9][0-9]*)(\.[0-9]+)?([eE][-+]?[0-9]+)?")
+_CONVERTERS = {"INTEGER": int, "REAL": float, "TEXT": str}
+
+
+@dataclass
+class TableSchema:
+    """Table layout inferred from a TSV file.
+
+    Args:
+        table (str): table name
+        columns (list[str]): column names from the header
+        types (list[str]): INTEGER, REAL or TEXT for each column
+        primary_key (str): INTEGER PRIMARY KEY column or None
+        references (dict): column name to referenced (parent) table
+    """
+
+    table: str
+    columns: List[str]
+    types: List[str]
+    primary_key: Optional[str] = None
+    references: Dict[str, str] = field(default_factory=dict)
+
+    def create_sql(self) -> str:
+        """Return a CREATE TABLE IF NOT EXISTS statement."""
+        defs = []
+        for name, col_type in zip(self.columns, self.types):
+            pk = " PRIMARY KEY" if name == self.primary_key else ""
+            if name in self.references:
+                pk += f' REFERENCES "{self.references[name]}"'
+            defs.append(f'"{name}" {col_type}{pk}')
+        return (f'CREATE TABLE IF NOT EXISTS "{self.table}" '
+                f'({", ".join(defs)});')
+
+    def insert_sql(self) -> str:
+        """Return an INSERT statement with one ? per column."""
+        names = ", ".join(f'"{name}"' for name in self.columns)
+        marks = ", ".join("?" * len(self.columns))
+        return f'INSERT INTO "{self.table}" ({names}) VALUES ({marks});'
+
+
+@dataclass
+class LoadStats:
+    """Result of loading one table.
+
+    Args:
+        table (str): table name
+        rows (int): number of rows inserted
+        seconds (float): wall time including index creation and commit
+    """
+
+    table: str
+    rows: int
+    seconds: float
+
+    @property
+    def rows_per_sec(self) -> float:
+        """Rows inserted per second."""
+        return self.rows / self.seconds if self.seconds > 0 else 0.0
+
+
+def _open_tsv(tsv_path: str) -> TextIO:
+    return open(tsv_path, newline="", encoding="utf-8")
+
+
+def _tsv_reader(tsv_file: TextIO) -> Iterator[List[str]]:
+    return csv.reader(tsv_file, delimiter="\t", quoting=csv.QUOTE_NONE)
+
+
+def _value_type(value: str) -> str:
+    if _INTEGER.fullmatch(value):
+        return "INTEGER"
+    if _REAL.fullmatch(value):
+        return "REAL"
+    return "TEXT"
+
+
+def _widen(current: Optional[str], value: str) -> Optional[str]:
+    """Return the narrowest type holding both current and value."""
+    if value == "":
+        return current
+    found = _value_type(value)
+    if current is None or current == found:
+        return found
+    if {current, found} == {"INTEGER", "REAL"}:
+        return "REAL"
+    return "TEXT"
+
+
+def infer_schema(tsv_path: str, table: Optional[str] = None,
+                 sample_size: int = 1000,
+                 column_types: Optional[Dict[str, str]] = None
+                 ) -> TableSchema:
+    """Infer a table schema from the header and first rows of a TSV file.
+
+    A column is INTEGER if every sampled value is an integer without
+    leading zeros, REAL if values are integers or decimals (again without
+    leading zeros, so 0.5 is REAL but 05021 is TEXT) and TEXT otherwise.
+    A leading integer column whose name ends in "ID" becomes the INTEGER
+    PRIMARY KEY.
+
+    Args:
+        tsv_path (str): path of the TSV file
+        table (str): table name, defaults to the file name without suffix
+        sample_size (int): number of rows inspected after the header
+        column_types (dict): explicit types overriding the inferred ones
+
+    Raises:
+        ValueError: the file has no header.
+
+    Returns:
+        TableSchema: inferred schema
+    """
+    with _open_tsv(tsv_path) as tsv_file:
+        reader = _tsv_reader(tsv_file)
+        columns = next(reader, None)
+        if not columns:
+            raise ValueError(f"{tsv_path}: missing header row")
+        inferred: List[Optional[str]] = [None] * len(columns)
+        for row in islice(reader, sample_size):
+            inferred = [_widen(t, v) for t, v in zip(inferred, row)]
+    overrides = column_types or {}
+    types = [overrides.get(name, found or "TEXT").upper()
+             for name, found in zip(columns, inferred)]
+    primary_key = None
+    if columns[0].upper().endswith("ID") and types[0] == "INTEGER":
+        primary_key = columns[0]
+    if table is None:
+        table = os.path.splitext(os.path.basename(tsv_path))[0]
+    return TableSchema(table, columns, types, primary_key)
+
+
+def convert_row(schema: TableSchema, row: List[str],
+                where: str) -> Tuple[Any, ...]:
+    """Convert the string fields of one row to the schema's types.
+
+    Empty fields become NULL except in TEXT columns.
+
+    Args:
+        schema (TableSchema): schema the row must match
+        row (list[str]): fields as read from the file
+        where (str): location used in error messages, e.g. file:line
+
+    Raises:
+        ValueError: wrong field count or a value not matching its type.
+
+    Returns:
+        tuple: typed row
+    """
+    if len(row) != len(schema.columns):
+        raise ValueError(f"{where}: expected {len(schema.columns)} "
+                         f"fields, found {len(row)}")
+    values: List[Any] = []
+    for name, col_type, value in zip(schema.columns, schema.types, row):
+        if value == "" and col_type != "TEXT":
+            values.append(None)
+            continue
+        try:
+            values.append(_CONVERTERS[col_type](value))
+        except ValueError:
+            raise ValueError(f"{where}: {name}={value!r} is not "
+                             f"{col_type}") from None
+    return tuple(values)
+
+
+def read_rows(tsv_path: str,
+              schema: TableSchema) -> Iterator[Tuple[Any, ...]]:
+    """Yield validated, typed rows of a TSV file, skipping the header.
+
+    Args:
+        tsv_path (str): path of the TSV file
+        schema (TableSchema): schema the rows must match
+
+    Raises:
+        ValueError: a row has the wrong field count or an invalid value.
+
+    Yields:
+        tuple: row converted to the schema's column types
+    """
+    with _open_tsv(tsv_path) as tsv_file:
+        reader = _tsv_reader(tsv_file)
+        next(reader, None)
+        for line, row in enumerate(reader, start=2):
+            if row:
+                yield convert_row(schema, row, f"{tsv_path}:{line}")
+
+
+def apply_pragmas(conn: sqlite3.Connection, pragmas: Dict[str, Any]) -> None:
+    """Apply PRAGMA name = value settings to a connection.
+
+    Same as db.apply_pragmas, except that journal_mode is skipped for
+    databases already in WAL mode.
+
+    Args:
+        conn (Connection): connection to configure
+        pragmas (dict): PRAGMA names and values
+    """
+    if "journal_mode" in pragmas:
+        mode = conn.execute("PRAGMA journal_mode;").fetchone()[0]
+        if mode.lower() == "wal":
+            pragmas = {name: value for name, value in pragmas.items()
+                       if name != "journal_mode"}
+    db.apply_pragmas(conn, pragmas)
+
+
+def _table_indexes(conn: sqlite3.Connection,
+                   table: str) -> List[Tuple[str, str]]:
+    """Return (name, sql) of explicitly created indexes on table."""
+    rows = conn.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'index' "
+        "AND tbl_name = ? AND sql IS NOT NULL;", (table,)).fetchall()
+    return [(row[0], row[1]) for row in rows]
+
+
+def insert_chunks(conn: sqlite3.Connection, insert_sql: str,
+                  rows: Iterable[Tuple[Any, ...]],
+                  chunk_size: int) -> int:
+    """Insert rows with executemany() in chunks of chunk_size.
+
+    The caller owns the transaction.
+
+    Args:
+        conn (Connection): connection with an open transaction
+        insert_sql (str): INSERT statement with ? placeholders
+        rows (iterable): rows to insert
+        chunk_size (int): rows passed to each executemany() call
+
+    Returns:
+        int: number of rows inserted
+    """
+    total = 0
+    iterator = iter(rows)
+    cursor = conn.cursor()
+    try:
+        chunk = list(islice(iterator, chunk_size))
+        while chunk:
+            cursor.executemany(insert_sql, chunk)
+            total += len(chunk)
+            chunk = list(islice(iterator, chunk_size))
+    finally:
+        cursor.close()
+    return total
+
+
+def load_rows(conn: sqlite3.Connection, schema: TableSchema,
+              rows: Iterable[Tuple[Any, ...]], chunk_size: int = 5000,
+              indexes: Sequence[str] = (), replace: bool = False) -> int:
+    """Load rows into schema.table in a single transaction.
+
+    Existing explicit indexes on the table are dropped before inserting
+    and recreated, together with indexes, after all rows are in.
+
+    Args:
+        conn (Connection): connection in autocommit mode
+            (isolation_level=None)
+        schema (TableSchema): table to create and fill
+        rows (iterable): typed rows to insert
+        chunk_size (int): rows passed to each executemany() call
+        indexes (list[str]): CREATE INDEX statements to run after loading
+        replace (bool): drop and recreate the table first
+
+    Returns:
+        int: number of rows inserted
+    """
+    conn.execute("BEGIN;")
+    try:
+        deferred = _table_indexes(conn, schema.table)
+        if replace:
+            conn.execute(f'DROP TABLE IF EXISTS "{schema.table}";')
+        conn.execute(schema.create_sql())
+        for name, _ in _table_indexes(conn, schema.table):
+            conn.execute(f'DROP INDEX "{name}";')
+        total = insert_chunks(conn, schema.insert_sql(), rows, chunk_size)
+        for index_sql in [sql for _, sql in deferred] + list(indexes):
+            conn.execute(index_sql)
+        conn.execute("COMMIT;")
+        return total
+    except BaseException:
+        conn.execute("ROLLBACK;")
+        raise
+
+
+def open_loader(db_file: str,
+                pragmas: Optional[Dict[str, Any]] = None
+                ) -> sqlite3.Connection:
+    """Open a dedicated autocommit connection configured for loading.
+
+    Args:
+        db_file (str): database file path
+        pragmas (dict): PRAGMAs to apply, defaults to LOAD_PRAGMAS
+
+    Returns:
+        sqlite3.Connection: connection with isolation_level=None
+    """
+    conn = db.create_connection(db_file)
+    conn.isolation_level = None
+    apply_pragmas(conn, LOAD_PRAGMAS if pragmas is None else pragmas)
+    return conn
+
+
+def load_tsv(db_file: str, tsv_path: str, table: Optional[str] = None,
+             chunk_size: int = 5000, indexes: Sequence[str] = (),
+             replace: bool = False,
+             pragmas: Optional[Dict[str, Any]] = None,
+             column_types: Optional[Dict[str, str]] = None) -> LoadStats:
+    """Stream one TSV file into a table.
+
+    Args:
+        db_file (str): database file path
+        tsv_path (str): path of the TSV file
+        table (str): table name, defaults to the file name without suffix
+        chunk_size (int): rows passed to each executemany() call
+        indexes (list[str]): CREATE INDEX statements to run after loading
+        replace (bool): drop and recreate the table first
+        pragmas (dict): PRAGMAs for the load, defaults to LOAD_PRAGMAS
+        column_types (dict): explicit column types overriding inference
+
+    Raises:
+        ValueError: the file doesn't match the inferred schema.
+        err: sqlite3.Error as an exception.
+
+    Returns:
+        LoadStats: rows loaded and elapsed time
+    """
+    start = time.perf_counter()
+    schema = infer_schema(tsv_path, table, column_types=column_types)
+    conn = open_loader(db_file, pragmas)
+    try:
+        rows = load_rows(conn, schema, read_rows(tsv_path, schema),
+                         chunk_size, indexes, replace)
+    finally:
+        db.close_connection(conn)
+    return LoadStats(schema.table, rows, time.perf_counter() - start)
+
+
+def load_directory(db_file: str, directory: str,
+                   pattern: str = "*.tsv", chunk_size: int = 5000,
+                   replace: bool = True,
+                   pragmas: Optional[Dict[str, Any]] = None
+                   ) -> List[LoadStats]:
+    """Load every TSV file in a directory, one table per file.
+
+    Args:
+        db_file (str): database file path
+        directory (str): directory containing the TSV files
+        pattern (str): glob pattern selecting the files
+        chunk_size (int): rows passed to each executemany() call
+        replace (bool): drop and recreate existing tables first
+        pragmas (dict): PRAGMAs for the load, defaults to LOAD_PRAGMAS
+
+    Returns:
+        list[LoadStats]: one entry per table in load order
+    """
+    paths = sorted(glob.glob(os.path.join(directory, pattern)))
+    return [load_tsv(db_file, path, chunk_size=chunk_size,
+                     replace=replace, pragmas=pragmas)
+            for path in paths]
+
+
+def format_report(stats: Iterable[LoadStats]) -> str:
+    """Return a text table of rows and rows/sec per table."""
+    lines = [f"{'table':20} {'rows':>10} {'seconds':>9} {'rows/sec':>12}"]
+    for item in stats:
+        lines.append(f"{item.table:20} {item.rows:10d} "
+                     f"{item.seconds:9.3f} {item.rows_per_sec:12.0f}")
+    return "\n".join(lines)
+
+
+def main(argv: List[str]) -> None:
+    """Command line entry: bulk_load <db_file> [directory]."""
+    if len(argv) < 2:
+        print("usage: python -m python.bulk_load <db_file> [directory]")
+        sys.exit(2)
+    directory = argv[2] if len(argv) > 2 else "SupplyChainDB"
+    print(format_report(load_directory(argv[1], directory)))
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,262 @@
+"""Change data capture with triggers and a change log.
+
+track() installs AFTER INSERT, UPDATE and DELETE triggers on a table.
+They append one row per changed row to the cdc_changes table: a
+sequence number, the table, the operation and the row's key as a JSON
+array. With values=True the new column values are logged too, as a
+JSON object. JSON can't hold BLOBs, so BLOB keys and values are logged
+as lower-case hex strings, as export writes them. An UPDATE that
+changes the key is logged as a delete of the old key followed by an
+update of the new one.
+
+A ChangeConsumer reads the changes after its last acknowledged sequence
+number in batches. A cache or search index can then apply just the rows
+that changed instead of rescanning the tables. Positions are stored in
+cdc_consumers, so a consumer resumes where it stopped. prune() deletes
+the changes every consumer has acknowledged.
+
+Example:
+    from python import cdc
+
+    cdc.track("data/chinook.sqlite", "tracks")
+    consumer = cdc.ChangeConsumer("data/chinook.sqlite", "search")
+    for batch in consumer.batches(500):
+        for change in batch:
+            reindex(change.table, change.key, change.op)
+    cdc.prune("data/chinook.sqlite")
+"""
+
+
+import json
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from . import db
+
+# AUTOINCREMENT: sequence numbers must not be reused once pruned rows
+# leave the table empty, or consumers would skip the new changes
+_SCHEMA = ("CREATE TABLE IF NOT EXISTS cdc_changes ("
+           "seq INTEGER PRIMARY KEY AUTOINCREMENT, tbl TEXT NOT NULL, "
+           "op TEXT NOT NULL, pk TEXT NOT NULL, data TEXT);",
+           "CREATE TABLE IF NOT EXISTS cdc_consumers ("
+           "name TEXT PRIMARY KEY, seq INTEGER NOT NULL);")
+_OPS = {"I": "insert", "U": "update", "D": "delete"}
+_TRIGGERS = ("insert", "update", "delete")
+_MAX_SEQ = 2 ** 63 - 1
+
+
+@dataclass(frozen=True)
+class Change:
+    """One logged row change.
+
+    Attributes:
+        seq (int): position in the change log
+        table (str): changed table
+        op (str): "insert", "update" or "delete"
+        key (tuple): key column values of the row
+        values (dict): new column values, None for deletes or when the
+            table is tracked without values
+    """
+
+    seq: int
+    table: str
+    op: str
+    key: Tuple[Any, ...]
+    values: Optional[Dict[str, Any]]
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _create_log(db_file: str) -> None:
+    for sql in _SCHEMA:
+        db.create_table(db_file, sql)
+
+
+def _columns(db_file: str, table: str) -> Tuple[List[str], List[str]]:
+    """Return the columns and primary key columns (rowid if none)."""
+    info = db.select_many_rows(
+        db_file, "SELECT name, pk FROM pragma_table_info(?);", (table,))
+    if not info:
+        raise ValueError(f"no such table: {table}")
+    keys = [name for name, pk in sorted(info, key=lambda c: c[1]) if pk]
+    return [name for name, _ in info], keys or ["rowid"]
+
+
+def _json_value(ref: str, column: str) -> str:
+    """SQL of the OLD or NEW value of column, BLOBs turned into hex."""
+    value = f"{ref}.{_quote(column)}"
+    return f"CASE WHEN typeof({value}) = 'blob' THEN lower(hex({value})) " \
+        f"ELSE {value} END"
+
+
+def _row_sql(table: str, op: str, ref: str, keys: List[str],
+             values: Optional[List[str]]) -> str:
+    """SELECT of the change-log row for the OLD or NEW row ref."""
+    pk = ", ".join(_json_value(ref, c) for c in keys)
+    data = "NULL"
+    if values:
+        data = "json_object(" + ", ".join(
+            f"'{c.replace(chr(39), chr(39) * 2)}', {_json_value(ref, c)}"
+            for c in values) + ")"
+    name = table.replace("'", "''")
+    return f"SELECT '{name}', '{op}', json_array({pk}), {data}"
+
+
+def _trigger_sql(table: str, keys: List[str],
+                 values: Optional[List[str]]) -> List[str]:
+    insert = "INSERT INTO cdc_changes (tbl, op, pk, data) "
+    old_key = ", ".join(_json_value("OLD", c) for c in keys)
+    new_key = ", ".join(_json_value("NEW", c) for c in keys)
+    bodies = {
+        "insert": insert + _row_sql(table, "I", "NEW", keys, values) + ";",
+        "update": (insert + _row_sql(table, "D", "OLD", keys, None) +
+                   f" WHERE json_array({old_key}) IS NOT "
+                   f"json_array({new_key});\n" +
+                   insert + _row_sql(table, "U", "NEW", keys, values) + ";"),
+        "delete": insert + _row_sql(table, "D", "OLD", keys, None) + ";",
+    }
+    return [f"CREATE TRIGGER {_quote(f'cdc_{table}_{event}')} "
+            f"AFTER {event.upper()} ON {_quote(table)} "
+            f"BEGIN\n{bodies[event]}\nEND;" for event in _TRIGGERS]
+
+
+def track(db_file: str, table: str, values: bool = False) -> None:
+    """Log every row change of table to cdc_changes.
+
+    Tracking a table again replaces its triggers, e.g. to pick up new
+    columns or to switch values on or off.
+
+    Args:
+        db_file (str): database file path
+        table (str): table to track
+        values (bool): also log the new column values as JSON
+
+    Raises:
+        ValueError: the table doesn't exist.
+        err: sqlite3.Error as an exception.
+    """
+    _create_log(db_file)
+    columns, keys = _columns(db_file, table)
+    with db.transaction(db_file) as tx:
+        for event in _TRIGGERS:
+            tx.execute_non_query(
+                f"DROP TRIGGER IF EXISTS {_quote(f'cdc_{table}_{event}')};")
+        for sql in _trigger_sql(table, keys, columns if values else None):
+            tx.execute_non_query(sql)
+
+
+def untrack(db_file: str, table: str) -> None:
+    """Remove the triggers of track(); logged changes are kept."""
+    with db.transaction(db_file) as tx:
+        for event in _TRIGGERS:
+            tx.execute_non_query(
+                f"DROP TRIGGER IF EXISTS {_quote(f'cdc_{table}_{event}')};")
+
+
+def tracked(db_file: str) -> List[str]:
+    """Return the tracked tables."""
+    rows = db.select_many_rows(
+        db_file, "SELECT tbl_name FROM sqlite_master WHERE type = "
+                 "'trigger' AND name = 'cdc_' || tbl_name || '_insert' "
+                 "ORDER BY tbl_name;", ())
+    return [name for name, in rows]
+
+
+def latest_seq(db_file: str) -> int:
+    """Return the sequence number of the last logged change, 0 if none."""
+    _create_log(db_file)
+    with db.pooled_connection(db_file) as conn:
+        row = conn.execute("SELECT seq FROM sqlite_sequence "
+                           "WHERE name = 'cdc_changes';").fetchone()
+    return int(row[0]) if row else 0
+
+
+def prune(db_file: str) -> int:
+    """Delete the changes acknowledged by every consumer.
+
+    Without consumers every change is deleted.
+
+    Returns:
+        int: number of changes deleted
+    """
+    _create_log(db_file)
+    return db.delete_record(
+        db_file, "DELETE FROM cdc_changes WHERE seq <= coalesce("
+                 "(SELECT min(seq) FROM cdc_consumers), ?);", (_MAX_SEQ,))
+
+
+class ChangeConsumer:
+    """Reader of the change log with a stored position.
+
+    A new consumer starts at the end of the log (after loading a
+    snapshot of the tables, it only needs the changes that follow) or
+    at since; an existing one resumes from its acknowledged position.
+
+    Args:
+        db_file (str): database file path
+        name (str): consumer name, the key of its stored position
+        since (int): start after this sequence number, e.g. 0 for every
+            change still logged; overrides a stored position
+    """
+
+    def __init__(self, db_file: str, name: str,
+                 since: Optional[int] = None) -> None:
+        self.db_file = db_file
+        self.name = name
+        _create_log(db_file)
+        stored = db.select_one_row(
+            db_file, "SELECT seq FROM cdc_consumers WHERE name = ?;",
+            (name,))
+        if since is None:
+            since = stored[0] if stored else latest_seq(db_file)
+        self.position: int = since
+        self._save()
+
+    def _save(self) -> None:
+        db.insert_one_row(
+            self.db_file, "INSERT INTO cdc_consumers (name, seq) "
+                          "VALUES (?, ?) ON CONFLICT (name) DO UPDATE "
+                          "SET seq = excluded.seq;",
+            (self.name, self.position))
+
+    def poll(self, batch_size: int = 1000) -> List[Change]:
+        """Return up to batch_size changes after the position.
+
+        The position doesn't move until acknowledge().
+        """
+        # read past the result cache: trigger writes to cdc_changes
+        # don't invalidate it
+        with db.pooled_connection(self.db_file) as conn:
+            rows = conn.execute(
+                "SELECT seq, tbl, op, pk, data FROM cdc_changes "
+                "WHERE seq > ? ORDER BY seq LIMIT ?;",
+                (self.position, batch_size)).fetchall()
+        return [Change(seq, table, _OPS[op], tuple(json.loads(pk)),
+                       json.loads(data) if data is not None else None)
+                for seq, table, op, pk, data in rows]
+
+    def acknowledge(self, seq: int) -> None:
+        """Store seq as the position; changes up to it may be pruned."""
+        self.position = max(self.position, seq)
+        self._save()
+
+    def batches(self, batch_size: int = 1000) -> Iterator[List[Change]]:
+        """Yield batches until the log is drained.
+
+        A batch is acknowledged when the next one is requested, so a
+        batch whose processing raised is read again next time.
+        """
+        while True:
+            batch = self.poll(batch_size)
+            if not batch:
+                return
+            yield batch
+            self.acknowledge(batch[-1].seq)
+
+    def close(self) -> None:
+        """Forget the consumer so it no longer holds back prune()."""
+        db.delete_record(self.db_file,
+                         "DELETE FROM cdc_consumers WHERE name = ?;",
+                         (self.name,))
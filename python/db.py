@@ -9,41 +9,2172 @@ Example:
     conn = db.create_connection("sqlite.db")
     db.close_connection(conn)
 
+The helper functions (create_table, insert_one_row, select_one_row, ...)
+borrow connections from a per-database ConnectionPool instead of opening
+a new connection on every call. Pooling can be tuned or turned off:
+
+    db.configure_pool(max_size=4, idle_timeout=60.0)
+    db.configure_pool(enabled=False)
+
+Connections are configured with named PRAGMA profiles (see PROFILES),
+e.g. WAL mode so readers and the writer don't block each other:
+
+    db.use_profile("read_heavy", "sqlite.db")
+    db.checkpoint_if_needed("sqlite.db", max_wal_bytes=16 * 1024 * 1024)
+
+Files that are only queried can be opened read-only with memory-mapped
+I/O (immutable=True also skips locking, for files that never change):
+
+    db.use_read_only("data/chinook.sqlite", mmap_size=512 * 1024 * 1024)
+
+Set DB_TRACK_RESOURCES=1 in the environment, or call
+set_resource_tracking(True) before opening connections, to count live
+connections, cursors and open statements per database file:
+
+    db.set_resource_tracking(True)
+    db.resource_counts("sqlite.db")
+    # {'connections': 1, 'cursors': 0, 'statements': 0}
+
+Pooled connections keep their prepared statements, so hot queries are
+only parsed once per connection. Registering queries by name keeps their
+SQL text identical between calls:
+
+    db.register_query("track_by_id",
+                      "SELECT * FROM tracks WHERE TrackId = ?;")
+    db.select_one_row(db_file, db.get_query("track_by_id"), (1,))
+    db.statement_cache_stats(db_file)
+    # {'hits': 0, 'misses': 1, 'size': 128}
+
+Repeated reads of mostly static tables can be served from memory with
+an opt-in result cache that the write helpers invalidate per table:
+
+    db.enable_result_cache(max_bytes=8 * 1024 * 1024, ttl=60.0)
+
+Consistent copies of a live database are taken with the online backup
+API, throttled and with progress, or into memory for test fixtures:
+
+    db.backup("sqlite.db", "sqlite.bak", pages=256, sleep=0.01,
+              verify=True)
+    conn = db.snapshot("data/chinook.sqlite")
+
+Statement timings, row counts and slow query plans can be recorded per
+SQL fingerprint:
+
+    profiler = db.enable_profiling(plan_threshold=0.01)
+    ...
+    print(profiler.report())
+
 """
 
 
-import sqlite3
-from sqlite3 import Error
-from typing import Any, Optional, Tuple, List
+import array
+import atexit
+import base64
+import bisect
+import dataclasses
+import hashlib
+import importlib
+import json
+import keyword
+import multiprocessing
+import os
+import random
+import re
+import sqlite3
+import sys
+import threading
+import time
+import urllib.parse
+from collections import OrderedDict
+from contextlib import closing, contextmanager
+from itertools import islice
+from sqlite3 import Error
+from typing import Any, Callable, Dict, FrozenSet, Generator, Iterable
+from typing import Iterator, List, Mapping, Set
+from typing import Optional, Tuple, Type, TypeVar, Union
+
+T = TypeVar("T")
+# statement parameters: a tuple for ? or a mapping for :name placeholders
+Params = Union[Tuple[Any, ...], Mapping[str, Any]]
+
+# start method of the worker processes of import_pipeline and export:
+# they come from a single-threaded fork server (or a fresh interpreter),
+# never from a fork of a process running pool, checkpointer or queue
+# threads
+MP_CONTEXT = multiprocessing.get_context(
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods()
+    else "spawn")
+
+
+def create_connection(db_file: str,
+                      profile: Optional[str] = None) -> sqlite3.Connection:
+    """Create sqlite3 connection and return it.
+
+    Args:
+        db_file (str): sqlite filename to open or create.
+        profile (str): name of a PROFILES entry to apply, defaults to the
+            profile selected for db_file with use_profile().
+
+    Raises:
+        err: sqlite3.Error as an exception.
+
+    Returns:
+        sqlite3.Connection: sqlite3 connection object.
+    """
+
+    try:
+        conn = _connect(db_file)
+        apply_pragmas(conn, profile_pragmas(db_file, profile))
+        return conn
+    except Error as err:
+        raise err
+
+
+def _connect(db_file: str, **kwargs: Any) -> sqlite3.Connection:
+    """Open db_file, through its read-only URI if use_read_only() set one."""
+    uri = _READ_ONLY_FILES.get(_resource_key(db_file)) \
+        if _READ_ONLY_FILES else None
+    return sqlite3.connect(uri or db_file, uri=uri is not None,
+                           factory=_connection_factory(),
+                           cached_statements=_STATEMENT_CACHE_SIZE, **kwargs)
+
+
+def close_connection(conn: sqlite3.Connection) -> None:
+    """Close a database connection to a SQLite database.
+    Args:
+      conn (Connection): Connection object
+    """
+    if conn:
+        conn.close()
+
+
+# PRAGMA settings applied to new connections, in order. busy_timeout
+# comes first so that switching journal_mode waits for other connections.
+PROFILES: Dict[str, Dict[str, Any]] = {
+    "default": {},
+    "read_heavy": {
+        "busy_timeout": 5000,
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "mmap_size": 256 * 1024 * 1024,
+        "cache_size": -64000,
+        "temp_store": "MEMORY",
+    },
+    "bulk_load": {
+        "busy_timeout": 30000,
+        "journal_mode": "WAL",
+        "synchronous": "OFF",
+        "cache_size": -256000,
+        "temp_store": "MEMORY",
+        "wal_autocheckpoint": 10000,
+    },
+    "durable": {
+        "busy_timeout": 5000,
+        "journal_mode": "WAL",
+        "synchronous": "FULL",
+        "journal_size_limit": 64 * 1024 * 1024,
+    },
+    # for use_read_only(); journal_mode can't be changed read-only
+    "read_only": {
+        "busy_timeout": 5000,
+        "query_only": "ON",
+        "mmap_size": 256 * 1024 * 1024,
+        "cache_size": -64000,
+        "temp_store": "MEMORY",
+    },
+}
+_DEFAULT_PROFILE = "default"
+_FILE_PROFILES: Dict[str, str] = {}
+_FILE_PRAGMAS: Dict[str, Dict[str, Any]] = {}
+_READ_ONLY_FILES: Dict[str, str] = {}
+
+
+def apply_pragmas(conn: sqlite3.Connection,
+                  pragmas: Dict[str, Any]) -> None:
+    """Run PRAGMA name = value for every item of pragmas.
+
+    Args:
+        conn (Connection): connection to configure
+        pragmas (dict): PRAGMA names and values
+
+    Raises:
+        ValueError: a name is not a valid PRAGMA identifier.
+    """
+    for name, value in pragmas.items():
+        if not name.isidentifier():
+            raise ValueError(f"invalid PRAGMA name {name!r}")
+        conn.execute(f"PRAGMA {name} = {value};").fetchall()
+
+
+def profile_pragmas(db_file: str,
+                    profile: Optional[str] = None) -> Dict[str, Any]:
+    """Return the PRAGMAs of profile or of the profile used for db_file.
+
+    Raises:
+        KeyError: the profile doesn't exist.
+    """
+    if profile is None:
+        key = _resource_key(db_file)
+        if key in _FILE_PRAGMAS:
+            return _FILE_PRAGMAS[key]
+        profile = _FILE_PROFILES.get(key, _DEFAULT_PROFILE)
+    try:
+        return PROFILES[profile]
+    except KeyError:
+        raise KeyError(f"unknown connection profile {profile!r}") from None
+
+
+def use_profile(profile: str, db_file: Optional[str] = None) -> None:
+    """Select the connection profile for db_file or for every file.
+
+    Applies to connections opened afterwards by create_connection and the
+    connection pools; the pool of db_file (or every pool) is closed so
+    that pooled connections are reopened with the new settings.
+
+    Args:
+        profile (str): name of a PROFILES entry
+        db_file (str): database file path, None to change the default
+
+    Raises:
+        KeyError: the profile doesn't exist.
+    """
+    global _DEFAULT_PROFILE
+    profile_pragmas("", profile)
+    if db_file is None:
+        _DEFAULT_PROFILE = profile
+        close_all_pools()
+        return
+    key = _resource_key(db_file)
+    _FILE_PROFILES[key] = profile
+    _FILE_PRAGMAS.pop(key, None)
+    _READ_ONLY_FILES.pop(key, None)
+    _close_pool(key)
+
+
+def _close_pool(key: str) -> None:
+    with _POOLS_LOCK:
+        pool = _POOLS.pop(key, None)
+    if pool is not None:
+        pool.close()
+
+
+def read_only_uri(db_file: str, immutable: bool = False,
+                  shared_cache: bool = False) -> str:
+    """Return a file: URI opening db_file read-only.
+
+    Args:
+        db_file (str): database file path
+        immutable (bool): promise that nobody changes the file, so
+            SQLite skips file locking and change detection entirely
+        shared_cache (bool): let the connections of this process share
+            one page cache (SQLite discourages shared cache in general;
+            it saves memory when many read-only connections are open)
+
+    Returns:
+        str: URI for sqlite3.connect(uri, uri=True)
+    """
+    path = urllib.parse.quote(os.path.abspath(db_file))
+    uri = f"file:{path}?mode=ro"
+    if immutable:
+        uri += "&immutable=1"
+    if shared_cache:
+        uri += "&cache=shared"
+    return uri
+
+
+def use_read_only(db_file: str, mmap_size: int = 256 * 1024 * 1024,
+                  immutable: bool = False,
+                  shared_cache: bool = False) -> None:
+    """Open db_file read-only from now on, with memory-mapped I/O.
+
+    create_connection and the helpers then connect through
+    read_only_uri() and apply the "read_only" profile: query_only and
+    mmap_size, so pages are read straight from the OS page cache
+    instead of with a read() call per page. Writes fail with
+    sqlite3.OperationalError. The pool of db_file is closed so pooled
+    connections are reopened; use_profile() on the file makes it
+    read-write again.
+
+    Args:
+        db_file (str): database file path
+        mmap_size (int): bytes of the file to memory-map, 0 turns
+            memory-mapped I/O off
+        immutable (bool): see read_only_uri; only for files that
+            never change while open (e.g. shipped snapshots)
+        shared_cache (bool): see read_only_uri
+    """
+    key = _resource_key(db_file)
+    _READ_ONLY_FILES[key] = read_only_uri(db_file, immutable, shared_cache)
+    _FILE_PRAGMAS[key] = {**PROFILES["read_only"], "mmap_size": mmap_size}
+    _close_pool(key)
+
+
+def checkpoint(db_file: str, mode: str = "PASSIVE") -> Tuple[int, int, int]:
+    """Checkpoint the write-ahead log of a WAL database.
+
+    PASSIVE copies what it can without waiting; FULL and RESTART wait
+    (up to busy_timeout) for writers and readers so the whole log is
+    copied, and TRUNCATE additionally truncates the -wal file to zero.
+
+    Args:
+        db_file (str): database file path
+        mode (str): PASSIVE, FULL, RESTART or TRUNCATE
+
+    Raises:
+        ValueError: unknown mode.
+
+    Returns:
+        tuple[int, int, int]: (busy, log frames, checkpointed frames)
+    """
+    mode = mode.upper()
+    if mode not in ("PASSIVE", "FULL", "RESTART", "TRUNCATE"):
+        raise ValueError(f"unknown checkpoint mode {mode!r}")
+    with pooled_connection(db_file) as conn:
+        row = conn.execute(f"PRAGMA wal_checkpoint({mode});").fetchone()
+    return (row[0], row[1], row[2])
+
+
+def checkpoint_if_needed(db_file: str,
+                         max_wal_bytes: int = 64 * 1024 * 1024,
+                         mode: str = "TRUNCATE") -> bool:
+    """Checkpoint db_file when its -wal file has grown past max_wal_bytes.
+
+    Automatic checkpoints are PASSIVE and never complete while readers
+    keep old snapshots open, so under sustained load the log can keep
+    growing; call this periodically (see WalCheckpointer) to bound it.
+
+    Args:
+        db_file (str): database file path
+        max_wal_bytes (int): WAL size that triggers a checkpoint
+        mode (str): checkpoint mode, see checkpoint()
+
+    Returns:
+        bool: True if a checkpoint ran and was not blocked.
+    """
+    try:
+        wal_bytes = os.path.getsize(db_file + "-wal")
+    except OSError:
+        return False
+    if wal_bytes <= max_wal_bytes:
+        return False
+    return checkpoint(db_file, mode)[0] == 0
+
+
+class WalCheckpointer(threading.Thread):
+    """Background thread calling checkpoint_if_needed every interval.
+
+    Args:
+        db_file (str): database file path
+        interval (float): seconds between checks
+        max_wal_bytes (int): WAL size that triggers a checkpoint
+        mode (str): checkpoint mode, see checkpoint()
+    """
+
+    def __init__(self, db_file: str, interval: float = 10.0,
+                 max_wal_bytes: int = 64 * 1024 * 1024,
+                 mode: str = "TRUNCATE") -> None:
+        super().__init__(name=f"wal-checkpoint:{db_file}", daemon=True)
+        self.db_file = db_file
+        self.interval = interval
+        self.max_wal_bytes = max_wal_bytes
+        self.mode = mode
+        self.checkpoints = 0
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            try:
+                if checkpoint_if_needed(self.db_file, self.max_wal_bytes,
+                                        self.mode):
+                    self.checkpoints += 1
+            except Error:
+                # busy or locked; try again next interval
+                continue
+
+    def stop(self) -> None:
+        """Stop the thread and wait for it to finish."""
+        self._stop_event.set()
+        self.join()
+
+
+class BackupError(Error):
+    """Raised when a backup fails PRAGMA integrity_check."""
+
+
+def _copy_pages(source: sqlite3.Connection, target: sqlite3.Connection,
+                pages: int, sleep: float,
+                progress: Optional[Callable[[int, int], None]]
+                ) -> Dict[str, Any]:
+    """Back source up into target, pages at a time; return the stats."""
+    stats: Dict[str, Any] = {"pages": 0, "steps": 0}
+
+    def step(status: int, remaining: int, total: int) -> None:
+        stats["pages"] = total
+        stats["steps"] += 1
+        if progress is not None:
+            progress(total - remaining, total)
+        if sleep > 0 and remaining:
+            # the source is not locked between steps
+            time.sleep(sleep)
+
+    start = time.perf_counter()
+    # in WAL mode an open read transaction pins one snapshot: writers
+    # go on, and their commits can't make the backup restart
+    if source.execute("PRAGMA journal_mode;").fetchone()[0] == "wal":
+        source.execute("BEGIN;")
+        source.execute("SELECT count(*) FROM sqlite_master;").fetchone()
+    try:
+        source.backup(target, pages=pages, progress=step)
+    finally:
+        if source.in_transaction:
+            source.rollback()
+    stats["seconds"] = time.perf_counter() - start
+    return stats
+
+
+def _open_source(db_file: str) -> sqlite3.Connection:
+    """Open db_file read-only, so that a missing file raises instead of
+    being created empty."""
+    return sqlite3.connect(read_only_uri(db_file), uri=True)
+
+
+def _verify(conn: sqlite3.Connection) -> None:
+    problems = [row[0] for row in
+                conn.execute("PRAGMA integrity_check;").fetchall()]
+    if problems != ["ok"]:
+        raise BackupError("backup failed integrity_check: " +
+                          "; ".join(problems[:10]))
+
+
+def backup(db_file: str, target_file: str, pages: int = 1024,
+           sleep: float = 0.0,
+           progress: Optional[Callable[[int, int], None]] = None,
+           verify: bool = False) -> Dict[str, Any]:
+    """Copy a live database to target_file with the online backup API.
+
+    Unlike copying the file, the result is a consistent snapshot even
+    while other connections write. The copy runs pages pages per step
+    and can sleep between steps to leave I/O to live traffic. In WAL
+    mode the snapshot taken at the start is copied while writers go on;
+    in rollback-journal mode a write by another connection restarts the
+    copy, so keep sleep at 0 for busy files in that mode.
+
+    The pages go to target_file + ".tmp", which replaces target_file
+    only once complete (and verified), so a failed backup never leaves
+    a partial file behind.
+
+    Args:
+        db_file (str): database file path
+        target_file (str): backup file path, overwritten
+        pages (int): pages copied per step, -1 for all at once
+        sleep (float): seconds to sleep between steps
+        progress (callable): called after every step with the pages
+            copied so far and the total
+        verify (bool): run PRAGMA integrity_check on the copy
+
+    Raises:
+        BackupError: the copy failed integrity_check.
+        err: sqlite3.Error as an exception.
+
+    Returns:
+        dict: pages, steps and seconds of the copy
+    """
+    partial = target_file + ".tmp"
+    if os.path.exists(partial):
+        os.remove(partial)
+    source = _open_source(db_file)
+    try:
+        target = sqlite3.connect(partial)
+        try:
+            stats = _copy_pages(source, target, pages, sleep, progress)
+            if verify:
+                _verify(target)
+        finally:
+            target.close()
+    except BaseException:
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+    finally:
+        close_connection(source)
+    os.replace(partial, target_file)
+    return stats
+
+
+def snapshot(db_file: str, pages: int = -1, sleep: float = 0.0,
+             progress: Optional[Callable[[int, int], None]] = None,
+             verify: bool = False) -> sqlite3.Connection:
+    """Return an in-memory copy of db_file, e.g. as a test fixture.
+
+    Copying a prepared database into memory is much faster than
+    recreating its tables and rows for every test, and the tests can't
+    change the file. See backup for the arguments.
+
+    Raises:
+        BackupError: the copy failed integrity_check.
+        err: sqlite3.Error as an exception.
+
+    Returns:
+        sqlite3.Connection: connection to the in-memory copy
+    """
+    target = sqlite3.connect(":memory:", check_same_thread=False)
+    source = _open_source(db_file)
+    try:
+        _copy_pages(source, target, pages, sleep, progress)
+        if verify:
+            _verify(target)
+    except BaseException:
+        target.close()
+        raise
+    finally:
+        close_connection(source)
+    return target
+
+
+_TRACKING = os.environ.get("DB_TRACK_RESOURCES", "") not in ("", "0")
+_RESOURCE_KINDS = ("connections", "cursors", "statements")
+_RESOURCE_COUNTS: Dict[str, Dict[str, int]] = {}
+_RESOURCE_LOCK = threading.Lock()
+
+
+def _resource_key(db_file: str) -> str:
+    return os.path.abspath(db_file) if _poolable(db_file) else db_file
+
+
+def _track(key: str, kind: str, delta: int) -> None:
+    with _RESOURCE_LOCK:
+        counts = _RESOURCE_COUNTS.setdefault(
+            key, dict.fromkeys(_RESOURCE_KINDS, 0))
+        counts[kind] += delta
+
+
+_STATEMENT_CACHE_SIZE = 128
+_STATEMENT_STATS: Dict[str, List[int]] = {}
+_STATEMENT_LOCK = threading.Lock()
+
+
+class StatementCache:
+    """Mirror of a connection's prepared-statement cache with counters.
+
+    sqlite3 keeps the compiled statements of every connection in an LRU
+    cache keyed by SQL text (sized with cached_statements). This class
+    tracks the same keys to tell whether executing sql reuses a prepared
+    statement (hit) or has to parse and plan it again (miss).
+
+    Args:
+        capacity (int): number of statements the connection caches.
+    """
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self._sql: "OrderedDict[str, None]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._sql)
+
+    def note(self, sql: str) -> bool:
+        """Record that sql is about to be executed.
+
+        Returns:
+            bool: True if the prepared statement is reused.
+        """
+        if sql in self._sql:
+            self._sql.move_to_end(sql)
+            self.hits += 1
+            return True
+        self.misses += 1
+        if self.capacity > 0:
+            self._sql[sql] = None
+            if len(self._sql) > self.capacity:
+                self._sql.popitem(last=False)
+        return False
+
+
+class _Connection(sqlite3.Connection):
+    """Connection carrying a StatementCache mirror and its database key."""
+
+    def __init__(self, database: str, *args: Any, **kwargs: Any) -> None:
+        super().__init__(database, *args, **kwargs)
+        if kwargs.get("uri") and database.startswith("file:"):
+            database = urllib.parse.unquote(database[5:].split("?", 1)[0])
+        self.db_key = _resource_key(database)
+        self.statements = StatementCache(
+            kwargs.get("cached_statements", _STATEMENT_CACHE_SIZE))
+
+
+class _TrackedCursor(sqlite3.Cursor):
+    """Cursor that reports itself and its statement to the tracker."""
+
+    def __init__(self, conn: "_TrackedConnection") -> None:
+        super().__init__(conn)
+        self._db_key = conn.db_key
+        self._live = True
+        self._statement = False
+        _track(self._db_key, "cursors", 1)
+
+    def _start_statement(self) -> None:
+        if self._live and not self._statement:
+            self._statement = True
+            _track(self._db_key, "statements", 1)
+
+    def execute(self, *args: Any) -> Any:
+        self._start_statement()
+        return super().execute(*args)
+
+    def executemany(self, *args: Any) -> Any:
+        self._start_statement()
+        return super().executemany(*args)
+
+    def _release(self) -> None:
+        if self._live:
+            self._live = False
+            _track(self._db_key, "cursors", -1)
+            if self._statement:
+                _track(self._db_key, "statements", -1)
+
+    def close(self) -> None:
+        self._release()
+        super().close()
+
+    def __del__(self) -> None:
+        self._release()
+
+
+class _TrackedConnection(_Connection):
+    """Connection that reports itself and its cursors to the tracker."""
+
+    def __init__(self, database: str, *args: Any, **kwargs: Any) -> None:
+        super().__init__(database, *args, **kwargs)
+        self._live = True
+        _track(self.db_key, "connections", 1)
+
+    def cursor(self, *args: Any, **kwargs: Any) -> Any:
+        if not args and "factory" not in kwargs:
+            args = (_TrackedCursor,)
+        return super().cursor(*args, **kwargs)
+
+    def _release(self) -> None:
+        if self._live:
+            self._live = False
+            _track(self.db_key, "connections", -1)
+
+    def close(self) -> None:
+        self._release()
+        super().close()
+
+    def __del__(self) -> None:
+        self._release()
+
+
+def _connection_factory() -> Type[sqlite3.Connection]:
+    return _TrackedConnection if _TRACKING else _Connection
+
+
+def set_resource_tracking(enabled: bool) -> None:
+    """Turn resource tracking on or off and reset the counters.
+
+    Only connections opened while tracking is on are counted, so enable it
+    before the first helper call (or set DB_TRACK_RESOURCES=1). Pools are
+    closed so that pooled connections are reopened with tracking.
+
+    Args:
+        enabled (bool): True to count connections, cursors and statements.
+    """
+    global _TRACKING
+    close_all_pools()
+    _TRACKING = enabled
+    with _RESOURCE_LOCK:
+        _RESOURCE_COUNTS.clear()
+
+
+def resource_counts(db_file: Optional[str] = None) -> Dict[str, Any]:
+    """Return live connection, cursor and statement counts.
+
+    A statement is counted while the cursor that executed it is open.
+
+    Args:
+        db_file (str): database file path, or None for every file.
+
+    Returns:
+        dict: {'connections': n, 'cursors': n, 'statements': n} for db_file
+        or a dict of those keyed by absolute database path.
+    """
+    with _RESOURCE_LOCK:
+        if db_file is not None:
+            counts = _RESOURCE_COUNTS.get(_resource_key(db_file), {})
+            return {kind: counts.get(kind, 0) for kind in _RESOURCE_KINDS}
+        return {key: dict(counts)
+                for key, counts in _RESOURCE_COUNTS.items()}
+
+
+class PoolTimeoutError(Error):
+    """Raised when no pooled connection becomes free before the timeout."""
+
+
+class _PoolEntry:
+    """Bookkeeping for one connection owned by a ConnectionPool."""
+
+    __slots__ = ("conn", "owner", "last_used", "file_id")
+
+    def __init__(self, conn: sqlite3.Connection,
+                 file_id: Optional[Tuple[int, int]]) -> None:
+        self.conn = conn
+        self.owner = threading.get_ident()
+        self.last_used = time.monotonic()
+        self.file_id = file_id
+
+
+def _file_id(db_file: str) -> Optional[Tuple[int, int]]:
+    """Return (device, inode) of db_file or None if it doesn't exist."""
+    try:
+        stat = os.stat(db_file)
+    except OSError:
+        return None
+    return (stat.st_dev, stat.st_ino)
+
+
+class ConnectionPool:
+    """Bounded pool of reusable connections to a single database file.
+
+    Connections are opened with check_same_thread=False so that they can be
+    handed to any thread, but a connection is only ever used by one thread
+    at a time. On checkout the pool prefers a connection last used by the
+    calling thread, evicts connections idle for longer than idle_timeout
+    and health-checks the candidate before handing it out.
+
+    Args:
+        db_file (str): sqlite filename to open or create.
+        max_size (int): maximum number of open connections.
+        idle_timeout (float): seconds after which idle connections close.
+        checkout_timeout (float): seconds to wait for a free connection.
+        pragmas (dict): PRAGMAs applied to every new connection.
+    """
+
+    def __init__(self, db_file: str, max_size: int = 8,
+                 idle_timeout: float = 300.0,
+                 checkout_timeout: float = 30.0,
+                 pragmas: Optional[Dict[str, Any]] = None) -> None:
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+        self.db_file = db_file
+        self.pragmas = pragmas or {}
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.checkout_timeout = checkout_timeout
+        self._idle: List[_PoolEntry] = []
+        self._in_use: Dict[int, _PoolEntry] = {}
+        self._cond = threading.Condition()
+        self._closed = False
+        self._opening = 0
+
+    @property
+    def size(self) -> int:
+        """Number of open connections, idle and checked out."""
+        with self._cond:
+            return len(self._idle) + len(self._in_use)
+
+    @property
+    def idle_count(self) -> int:
+        """Number of open connections waiting in the pool."""
+        with self._cond:
+            return len(self._idle)
+
+    def _open(self) -> _PoolEntry:
+        conn = _connect(self.db_file, check_same_thread=False)
+        try:
+            apply_pragmas(conn, self.pragmas)
+        except BaseException:
+            conn.close()
+            raise
+        return _PoolEntry(conn, _file_id(self.db_file))
+
+    def _healthy(self, entry: _PoolEntry) -> bool:
+        # a database file that was deleted or replaced leaves the
+        # connection pointing at the old inode
+        if entry.file_id != _file_id(self.db_file):
+            return False
+        try:
+            entry.conn.execute("SELECT 1").fetchone()
+        except Error:
+            return False
+        return True
+
+    def _evict_idle(self, now: float) -> None:
+        keep = []
+        for entry in self._idle:
+            if now - entry.last_used > self.idle_timeout:
+                entry.conn.close()
+            else:
+                keep.append(entry)
+        self._idle = keep
+
+    def _take_idle(self) -> Optional[_PoolEntry]:
+        me = threading.get_ident()
+        for index in range(len(self._idle) - 1, -1, -1):
+            if self._idle[index].owner == me:
+                return self._idle.pop(index)
+        return self._idle.pop() if self._idle else None
+
+    def _checkout(self) -> Optional[_PoolEntry]:
+        """Return a healthy idle entry or None."""
+        self._evict_idle(time.monotonic())
+        entry = self._take_idle()
+        while entry is not None and not self._healthy(entry):
+            entry.conn.close()
+            entry = self._take_idle()
+        return entry
+
+    def _reserve(self, deadline: float) -> Optional[_PoolEntry]:
+        """Wait for an idle entry, or reserve a slot and return None.
+
+        Called with self._cond held. A reserved slot counts against
+        max_size while its connection is opened outside the lock.
+        """
+        while True:
+            if self._closed:
+                raise Error(f"connection pool for {self.db_file} is closed")
+            entry = self._checkout()
+            if entry is not None:
+                return entry
+            if len(self._in_use) + self._opening < self.max_size:
+                self._opening += 1
+                return None
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not self._cond.wait(remaining):
+                raise PoolTimeoutError(
+                    f"no free connection for {self.db_file} after "
+                    f"{self.checkout_timeout} seconds")
+
+    def _open_reserved(self) -> _PoolEntry:
+        """Open the connection of a reserved slot without the lock held.
+
+        connect() and the PRAGMAs can wait up to busy_timeout, which
+        must not stall acquire() and release() of other threads.
+        """
+        try:
+            entry = self._open()
+        except BaseException:
+            with self._cond:
+                self._opening -= 1
+                self._cond.notify()
+            raise
+        return entry
+
+    def acquire(self) -> sqlite3.Connection:
+        """Check a connection out of the pool.
+
+        Raises:
+            PoolTimeoutError: no connection became free in time.
+
+        Returns:
+            sqlite3.Connection: connection reserved for the caller.
+        """
+        deadline = time.monotonic() + self.checkout_timeout
+        with self._cond:
+            entry = self._reserve(deadline)
+        opened = entry is None
+        if entry is None:
+            entry = self._open_reserved()
+        with self._cond:
+            if opened:
+                self._opening -= 1
+            if self._closed:
+                entry.conn.close()
+                self._cond.notify()
+                raise Error(f"connection pool for {self.db_file} is closed")
+            entry.owner = threading.get_ident()
+            self._in_use[id(entry.conn)] = entry
+            return entry.conn
+
+    def release(self, conn: sqlite3.Connection,
+                discard: bool = False) -> None:
+        """Return a connection to the pool.
+
+        Any transaction left open is rolled back.
+
+        Args:
+            conn (Connection): connection obtained from acquire().
+            discard (bool): close the connection instead of reusing it.
+        """
+        with self._cond:
+            entry = self._in_use.pop(id(conn), None)
+            if entry is None:
+                return
+            if conn.in_transaction and not discard:
+                try:
+                    conn.rollback()
+                except Error:
+                    discard = True
+            if discard or self._closed:
+                conn.close()
+            else:
+                entry.last_used = time.monotonic()
+                self._idle.append(entry)
+            self._cond.notify()
+
+    def close(self) -> None:
+        """Close idle connections; busy ones close when released."""
+        with self._cond:
+            self._closed = True
+            for entry in self._idle:
+                entry.conn.close()
+            self._idle = []
+            self._cond.notify_all()
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Borrow a connection for the duration of a with block.
+
+        Like `with conn:` the transaction is committed when the block
+        succeeds and rolled back when it raises.
+
+        Yields:
+            sqlite3.Connection: pooled connection.
+        """
+        conn = self.acquire()
+        discard = False
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            try:
+                conn.rollback()
+            except Error:
+                discard = True
+            raise
+        finally:
+            self.release(conn, discard)
+
+
+_POOL_SETTINGS: Dict[str, float] = {
+    "max_size": 8,
+    "idle_timeout": 300.0,
+    "checkout_timeout": 30.0,
+}
+_POOLING_ENABLED = True
+_POOLS: Dict[str, ConnectionPool] = {}
+_POOLS_LOCK = threading.Lock()
+
+
+def _poolable(db_file: str) -> bool:
+    """In-memory databases and URIs are private per connection."""
+    return db_file not in ("", ":memory:") and not db_file.startswith("file:")
+
+
+def configure_pool(enabled: Optional[bool] = None,
+                   max_size: Optional[int] = None,
+                   idle_timeout: Optional[float] = None,
+                   checkout_timeout: Optional[float] = None) -> None:
+    """Change connection pool settings used by the helper functions.
+
+    Existing pools are closed so that the new settings take effect.
+
+    Args:
+        enabled (bool): False makes every helper open its own connection.
+        max_size (int): maximum connections per database file.
+        idle_timeout (float): seconds before an idle connection is closed.
+        checkout_timeout (float): seconds to wait for a free connection.
+    """
+    global _POOLING_ENABLED
+    if enabled is not None:
+        _POOLING_ENABLED = enabled
+    if max_size is not None:
+        _POOL_SETTINGS["max_size"] = max_size
+    if idle_timeout is not None:
+        _POOL_SETTINGS["idle_timeout"] = idle_timeout
+    if checkout_timeout is not None:
+        _POOL_SETTINGS["checkout_timeout"] = checkout_timeout
+    close_all_pools()
+
+
+def get_pool(db_file: str) -> ConnectionPool:
+    """Return the shared pool for db_file, creating it on first use.
+
+    Args:
+        db_file (str): database file path
+
+    Returns:
+        ConnectionPool: pool keyed by the absolute path of db_file.
+    """
+    key = os.path.abspath(db_file)
+    with _POOLS_LOCK:
+        pool = _POOLS.get(key)
+        if pool is None:
+            pool = ConnectionPool(
+                key,
+                max_size=int(_POOL_SETTINGS["max_size"]),
+                idle_timeout=_POOL_SETTINGS["idle_timeout"],
+                checkout_timeout=_POOL_SETTINGS["checkout_timeout"],
+                pragmas=profile_pragmas(key))
+            _POOLS[key] = pool
+        return pool
+
+
+def close_all_pools() -> None:
+    """Close every connection pool created by get_pool."""
+    with _POOLS_LOCK:
+        pools = list(_POOLS.values())
+        _POOLS.clear()
+    for pool in pools:
+        pool.close()
+
+
+atexit.register(close_all_pools)
+
+
+@contextmanager
+def pooled_connection(db_file: str) -> Iterator[sqlite3.Connection]:
+    """Borrow a connection to db_file for the duration of a with block.
+
+    The transaction is committed on success and rolled back on error.
+    When pooling is disabled, or db_file is in-memory or a URI, a new
+    connection is opened and closed instead.
+
+    Args:
+        db_file (str): database file path
+
+    Yields:
+        sqlite3.Connection: connection to db_file.
+    """
+    if _POOLING_ENABLED and _poolable(db_file):
+        with get_pool(db_file).connection() as conn:
+            yield conn
+        return
+    conn = create_connection(db_file)
+    try:
+        with conn:
+            yield conn
+    finally:
+        close_connection(conn)
+
+
+ROW_FACTORIES = ("tuple", "row", "slots", "dict")
+_ROW_CLASSES: "OrderedDict[Tuple[str, ...], type]" = OrderedDict()
+_ROW_CLASS_LIMIT = 256
+_ROW_CLASS_LOCK = threading.Lock()
+
+
+def _field_names(columns: Tuple[str, ...]) -> List[str]:
+    """Turn result column names into unique attribute names."""
+    names: List[str] = []
+    for position, column in enumerate(columns):
+        name = re.sub(r"\W", "_", column)
+        if not name.isidentifier() or keyword.iskeyword(name):
+            name = f"col{position}_{name}".rstrip("_")
+        while name in names:
+            name += "_"
+        names.append(name)
+    return names
+
+
+def row_class(columns: Tuple[str, ...]) -> type:
+    """Return the __slots__ dataclass used for rows with these columns.
+
+    Classes are generated once per query shape (column names) and
+    cached. Column names are made valid identifiers, e.g. "count(*)"
+    becomes "count___" and a first column named "1" becomes "col0_1".
+
+    Args:
+        columns (tuple[str]): result column names
+
+    Returns:
+        type: dataclass with one slot per column, in column order
+    """
+    with _ROW_CLASS_LOCK:
+        cls = _ROW_CLASSES.get(columns)
+        if cls is None:
+            cls = dataclasses.make_dataclass(
+                "Row", _field_names(columns), slots=True)
+            _ROW_CLASSES[columns] = cls
+            if len(_ROW_CLASSES) > _ROW_CLASS_LIMIT:
+                _ROW_CLASSES.popitem(last=False)
+        else:
+            _ROW_CLASSES.move_to_end(columns)
+        return cls
+
+
+def _row_factory(kind: str, cursor: sqlite3.Cursor
+                 ) -> Optional[Callable[[sqlite3.Cursor, Tuple[Any, ...]],
+                                        Any]]:
+    """Return the sqlite3 row_factory building rows of the given kind."""
+    if kind == "tuple" or cursor.description is None:
+        return None
+    if kind == "row":
+        return sqlite3.Row
+    columns = tuple(item[0] for item in cursor.description)
+    if kind == "dict":
+        return lambda _, row: dict(zip(columns, row))
+    cls = row_class(columns)
+    return lambda _, row: cls(*row)
+
+
+def _check_row_factory(kind: str) -> None:
+    if kind not in ROW_FACTORIES:
+        raise ValueError(f"unknown row factory {kind!r}, "
+                         f"expected one of {ROW_FACTORIES}")
+
+
+def _note_statement(conn: sqlite3.Connection, sql: str) -> None:
+    statements = getattr(conn, "statements", None)
+    hit = statements.note(sql) if statements is not None else False
+    key = getattr(conn, "db_key", "")
+    with _STATEMENT_LOCK:
+        stats = _STATEMENT_STATS.setdefault(key, [0, 0])
+        stats[0 if hit else 1] += 1
+
+
+@contextmanager
+def _statement(conn: sqlite3.Connection, sql: str, params: Any = (),
+               many: bool = False,
+               rows: str = "tuple") -> Iterator[sqlite3.Cursor]:
+    """Execute sql on a new cursor of conn and close the cursor after.
+
+    rows selects the row factory of the cursor, see ROW_FACTORIES.
+    """
+    _note_statement(conn, sql)
+    profiler = _PROFILER
+    if profiler is not None:
+        with _profiled_statement(profiler, conn, sql, params,
+                                 many, rows) as cursor:
+            yield cursor
+        return
+    with closing(conn.cursor()) as cursor:
+        if many:
+            cursor.executemany(sql, params)
+        else:
+            cursor.execute(sql, params)
+        if rows != "tuple":
+            cursor.row_factory = _row_factory(rows, cursor)
+        yield cursor
+
+
+@contextmanager
+def _profiled_statement(profiler: "QueryProfiler",
+                        conn: sqlite3.Connection, sql: str, params: Any,
+                        many: bool, rows: str) -> Iterator[sqlite3.Cursor]:
+    """_statement that times execute() and the fetches of the caller."""
+    factory = _TrackedProfiledCursor \
+        if isinstance(conn, _TrackedConnection) else _ProfiledCursor
+    with closing(conn.cursor(factory)) as cursor:
+        start = time.perf_counter()
+        if many:
+            cursor.executemany(sql, params)
+        else:
+            cursor.execute(sql, params)
+        elapsed = time.perf_counter() - start
+        if rows != "tuple":
+            cursor.row_factory = _row_factory(rows, cursor)
+        try:
+            yield cursor
+        finally:
+            count = cursor.rows_fetched if cursor.description \
+                else cursor.rowcount
+            if many:
+                params = params[0] if isinstance(params, list) and params \
+                    else ()
+            profiler.record(conn, sql, params, elapsed + cursor.fetch_time,
+                            count)
+
+
+def _execute(conn: sqlite3.Connection, sql: str, params: Any = (),
+             many: bool = False) -> None:
+    """Execute sql on conn when no result is needed."""
+    with _statement(conn, sql, params, many):
+        pass
+
+
+def configure_statement_cache(size: int) -> None:
+    """Set how many prepared statements each connection keeps.
+
+    Existing pools are closed so that new connections use the new size.
+
+    Args:
+        size (int): statements cached per connection (sqlite3 default 128)
+    """
+    global _STATEMENT_CACHE_SIZE
+    _STATEMENT_CACHE_SIZE = size
+    close_all_pools()
+
+
+def statement_cache_stats(db_file: Optional[str] = None) -> Dict[str, int]:
+    """Return prepared-statement cache hits and misses.
+
+    Args:
+        db_file (str): database file path, or None for every file.
+
+    Returns:
+        dict: {'hits': n, 'misses': n, 'size': n}
+    """
+    with _STATEMENT_LOCK:
+        if db_file is None:
+            stats = [sum(pair) for pair in zip([0, 0],
+                                               *_STATEMENT_STATS.values())]
+        else:
+            stats = _STATEMENT_STATS.get(_resource_key(db_file), [0, 0])
+        return {"hits": stats[0], "misses": stats[1],
+                "size": _STATEMENT_CACHE_SIZE}
+
+
+def reset_statement_cache_stats() -> None:
+    """Reset the counters reported by statement_cache_stats."""
+    with _STATEMENT_LOCK:
+        _STATEMENT_STATS.clear()
+
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b|\bx'[0-9a-f]*'",
+                       re.I)
+_IN_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_PLANNED = re.compile(r"^\s*(?:SELECT|WITH|INSERT|REPLACE|UPDATE|DELETE)\b",
+                      re.I)
+# upper bounds of the latency histogram buckets in milliseconds
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 25.0, 50.0,
+                   100.0, 250.0, 500.0, 1000.0, float("inf"))
+
+
+def fingerprint(sql: str) -> str:
+    """Normalize sql so statements differing only in literals match.
+
+    String and number literals become ?, lists of placeholders become
+    (?...), whitespace is collapsed and the trailing semicolon dropped.
+
+    Args:
+        sql (str): a SQL statement
+
+    Returns:
+        str: the statement's fingerprint
+    """
+    text = _LITERALS.sub("?", sql)
+    text = _IN_LISTS.sub("(?...)", text)
+    return " ".join(text.split()).rstrip(";").rstrip()
+
+
+class _ProfiledCursor(sqlite3.Cursor):
+    """Cursor that counts the rows fetched and the time spent fetching."""
+
+    def __init__(self, conn: sqlite3.Connection) -> None:
+        super().__init__(conn)
+        self.rows_fetched = 0
+        self.fetch_time = 0.0
+
+    def _count(self, start: float, rows: int) -> None:
+        self.fetch_time += time.perf_counter() - start
+        self.rows_fetched += rows
+
+    def fetchone(self) -> Any:
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._count(start, row is not None)
+        return row
+
+    def fetchmany(self, *args: Any, **kwargs: Any) -> List[Any]:
+        start = time.perf_counter()
+        rows = super().fetchmany(*args, **kwargs)
+        self._count(start, len(rows))
+        return rows
+
+    def fetchall(self) -> List[Any]:
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._count(start, len(rows))
+        return rows
+
+
+class _TrackedProfiledCursor(_ProfiledCursor, _TrackedCursor):
+    """_ProfiledCursor for connections with resource tracking."""
+
+
+class _QueryStats:
+    """Latency histogram, row count and plan of one fingerprint."""
+
+    __slots__ = ("calls", "total", "min", "max", "rows", "buckets", "plan",
+                 "sample")
+
+    def __init__(self, sql: str, params: Any) -> None:
+        self.calls = 0
+        self.total = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+        self.rows = 0
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.plan: Optional[List[str]] = None
+        self.sample = (sql, params)
+
+    def add(self, elapsed: float, rows: int) -> None:
+        ms = elapsed * 1000.0
+        self.calls += 1
+        self.total += ms
+        self.min = min(self.min, ms)
+        self.max = max(self.max, ms)
+        self.rows += max(rows, 0)
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS, ms)] += 1
+
+    def percentile(self, fraction: float) -> float:
+        """Upper bound of the bucket holding the given fraction of calls."""
+        wanted = fraction * self.calls
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS, self.buckets):
+            seen += count
+            if count and seen >= wanted:
+                return min(bound, self.max)
+        return self.max
+
+    def as_dict(self) -> Dict[str, Any]:
+        plan = self.plan or []
+        return {
+            "calls": self.calls,
+            "total_ms": self.total,
+            "avg_ms": self.total / (self.calls or 1),
+            "min_ms": self.min if self.calls else 0.0,
+            "max_ms": self.max,
+            "p50_ms": self.percentile(0.5),
+            "p95_ms": self.percentile(0.95),
+            "p99_ms": self.percentile(0.99),
+            "rows": self.rows,
+            "histogram": {str(bound): count for bound, count
+                          in zip(LATENCY_BUCKETS, self.buckets) if count},
+            "plan": self.plan,
+            "full_scan": any(_is_full_scan(step) for step in plan),
+        }
+
+
+def _is_full_scan(detail: str) -> bool:
+    # steps of subqueries are indented by explain_query_plan
+    detail = detail.lstrip()
+    return detail.startswith("SCAN ") and detail != "SCAN CONSTANT ROW"
+
+
+class QueryProfiler:
+    """Per-fingerprint statistics of the statements run by the helpers.
+
+    Each statement executed through the helpers is timed from execute()
+    until its last fetch and counted under its fingerprint() with the
+    number of rows returned (SELECT) or affected (writes). When
+    plan_threshold is set, the EXPLAIN QUERY PLAN of a fingerprint is
+    captured the first time one of its statements takes at least that
+    long; plans containing a full table or index SCAN are flagged.
+
+    Args:
+        plan_threshold (float): seconds before a plan is captured, None
+            to never capture plans.
+    """
+
+    def __init__(self, plan_threshold: Optional[float] = None) -> None:
+        self.plan_threshold = plan_threshold
+        self._stats: Dict[str, _QueryStats] = {}
+        self._lock = threading.Lock()
+
+    def record(self, conn: sqlite3.Connection, sql: str, params: Any,
+               elapsed: float, rows: int) -> None:
+        """Add one execution of sql to its fingerprint's statistics."""
+        key = fingerprint(sql)
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = _QueryStats(sql, params)
+            stats.add(elapsed, rows)
+            wants_plan = (self.plan_threshold is not None
+                          and stats.plan is None
+                          and elapsed >= self.plan_threshold)
+        if wants_plan and _PLANNED.match(sql):
+            plan = explain_query_plan(conn, sql, params)
+            with self._lock:
+                stats.plan = plan
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Return the statistics keyed by fingerprint.
+
+        Returns:
+            dict: calls, total/avg/min/max and p50/p95/p99 latency in ms,
+            rows, a histogram of calls per bucket upper bound (ms), the
+            captured plan and whether it has a full scan.
+        """
+        with self._lock:
+            return {key: stats.as_dict()
+                    for key, stats in self._stats.items()}
+
+    def samples(self) -> List[Tuple[str, Any]]:
+        """Return the first (sql, params) recorded for each fingerprint.
+
+        The samples can be replayed as a workload, e.g. by index_advisor.
+        """
+        with self._lock:
+            return [stats.sample for stats in self._stats.values()]
+
+    def full_scans(self) -> List[str]:
+        """Return the fingerprints whose captured plan has a full SCAN."""
+        return [key for key, stats in self.stats().items()
+                if stats["full_scan"]]
+
+    def reset(self) -> None:
+        """Forget every recorded statement."""
+        with self._lock:
+            self._stats.clear()
+
+    def to_json(self, indent: Optional[int] = 2) -> str:
+        """Return stats() as a JSON document."""
+        return json.dumps(self.stats(), indent=indent)
+
+    def report(self, top: int = 20) -> str:
+        """Return a text table of the top statements by total time."""
+        stats = sorted(self.stats().items(),
+                       key=lambda item: item[1]["total_ms"], reverse=True)
+        lines = [f"{'calls':>8} {'total ms':>10} {'avg ms':>8} "
+                 f"{'p95 ms':>8} {'rows':>8}  statement"]
+        for key, item in stats[:top]:
+            flag = "  [SCAN]" if item["full_scan"] else ""
+            lines.append(f"{item['calls']:>8} {item['total_ms']:>10.2f} "
+                         f"{item['avg_ms']:>8.3f} {item['p95_ms']:>8.3f} "
+                         f"{item['rows']:>8}  {key}{flag}")
+            for step in item["plan"] or []:
+                lines.append(" " * 48 + step)
+        return "\n".join(lines)
+
+
+def explain_query_plan(conn: sqlite3.Connection, sql: str,
+                       params: Any = ()) -> Optional[List[str]]:
+    """Return the EXPLAIN QUERY PLAN steps of sql, indented by depth.
+
+    Args:
+        conn (sqlite3.Connection): connection to plan the statement on
+        sql (str): statement to plan
+        params (tuple): parameters bound to the statement's placeholders
+
+    Returns:
+        list[str]: plan details, or None if sql can't be planned
+    """
+    try:
+        rows = conn.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+    except (sqlite3.Error, ValueError):
+        return None
+    depth = {0: -1}
+    steps = []
+    for node, parent, _, detail in rows:
+        depth[node] = depth.get(parent, -1) + 1
+        steps.append("  " * depth[node] + detail)
+    return steps
+
+
+_PROFILER: Optional[QueryProfiler] = None
+
+
+def enable_profiling(plan_threshold: Optional[float] = None
+                     ) -> QueryProfiler:
+    """Record timings of every statement the helpers run.
+
+    Profiling costs one check per statement while disabled. Calling it
+    again replaces the current profiler.
+
+    Args:
+        plan_threshold (float): see QueryProfiler
+
+    Returns:
+        QueryProfiler: the new profiler, to read its statistics
+    """
+    global _PROFILER
+    _PROFILER = QueryProfiler(plan_threshold)
+    return _PROFILER
+
+
+def disable_profiling() -> None:
+    """Stop recording statement timings."""
+    global _PROFILER
+    _PROFILER = None
+
+
+_QUERIES: Dict[str, str] = {}
+_QUERY_NAME = re.compile(r"^--\s*name:\s*(\S+)\s*$", re.MULTILINE)
+
+
+def register_query(name: str, sql: str) -> None:
+    """Register sql under name.
+
+    Referencing queries by name keeps their SQL text identical between
+    calls, which is what lets connections reuse the prepared statement.
+
+    Args:
+        name (str): query name
+        sql (str): SQL statement
+    """
+    _QUERIES[name] = sql.strip()
+
+
+def load_queries(sql_file: str) -> List[str]:
+    """Register every query of a .sql file.
+
+    Each query starts with a `-- name: <query name>` comment line and
+    runs until the next one.
+
+    Args:
+        sql_file (str): path of the .sql file
+
+    Returns:
+        list[str]: names of the registered queries
+    """
+    with open(sql_file, encoding="utf-8") as queries:
+        text = queries.read()
+    parts = _QUERY_NAME.split(text)
+    names = parts[1::2]
+    for name, sql in zip(names, parts[2::2]):
+        register_query(name, sql)
+    return names
+
+
+def get_query(name: str) -> str:
+    """Return the SQL registered under name.
+
+    Raises:
+        KeyError: no query is registered under name.
+    """
+    try:
+        return _QUERIES[name]
+    except KeyError:
+        raise KeyError(f"no query registered as {name!r}") from None
+
+
+_TABLE_NAME = r"((?:[\w$]+|\"[^\"]+\"|`[^`]+`|\[[^\]]+\])" \
+    r"(?:\s*\.\s*(?:[\w$]+|\"[^\"]+\"|`[^`]+`|\[[^\]]+\]))?)"
+_WRITE_TABLES = re.compile(
+    r"\b(?:(?:INSERT|REPLACE)(?:\s+OR\s+\w+)?\s+INTO|"
+    r"(?<!DO\s)UPDATE(?:\s+OR\s+\w+)?|DELETE\s+FROM)\s+" + _TABLE_NAME,
+    re.I)
+
+
+@contextmanager
+def _reading(conn: sqlite3.Connection) -> Iterator[Set[str]]:
+    """Collect the lower-case names of the tables read on conn.
+
+    SQLite's authorizer reports the base tables behind views and every
+    table of a join, whatever way the SQL spells them.
+    """
+    tables: Set[str] = set()
+
+    def authorize(action: int, table: Optional[str], column: Optional[str],
+                  database: Optional[str], source: Optional[str]) -> int:
+        if action == sqlite3.SQLITE_READ and table:
+            tables.add(table.lower())
+        return sqlite3.SQLITE_OK
+    conn.set_authorizer(authorize)
+    try:
+        yield tables
+    finally:
+        conn.set_authorizer(None)
+
+
+def _table_names(pattern: "re.Pattern[str]", sql: str) -> FrozenSet[str]:
+    """Return lower-case table names matched by pattern, schema dropped."""
+    names = set()
+    for match in pattern.finditer(sql):
+        name = match.group(1).rsplit(".", 1)[-1].strip()
+        names.add(name.strip("\"`[]").lower())
+    return frozenset(names)
+
+
+def _sizeof(value: Any) -> int:
+    """Approximate memory held by a result (list of rows or one row)."""
+    size = sys.getsizeof(value)
+    if isinstance(value, (list, tuple)):
+        for item in value:
+            size += _sizeof(item) if isinstance(item, tuple) \
+                else sys.getsizeof(item)
+    return size
+
+
+class _CacheEntry:
+    """Cached result with its size, tables and expiry time."""
+
+    __slots__ = ("value", "size", "tables", "expires")
+
+    def __init__(self, value: Any, size: int, tables: FrozenSet[str],
+                 expires: float) -> None:
+        self.value = value
+        self.size = size
+        self.tables = tables
+        self.expires = expires
+
+
+class ResultCache:
+    """LRU cache of SELECT results keyed by (database, SQL, parameters).
+
+    Entries expire after ttl seconds and the least recently used ones are
+    evicted to stay under max_entries and max_bytes. Entries are dropped
+    when a helper writes to a table they read from. With
+    check_data_version the cache also watches PRAGMA data_version, which
+    changes whenever any other connection commits to the file; every
+    entry of that file is then dropped. The helpers check it inside their
+    write transaction and resync it after their own commit, so their
+    writes still invalidate per table; a commit by another process in
+    the instant between a helper's COMMIT and that resync goes unnoticed,
+    which is why the check is opt-in.
+
+    Args:
+        max_bytes (int): approximate memory limit for cached rows.
+        max_entries (int): maximum number of cached results.
+        ttl (float): seconds an entry stays valid, None for no expiry.
+        check_data_version (bool): drop entries on commits by others.
+    """
+
+    def __init__(self, max_bytes: int = 16 * 1024 * 1024,
+                 max_entries: int = 1024, ttl: Optional[float] = None,
+                 check_data_version: bool = False) -> None:
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.check_data_version = check_data_version
+        self.stats = dict.fromkeys(
+            ("hits", "misses", "evictions", "invalidations"), 0)
+        self.bytes = 0
+        self._entries: "OrderedDict[Any, _CacheEntry]" = OrderedDict()
+        self._generations: Dict[str, int] = {}
+        self._watchers: Dict[str, Tuple[sqlite3.Connection, int]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def generation(self, db_key: str) -> int:
+        """Return a counter that changes whenever db_key is invalidated."""
+        with self._lock:
+            self._check_version(db_key)
+            return self._generations.get(db_key, 0)
+
+    def _check_version(self, db_key: str) -> None:
+        if not self.check_data_version or not _poolable(db_key):
+            return
+        watcher = self._watchers.get(db_key)
+        if watcher is None:
+            conn = sqlite3.connect(db_key, check_same_thread=False)
+            version = conn.execute("PRAGMA data_version;").fetchone()[0]
+            self._watchers[db_key] = (conn, version)
+            return
+        version = watcher[0].execute("PRAGMA data_version;").fetchone()[0]
+        if version != watcher[1]:
+            self._watchers[db_key] = (watcher[0], version)
+            self._drop(db_key, None)
+
+    def _resync(self, db_key: str) -> None:
+        """Take the current data_version as seen, after our own commit."""
+        watcher = self._watchers.get(db_key)
+        if watcher is not None:
+            version = watcher[0].execute("PRAGMA data_version;").fetchone()[0]
+            self._watchers[db_key] = (watcher[0], version)
+
+    def check(self, db_key: str) -> None:
+        """Drop the entries of db_key if another connection committed."""
+        with self._lock:
+            self._check_version(db_key)
+
+    def get(self, key: Tuple[Any, ...]) -> Tuple[bool, Any]:
+        """Look up key, whose first item is the database key.
+
+        Returns:
+            tuple: (True, value) on a hit, (False, None) on a miss.
+        """
+        with self._lock:
+            self._check_version(key[0])
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires < time.monotonic():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.stats["misses"] += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return True, entry.value
+
+    def put(self, key: Tuple[Any, ...], tables: FrozenSet[str],
+            value: Any, generation: int) -> None:
+        """Store value unless key's database changed since generation."""
+        size = _sizeof(value)
+        if size > self.max_bytes:
+            return
+        expires = time.monotonic() + self.ttl if self.ttl else float("inf")
+        with self._lock:
+            if self._generations.get(key[0], 0) != generation:
+                return
+            self._remove(key)
+            self._entries[key] = _CacheEntry(value, size, tables, expires)
+            self.bytes += size
+            while (len(self._entries) > self.max_entries
+                   or self.bytes > self.max_bytes):
+                self._remove(next(iter(self._entries)))
+                self.stats["evictions"] += 1
+
+    def _remove(self, key: Any) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry.size
+
+    def _drop(self, db_key: str, tables: Optional[FrozenSet[str]]) -> None:
+        self._generations[db_key] = self._generations.get(db_key, 0) + 1
+        stale = [key for key, entry in self._entries.items()
+                 if key[0] == db_key
+                 and (tables is None or entry.tables & tables)]
+        for key in stale:
+            self._remove(key)
+        self.stats["invalidations"] += len(stale)
+
+    def invalidate(self, db_key: str,
+                   tables: Optional[FrozenSet[str]] = None,
+                   resync: bool = False) -> None:
+        """Drop entries of db_key reading any of tables (None for all).
+
+        resync marks the current data_version as seen: pass it after a
+        commit of this process that check() ran just before.
+        """
+        with self._lock:
+            self._drop(db_key, tables)
+            if resync:
+                self._resync(db_key)
+
+    def close(self) -> None:
+        """Drop every entry and close the data_version watchers."""
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+            for conn, _ in self._watchers.values():
+                conn.close()
+            self._watchers.clear()
+
+
+_RESULT_CACHE: Optional[ResultCache] = None
+
+
+def enable_result_cache(max_bytes: int = 16 * 1024 * 1024,
+                        max_entries: int = 1024,
+                        ttl: Optional[float] = None,
+                        check_data_version: bool = False) -> ResultCache:
+    """Cache select_one_row and select_many_rows results.
+
+    See ResultCache for the arguments and invalidation rules. Calling it
+    again replaces the current cache.
+
+    Returns:
+        ResultCache: the new cache, e.g. to read its stats.
+    """
+    global _RESULT_CACHE
+    disable_result_cache()
+    _RESULT_CACHE = ResultCache(max_bytes, max_entries, ttl,
+                                check_data_version)
+    return _RESULT_CACHE
+
+
+def disable_result_cache() -> None:
+    """Stop caching results and drop the current cache."""
+    global _RESULT_CACHE
+    cache, _RESULT_CACHE = _RESULT_CACHE, None
+    if cache is not None:
+        cache.close()
+
+
+def _cached(db_file: str, sql: str, params: Any,
+            load: Callable[[sqlite3.Connection], Any],
+            rows: str = "tuple") -> Any:
+    """Return load(conn) through the result cache when it is enabled.
+
+    Only immutable rows (tuple and sqlite3.Row) are cached. A cached
+    result is invalidated by writes to the tables SQLite read for it.
+    """
+    cache = _RESULT_CACHE
+    key = None
+    if cache is not None and _active_session(db_file) is None \
+            and rows in ("tuple", "row"):
+        try:
+            # named parameters are keyed by their items, not the names
+            bound = tuple(sorted(params.items())) \
+                if isinstance(params, Mapping) else tuple(params)
+            key = (_resource_key(db_file), sql, bound, rows)
+            hash(key)
+        except TypeError:
+            key = None
+    if cache is None or key is None:
+        with _connection(db_file) as conn:
+            return load(conn)
+    found, value = cache.get(key)
+    if not found:
+        generation = cache.generation(key[0])
+        with _connection(db_file) as conn, _reading(conn) as tables:
+            value = load(conn)
+        cache.put(key, frozenset(tables), value, generation)
+    return value
+
+
+def invalidate_results(db_file: str, sql: Optional[str] = None) -> None:
+    """Drop cached results of the tables written by sql.
+
+    The helpers call this themselves; call it after writing to db_file
+    through a connection of your own. Statements that don't name a
+    written table (DDL, PRAGMA, scripts) and sql=None drop every cached
+    result of db_file.
+
+    Args:
+        db_file (str): database file path
+        sql (str): the write statement that was executed
+    """
+    cache = _RESULT_CACHE
+    if cache is not None:
+        cache.invalidate(_resource_key(db_file), _written_tables([sql]))
+
+
+def _written_tables(sqls: Iterable[Optional[str]]
+                    ) -> Optional[FrozenSet[str]]:
+    """Tables written by sqls, None if one of them names no table."""
+    tables: FrozenSet[str] = frozenset()
+    for sql in sqls:
+        names = _table_names(_WRITE_TABLES, sql) if sql else frozenset()
+        if not names:
+            return None
+        tables |= names
+    return tables
+
+
+def _check_external_writes(db_file: str) -> None:
+    """Before a helper commits: drop results changed by other writers."""
+    cache = _RESULT_CACHE
+    if cache is not None:
+        cache.check(_resource_key(db_file))
+
+
+def _invalidate_own_writes(db_file: str, sqls: List[str]) -> None:
+    """After a helper committed sqls: invalidate their tables only."""
+    cache = _RESULT_CACHE
+    if cache is not None and sqls:
+        cache.invalidate(_resource_key(db_file), _written_tables(sqls),
+                         resync=True)
+
+
+class RetryPolicy:
+    """How write helpers retry when the database is locked or busy.
+
+    Delays grow exponentially from base_delay up to max_delay, with a
+    random jitter of up to jitter * delay so that competing writers don't
+    retry in lockstep. Retrying stops after max_attempts attempts or once
+    max_wait seconds have been spent, and the last error is raised.
+
+    With begin_immediate the helpers start their transaction with BEGIN
+    IMMEDIATE, which takes the write lock before any statement runs: lock
+    conflicts surface (and are retried) up front instead of failing a
+    transaction halfway through, when its read lock can't be upgraded.
+
+    While an attempt runs, the connection's busy timeout is lowered to
+    busy_timeout, so that a locked database fails the attempt quickly
+    and the backoff above does the waiting instead of SQLite's busy
+    handler (5 seconds by default).
+
+    Args:
+        max_attempts (int): attempts including the first one.
+        base_delay (float): seconds to wait before the first retry.
+        max_delay (float): upper bound of a single delay.
+        max_wait (float): total seconds to spend retrying.
+        jitter (float): fraction of the delay randomised, 0 to 1.
+        begin_immediate (bool): take the write lock at transaction start.
+        busy_timeout (float): seconds SQLite waits for a lock within one
+            attempt, defaults to base_delay.
+    """
+
+    def __init__(self, max_attempts: int = 10, base_delay: float = 0.005,
+                 max_delay: float = 0.5, max_wait: float = 10.0,
+                 jitter: float = 0.5, begin_immediate: bool = True,
+                 busy_timeout: Optional[float] = None) -> None:
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_wait = max_wait
+        self.jitter = jitter
+        self.begin_immediate = begin_immediate
+        self.busy_timeout = base_delay if busy_timeout is None \
+            else busy_timeout
+
+    def delay(self, retry: int) -> float:
+        """Return the seconds to sleep before retry number retry (1-based)."""
+        delay = min(self.max_delay, self.base_delay * 2.0 ** (retry - 1))
+        return delay * (1 - self.jitter * random.random())
+
 
+_RETRY_POLICY: Optional[RetryPolicy] = RetryPolicy()
+_RETRY_KINDS = ("retries", "failures", "lock_wait")
+_RETRY_STATS: Dict[str, Dict[str, float]] = {}
+_RETRY_LOCK = threading.Lock()
 
-def create_connection(db_file: str) -> sqlite3.Connection:
-    """Create sqlite3 connection and return it.
+
+def set_retry_policy(policy: Optional[RetryPolicy]) -> None:
+    """Replace the retry policy of the write helpers.
 
     Args:
-        db_file (str): sqlite filename to open or create.
+        policy (RetryPolicy): new policy, None to raise lock errors at once
+    """
+    global _RETRY_POLICY
+    _RETRY_POLICY = policy
 
-    Raises:
-        err: sqlite3.Error as an exception.
+
+def retry_stats(db_file: Optional[str] = None) -> Dict[str, float]:
+    """Return retry counters of the write helpers.
+
+    Args:
+        db_file (str): database file path, or None for every file.
 
     Returns:
-        sqlite3.Connection: sqlite3 connection object.
+        dict: retries, failures (gave up) and lock_wait (seconds spent
+        in failed attempts and backoff sleeps)
     """
+    with _RETRY_LOCK:
+        if db_file is not None:
+            stats = [_RETRY_STATS.get(_resource_key(db_file), {})]
+        else:
+            stats = list(_RETRY_STATS.values())
+        return {kind: sum(item.get(kind, 0) for item in stats)
+                for kind in _RETRY_KINDS}
+
+
+def reset_retry_stats() -> None:
+    """Reset the counters reported by retry_stats."""
+    with _RETRY_LOCK:
+        _RETRY_STATS.clear()
+
+
+def _count_retry(db_file: str, kind: str, waited: float) -> None:
+    with _RETRY_LOCK:
+        stats = _RETRY_STATS.setdefault(_resource_key(db_file),
+                                        dict.fromkeys(_RETRY_KINDS, 0))
+        stats[kind] += 1
+        stats["lock_wait"] += waited
 
+
+def _is_busy(err: sqlite3.OperationalError) -> bool:
+    """True for SQLITE_BUSY / SQLITE_LOCKED errors."""
+    code = getattr(err, "sqlite_errorcode", None)
+    if code is not None:
+        return code & 0xFF in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
+    return "locked" in str(err) or "busy" in str(err)
+
+
+def _with_retry(db_file: str, attempt: Callable[[], T]) -> T:
+    """Call attempt() until it succeeds or the retry policy gives up."""
+    policy = _RETRY_POLICY
+    if policy is None:
+        return attempt()
+    start = time.monotonic()
+    retry = 0
+    while True:
+        attempt_start = time.monotonic()
+        try:
+            return attempt()
+        except sqlite3.OperationalError as err:
+            if not _is_busy(err):
+                raise
+            retry += 1
+            delay = policy.delay(retry)
+            now = time.monotonic()
+            if retry >= policy.max_attempts \
+                    or now - start + delay > policy.max_wait:
+                _count_retry(db_file, "failures", now - attempt_start)
+                raise
+            _count_retry(db_file, "retries", now - attempt_start + delay)
+            time.sleep(delay)
+
+
+@contextmanager
+def _retry_busy_timeout(conn: sqlite3.Connection) -> Iterator[None]:
+    """Lower the busy timeout of conn to the retry policy's while the
+    block runs; see RetryPolicy."""
+    policy = _RETRY_POLICY
+    if policy is None:
+        yield
+        return
+    previous = conn.execute("PRAGMA busy_timeout;").fetchone()[0]
+    conn.execute(
+        f"PRAGMA busy_timeout = {int(policy.busy_timeout * 1000)};")
     try:
-        conn = sqlite3.connect(db_file)
-        return conn
-    except Error as err:
-        raise err
+        yield
+    finally:
+        conn.execute(f"PRAGMA busy_timeout = {int(previous)};")
 
 
-def close_connection(conn: sqlite3.Connection) -> None:
-    """Close a database connection to a SQLite database.
+def _write(db_file: str, sql: str, work: Callable[[sqlite3.Connection], T],
+           immediate: bool = True) -> T:
+    """Run work(conn) in one committed transaction on a pooled connection.
+
+    Lock errors are retried according to the retry policy and cached
+    results of the tables written by sql are invalidated afterwards.
+    Inside transaction() the work joins the open transaction instead.
+    """
+    session = _active_session(db_file)
+    if session is not None:
+        session.written.append(sql)
+        return work(session.conn)
+
+    def attempt() -> T:
+        # the timeout is restored before the COMMIT, which may wait for
+        # readers to finish
+        with pooled_connection(db_file) as conn, _retry_busy_timeout(conn):
+            policy = _RETRY_POLICY
+            if immediate and policy is not None and policy.begin_immediate:
+                _execute(conn, "BEGIN IMMEDIATE;")
+            _check_external_writes(db_file)
+            return work(conn)
+    result = _with_retry(db_file, attempt)
+    _invalidate_own_writes(db_file, [sql])
+    return result
+
+
+class Session:
+    """Helper operations sharing one connection and one transaction.
+
+    Created by transaction(); the methods mirror the module helpers
+    without the db_file argument.
+
     Args:
-      conn (Connection): Connection object
+        db_file (str): database file path
+        conn (Connection): connection with an open transaction
     """
-    if conn:
-        conn.close()
+
+    def __init__(self, db_file: str, conn: sqlite3.Connection) -> None:
+        self.db_file = db_file
+        self.conn = conn
+        self.written: List[str] = []
+        self._savepoints = 0
+
+    def insert_one_row(self, insert_row_sql: str,
+                       row: Tuple[Any, ...]) -> Optional[int]:
+        """See insert_one_row."""
+        self.written.append(insert_row_sql)
+        with _statement(self.conn, insert_row_sql, row) as cursor:
+            return cursor.lastrowid
+
+    def insert_many_rows(self, insert_rows_sql: str,
+                         rows: List[Any]) -> Optional[int]:
+        """See insert_many_rows."""
+        self.written.append(insert_rows_sql)
+        with _statement(self.conn, insert_rows_sql, rows,
+                        many=True) as cursor:
+            return cursor.lastrowid
+
+    def select_one_row(self, select_row_sql: str,
+                       where: Tuple[Any, ...], rows: str = "tuple") -> Any:
+        """See select_one_row; sees this transaction's own writes."""
+        _check_row_factory(rows)
+        with _statement(self.conn, select_row_sql, where,
+                        rows=rows) as cursor:
+            return cursor.fetchone()
+
+    def select_many_rows(self, select_rows_sql: str,
+                         where: Tuple[Any, ...], rows: str = "tuple") -> Any:
+        """See select_many_rows; sees this transaction's own writes."""
+        _check_row_factory(rows)
+        with _statement(self.conn, select_rows_sql, where,
+                        rows=rows) as cursor:
+            return cursor.fetchall()
+
+    def update_record(self, update_sql: str,
+                      where: Tuple[Any, ...]) -> int:
+        """See update_record."""
+        self.written.append(update_sql)
+        with _statement(self.conn, update_sql, where) as cursor:
+            return cursor.rowcount
+
+    def delete_record(self, delete_sql: str, where: Tuple[Any, ...]) -> int:
+        """See delete_record."""
+        self.written.append(delete_sql)
+        with _statement(self.conn, delete_sql, where) as cursor:
+            return cursor.rowcount
+
+    def execute_non_query(self, sql: str) -> None:
+        """See execute_non_query."""
+        self.written.append(sql)
+        _execute(self.conn, sql)
+
+    @contextmanager
+    def savepoint(self) -> Iterator["Session"]:
+        """Nest a SAVEPOINT that is rolled back if the block raises.
+
+        The enclosing transaction continues either way.
+
+        Yields:
+            Session: this session
+        """
+        self._savepoints += 1
+        name = f"sp_{self._savepoints}"
+        _execute(self.conn, f"SAVEPOINT {name};")
+        try:
+            yield self
+        except BaseException:
+            _execute(self.conn, f"ROLLBACK TO {name};")
+            raise
+        finally:
+            _execute(self.conn, f"RELEASE {name};")
+            self._savepoints -= 1
+
+
+_SESSIONS = threading.local()
+
+
+def _active_session(db_file: str) -> Optional[Session]:
+    """Return the transaction() session of this thread for db_file."""
+    sessions: Optional[Dict[str, Session]] = getattr(_SESSIONS, "by_file",
+                                                     None)
+    if not sessions:
+        return None
+    return sessions.get(_resource_key(db_file))
+
+
+@contextmanager
+def _connection(db_file: str) -> Iterator[sqlite3.Connection]:
+    """Yield the active session's connection or a pooled connection."""
+    session = _active_session(db_file)
+    if session is not None:
+        yield session.conn
+        return
+    with pooled_connection(db_file) as conn:
+        yield conn
+
+
+@contextmanager
+def transaction(db_file: str) -> Iterator[Session]:
+    """Run several operations in one transaction on one connection.
+
+    The transaction starts with BEGIN IMMEDIATE and is committed once when
+    the block succeeds, so N writes cost one fsync instead of N, or rolled
+    back when it raises. Inside the block the module helpers called from
+    the same thread for the same db_file join the transaction, and a
+    nested transaction(db_file) becomes a savepoint.
+
+    Example:
+        with db.transaction("bank.db") as tx:
+            tx.update_record(debit_sql, (amount, checking_id))
+            tx.update_record(credit_sql, (amount, savings_id))
+
+    Args:
+        db_file (str): database file path
+
+    Raises:
+        err: sqlite3.Error as an exception.
+
+    Yields:
+        Session: operations bound to the transaction
+    """
+    session = _active_session(db_file)
+    if session is not None:
+        with session.savepoint():
+            yield session
+        return
+    key = _resource_key(db_file)
+    with pooled_connection(db_file) as conn:
+        with _retry_busy_timeout(conn):
+            _with_retry(db_file,
+                        lambda: _execute(conn, "BEGIN IMMEDIATE;"))
+        _check_external_writes(db_file)
+        session = Session(db_file, conn)
+        if getattr(_SESSIONS, "by_file", None) is None:
+            _SESSIONS.by_file = {}
+        _SESSIONS.by_file[key] = session
+        try:
+            yield session
+        finally:
+            del _SESSIONS.by_file[key]
+        _with_retry(db_file, conn.commit)
+    _invalidate_own_writes(db_file, session.written)
 
 
 def create_table(db_file: str, create_table_sql: str) -> None:
@@ -58,18 +2189,8 @@ def create_table(db_file: str, create_table_sql: str) -> None:
     Return:
         None
     """
-    conn = create_connection(db_file)
-    # with conn:
-    try:
-        cursor = conn.cursor()
-        cursor.execute(create_table_sql)
-        conn.commit()
-    except Error as err:
-        raise err
-    # Successful, conn.commit() is called automatically afterwards
-    finally:
-        # close most be called explictly
-        close_connection(conn)
+    _write(db_file, create_table_sql,
+           lambda conn: _execute(conn, create_table_sql))
 
 
 def insert_one_row(db_file: str, insert_row_sql: str,
@@ -86,19 +2207,10 @@ def insert_one_row(db_file: str, insert_row_sql: str,
     Return:
         row_id (int): row id of the last inserted row
     """
-    conn = create_connection(db_file)
-
-    try:
-        cursor = conn.cursor()
-        cursor.execute(insert_row_sql, row)
-        conn.commit()
-        return cursor.lastrowid
-    except Error as err:
-        raise err
-    # Successful, conn.commit() is called automatically afterwards
-    finally:
-        # close most be called explictly
-        close_connection(conn)
+    def work(conn: sqlite3.Connection) -> Optional[int]:
+        with _statement(conn, insert_row_sql, row) as cursor:
+            return cursor.lastrowid
+    return _write(db_file, insert_row_sql, work)
 
 
 def insert_many_rows(db_file: str, insert_rows_sql: str,
@@ -115,67 +2227,374 @@ def insert_many_rows(db_file: str, insert_rows_sql: str,
     Return:
         row_id (int): row id of the last inserted row
     """
-    conn = create_connection(db_file)
-    try:
-        cursor = conn.cursor()
-        cursor.executemany(insert_rows_sql, rows)
-        conn.commit()
-        return cursor.lastrowid
-    except Error as err:
-        raise err
-    # Successful, conn.commit() is called automatically afterwards
-    finally:
-        # close most be called explictly
-        close_connection(conn)
+    def work(conn: sqlite3.Connection) -> Optional[int]:
+        with _statement(conn, insert_rows_sql, rows, many=True) as cursor:
+            return cursor.lastrowid
+    return _write(db_file, insert_rows_sql, work)
 
 
 def select_one_row(db_file: str, select_row_sql: str,
-                   where: Tuple[Any, ...]) -> Any:
+                   where: Params, rows: str = "tuple") -> Any:
     """API to select one row from a table from the select_data_sql statement.
 
     Args:
         db_file (str): database file path
         select_row_sql (str): a SELECT statement
-        where (tuple[str]): where clause as tuple for ? placeholder
+        where (tuple[str]): where clause as tuple for ? placeholder,
+            or dict for :name placeholders
+        rows (str): row type, one of ROW_FACTORIES: "tuple",
+            "row" (sqlite3.Row), "slots" (see row_class) or "dict"
 
     Raises:
+        ValueError: rows is not one of ROW_FACTORIES.
         err: sqlite3.Error as an exception.
 
     Returns:
-        tuple[str]: row as tuple or None
+        tuple[str]: row as tuple (or the type selected by rows) or None
     """
-    conn = create_connection(db_file)
-    with conn:
-        try:
-            cursor = conn.cursor()
-            cursor.execute(select_row_sql, where)
+    _check_row_factory(rows)
+
+    def load(conn: sqlite3.Connection) -> Any:
+        with _statement(conn, select_row_sql, where, rows=rows) as cursor:
             return cursor.fetchone()
-        except Error as err:
-            raise err
+    return _cached(db_file, select_row_sql, where, load, rows)
 
 
 def select_many_rows(db_file: str, select_rows_sql: str,
-                     where: Tuple[Any, ...]) -> Any:
+                     where: Params, rows: str = "tuple") -> Any:
     """Select all rows from a table from the select_data_sql statement
     Args:
       db_file (str): database file path
       select_data_sql (str): an SELECT statement
-      where (tuple): where clause as tuple for ? placeholder
+      where (tuple): where clause as tuple for ? placeholder, or dict
+        for :name placeholders
+      rows (str): row type, one of ROW_FACTORIES, see select_one_row
 
     Raises:
+        ValueError: rows is not one of ROW_FACTORIES.
         err: sqlite3.Error as an exception.
 
     Return:
       rows (Any): list of tuples as rows or None
     """
-    conn = create_connection(db_file)
-    with conn:
-        try:
-            cursor = conn.cursor()
-            cursor.execute(select_rows_sql, where)
+    _check_row_factory(rows)
+
+    def load(conn: sqlite3.Connection) -> Any:
+        with _statement(conn, select_rows_sql, where, rows=rows) as cursor:
             return cursor.fetchall()
-        except Error as err:
-            raise err
+    # copy so callers can't modify a cached list
+    return list(_cached(db_file, select_rows_sql, where, load, rows))
+
+
+def stream_rows(db_file: str, select_rows_sql: str,
+                where: Tuple[Any, ...], batch_size: int = 1000,
+                rows: str = "tuple") -> Generator[List[Any], None, None]:
+    """Yield the rows of a SELECT statement in batches of batch_size.
+
+    Unlike select_many_rows only one batch is held in memory at a time.
+    The connection stays checked out until the generator is exhausted or
+    closed; wrap it in contextlib.closing() when breaking out early on
+    interpreters without reference counting.
+
+    Args:
+        db_file (str): database file path
+        select_rows_sql (str): a SELECT statement
+        where (tuple): where clause as tuple for ? placeholder
+        batch_size (int): number of rows fetched per batch
+        rows (str): row type, one of ROW_FACTORIES, see select_one_row
+
+    Raises:
+        ValueError: rows is not one of ROW_FACTORIES.
+        err: sqlite3.Error as an exception.
+
+    Yields:
+        list[tuple]: next batch of at most batch_size rows
+    """
+    _check_row_factory(rows)
+    with _connection(db_file) as conn:
+        with _statement(conn, select_rows_sql, where,
+                        rows=rows) as cursor:
+            batch = cursor.fetchmany(batch_size)
+            while batch:
+                yield batch
+                batch = cursor.fetchmany(batch_size)
+
+
+def iter_rows(db_file: str, select_rows_sql: str,
+              where: Tuple[Any, ...], batch_size: int = 1000,
+              rows: str = "tuple") -> Generator[Any, None, None]:
+    """Yield the rows of a SELECT statement one at a time.
+
+    Rows are fetched from sqlite in batches of batch_size; see stream_rows.
+
+    Args:
+        db_file (str): database file path
+        select_rows_sql (str): a SELECT statement
+        where (tuple): where clause as tuple for ? placeholder
+        batch_size (int): number of rows fetched per batch
+        rows (str): row type, one of ROW_FACTORIES, see select_one_row
+
+    Raises:
+        ValueError: rows is not one of ROW_FACTORIES.
+        err: sqlite3.Error as an exception.
+
+    Yields:
+        tuple: next row
+    """
+    with closing(stream_rows(db_file, select_rows_sql, where,
+                             batch_size, rows)) as batches:
+        for batch in batches:
+            yield from batch
+
+
+_EXACT_FLOAT = 2 ** 53
+
+
+def _exact_float(value: Any) -> bool:
+    """Tell whether value can be stored in a float array unchanged."""
+    if isinstance(value, int):
+        return -_EXACT_FLOAT <= value <= _EXACT_FLOAT
+    return value is None or isinstance(value, float)
+
+
+class Column:
+    """Values of one result column stored column-wise.
+
+    Integer columns are kept in an array.array("q"), REAL columns (or
+    integer columns that turn out to hold floats, as long as their
+    integers are exact as floats) in array.array("d"), anything else in
+    a list. mask[i] is 1 where the value is NULL; NULLs are stored as 0
+    in arrays and None in lists. When a float column turns into a list,
+    the values that were ints become ints again.
+
+    Args:
+        name (str): result column name
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.values: Any = array.array("q")
+        self.mask = bytearray()
+        # ints[i] is 1 where a float array holds an int
+        self.ints = bytearray()
+
+    def __len__(self) -> int:
+        return len(self.mask)
+
+    @property
+    def has_nulls(self) -> bool:
+        """Tell whether any value is NULL."""
+        return 1 in self.mask
+
+    def extend(self, values: Tuple[Any, ...]) -> None:
+        """Append a batch of values of this column."""
+        nulls = None in values
+        if nulls:
+            self.mask.extend(value is None for value in values)
+        else:
+            self.mask.extend(bytes(len(values)))
+        while not self._append(values, nulls):
+            self._widen(values)
+
+    def _append(self, values: Tuple[Any, ...], nulls: bool) -> bool:
+        """Append values unchanged; False if the storage can't hold them."""
+        if isinstance(self.values, list):
+            self.values.extend(values)
+            return True
+        floats = self.values.typecode == "d"
+        # array("d") takes any int, rounding those beyond 2**53
+        ints = floats and int in map(type, values)
+        if ints and not all(_exact_float(value) for value in values):
+            return False
+        size = len(self.values)
+        try:
+            self.values.extend(tuple(0 if value is None else value
+                                     for value in values)
+                               if nulls else values)
+        except (TypeError, OverflowError):
+            # extend() keeps the values appended before the failure
+            del self.values[size:]
+            return False
+        if floats:
+            self.ints.extend([type(value) is int for value in values]
+                             if ints else bytes(len(values)))
+        return True
+
+    def _widen(self, values: Tuple[Any, ...]) -> None:
+        """Switch from int to float array if values are numbers and every
+        int is exact as a float, otherwise to a list of the values."""
+        if self.values.typecode == "q" \
+                and -_EXACT_FLOAT <= min(self.values, default=0) \
+                and max(self.values, default=0) <= _EXACT_FLOAT \
+                and all(_exact_float(value) for value in values):
+            self.ints = bytearray(b"\1") * len(self.values)
+            self.values = array.array("d", self.values)
+            return
+        ints = self.ints if self.values.typecode == "d" \
+            else bytes(len(self.values))
+        self.values = [None if null else int(value) if is_int else value
+                       for value, null, is_int
+                       in zip(self.values, self.mask, ints)]
+        self.ints = bytearray()
+
+    def to_numpy(self) -> Any:
+        """Return the column as a numpy masked array.
+
+        Numeric columns share the array's buffer instead of copying it.
+
+        Raises:
+            ImportError: numpy is not installed.
+        """
+        numpy = importlib.import_module("numpy")
+        if isinstance(self.values, array.array):
+            dtype = "int64" if self.values.typecode == "q" else "float64"
+            data = numpy.frombuffer(self.values, dtype=dtype)
+        else:
+            data = numpy.array(self.values, dtype=object)
+        mask = numpy.frombuffer(self.mask, dtype=bool) \
+            if self.has_nulls else False
+        return numpy.ma.MaskedArray(data, mask=mask)
+
+
+def select_columns(db_file: str, select_rows_sql: str,
+                   where: Tuple[Any, ...],
+                   batch_size: int = 10000) -> Dict[str, Column]:
+    """Select rows and return them column-wise.
+
+    Rows are fetched batch_size at a time and appended to one Column per
+    result column, so numbers end up in typed arrays instead of millions
+    of tuples and int/float objects; only one batch of rows exists at a
+    time. Use Column.to_numpy() for vectorised computation.
+
+    Args:
+        db_file (str): database file path
+        select_rows_sql (str): a SELECT statement
+        where (tuple): where clause as tuple for ? placeholder
+        batch_size (int): number of rows fetched per batch
+
+    Raises:
+        err: sqlite3.Error as an exception.
+
+    Returns:
+        dict[str, Column]: columns keyed by result column name
+    """
+    with _connection(db_file) as conn:
+        with _statement(conn, select_rows_sql, where) as cursor:
+            columns = [Column(item[0]) for item in cursor.description]
+            rows = cursor.fetchmany(batch_size)
+            while rows:
+                for column, values in zip(columns, zip(*rows)):
+                    column.extend(values)
+                rows = cursor.fetchmany(batch_size)
+    return {column.name: column for column in columns}
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _page_sql(source: str, order_by: List[str], descending: bool,
+              after: bool) -> str:
+    """Build the keyset query over source, a table name or a SELECT."""
+    if source.isidentifier():
+        source = f"SELECT * FROM {_quote(source)}"
+    keys = ", ".join(_quote(key) for key in order_by)
+    direction = " DESC" if descending else ""
+    order = ", ".join(_quote(key) + direction for key in order_by)
+    sql = f"SELECT * FROM ({source.strip().rstrip(';')})"
+    if after:
+        marks = ", ".join("?" for _ in order_by)
+        sql += f" WHERE ({keys}) {'<' if descending else '>'} ({marks})"
+    return f"{sql} ORDER BY {order} LIMIT ?;"
+
+
+def _page_check(sql: str) -> str:
+    return hashlib.sha1(sql.encode("utf-8")).hexdigest()[:12]
+
+
+def _decode_token(token: str, check: str) -> List[Any]:
+    """Return the key values stored in a page token."""
+    try:
+        data = json.loads(base64.urlsafe_b64decode(token.encode("ascii")))
+        values, token_check = data["after"], data["query"]
+    except (ValueError, TypeError, KeyError) as err:
+        raise ValueError("malformed page token") from err
+    if token_check != check:
+        raise ValueError("page token belongs to a different query")
+    return list(values)
+
+
+def select_page(db_file: str, source: str, order_by: List[str],
+                page_size: int = 100, token: Optional[str] = None,
+                where: Tuple[Any, ...] = (),
+                descending: bool = False) -> Tuple[List[Any], Optional[str]]:
+    """Select one page of rows with keyset (seek) pagination.
+
+    Instead of OFFSET, which reads and discards every row before the
+    page, the next page starts with WHERE (keys) > (last keys), so with
+    an index on the order_by columns every page costs the same.
+
+    The order_by columns must appear in the result, be NOT NULL and
+    together identify a row (end with the primary key, e.g.
+    ["Milliseconds", "TrackId"]), otherwise rows with equal keys may be
+    skipped at page boundaries.
+
+    Args:
+        db_file (str): database file path
+        source (str): a table name or a SELECT statement
+        order_by (list[str]): result columns the pages are ordered by
+        page_size (int): maximum rows per page
+        token (str): next_token of the previous page, None for the first
+        where (tuple): parameters for ? placeholders in source
+        descending (bool): order every key column descending
+
+    Raises:
+        ValueError: token is malformed or from another source/ordering.
+        err: sqlite3.Error as an exception.
+
+    Returns:
+        tuple: (rows, next_token), next_token is None on the last page
+    """
+    check = _page_check(_page_sql(source, order_by, descending, True))
+    after = _decode_token(token, check) if token is not None else []
+    sql = _page_sql(source, order_by, descending, token is not None)
+    params = (*where, *after, page_size + 1)
+
+    def load(conn: sqlite3.Connection) -> Tuple[List[Any], Optional[str]]:
+        with _statement(conn, sql, params) as cursor:
+            rows = cursor.fetchall()
+            names = [column[0].lower() for column in cursor.description]
+        if len(rows) <= page_size:
+            return rows, None
+        rows = rows[:page_size]
+        last = [rows[-1][names.index(key.lower())] for key in order_by]
+        data = json.dumps({"after": last, "query": check})
+        return rows, base64.urlsafe_b64encode(
+            data.encode("utf-8")).decode("ascii")
+    rows, next_token = _cached(db_file, sql, params, load)
+    return list(rows), next_token
+
+
+def iter_pages(db_file: str, source: str, order_by: List[str],
+               page_size: int = 100, where: Tuple[Any, ...] = (),
+               descending: bool = False
+               ) -> Generator[List[Any], None, None]:
+    """Yield every page of select_page in order.
+
+    Each page is a separate query, so no connection is held between
+    pages and rows committed meanwhile past the current page show up.
+
+    Yields:
+        list[tuple]: next page of at most page_size rows
+    """
+    token: Optional[str] = None
+    while True:
+        rows, token = select_page(db_file, source, order_by, page_size,
+                                  token, where, descending)
+        if rows:
+            yield rows
+        if token is None:
+            return
 
 
 def update_record(db_file: str, update_sql: str,
@@ -192,14 +2611,10 @@ def update_record(db_file: str, update_sql: str,
     Return:
       rows_affected (int): number of rows affected
     """
-    conn = create_connection(db_file)
-    with conn:
-        try:
-            cursor = conn.cursor()
-            cursor.execute(update_sql, where)
+    def work(conn: sqlite3.Connection) -> int:
+        with _statement(conn, update_sql, where) as cursor:
             return cursor.rowcount
-        except Error as err:
-            raise err
+    return _write(db_file, update_sql, work)
 
 
 def delete_record(db_file: str, delete_sql: str, where: Tuple[Any]) -> int:
@@ -215,14 +2630,227 @@ def delete_record(db_file: str, delete_sql: str, where: Tuple[Any]) -> int:
     Return:
       rows_affected (int): number of rows affected
     """
-    conn = create_connection(db_file)
-    with conn:
-        try:
-            cursor = conn.cursor()
-            cursor.execute(delete_sql, where)
+    def work(conn: sqlite3.Connection) -> int:
+        with _statement(conn, delete_sql, where) as cursor:
             return cursor.rowcount
-        except Error as err:
-            raise err
+    return _write(db_file, delete_sql, work)
+
+
+def _chunked(rows: Iterable[Any], chunk_size: int) -> List[List[Any]]:
+    """Split rows into lists of at most chunk_size items.
+
+    The chunks are kept so that a transaction retried after a lock error
+    can run them again.
+    """
+    rows = iter(rows)
+    chunks = []
+    chunk = list(islice(rows, chunk_size))
+    while chunk:
+        chunks.append(chunk)
+        chunk = list(islice(rows, chunk_size))
+    return chunks
+
+
+def _execute_chunks(db_file: str, sql: str, rows: Iterable[Any],
+                    chunk_size: int) -> int:
+    """executemany() sql over rows in chunks in one transaction."""
+    chunks = _chunked(rows, chunk_size)
+
+    def work(conn: sqlite3.Connection) -> int:
+        total = 0
+        for chunk in chunks:
+            with _statement(conn, sql, chunk, many=True) as cursor:
+                total += max(cursor.rowcount, 0)
+        return total
+    return _write(db_file, sql, work)
+
+
+def update_many(db_file: str, update_sql: str, rows: Iterable[Any],
+                chunk_size: int = 1000) -> int:
+    """Run an UPDATE statement once per parameter tuple.
+
+    All rows are applied in one transaction with executemany() in chunks
+    of chunk_size, instead of one connection and commit per row as with
+    update_record.
+
+    Args:
+        db_file (str): database file path
+        update_sql (str): an UPDATE statement with ? placeholders
+        rows (iterable[tuple]): parameter tuples
+        chunk_size (int): parameter tuples per executemany() call
+
+    Raises:
+        err: sqlite3.Error as an exception; nothing is updated.
+
+    Return:
+        rows_affected (int): total number of rows updated
+    """
+    return _execute_chunks(db_file, update_sql, rows, chunk_size)
+
+
+def delete_many(db_file: str, delete_sql: str, rows: Iterable[Any],
+                chunk_size: int = 1000) -> int:
+    """Run a DELETE statement once per parameter tuple.
+
+    See update_many.
+
+    Return:
+        rows_affected (int): total number of rows deleted
+    """
+    return _execute_chunks(db_file, delete_sql, rows, chunk_size)
+
+
+_STAGE = "temp._staged_rows"
+
+
+def _stage(conn: sqlite3.Connection, columns: List[str],
+           chunks: List[List[Any]]) -> None:
+    """Load chunks into a fresh temporary table of the given columns."""
+    names = ", ".join(_quote(column) for column in columns)
+    marks = ", ".join("?" for _ in columns)
+    _execute(conn, f"DROP TABLE IF EXISTS {_STAGE};")
+    _execute(conn, f"CREATE TABLE {_STAGE} ({names});")
+    for chunk in chunks:
+        _execute(conn, f"INSERT INTO {_STAGE} VALUES ({marks});", chunk,
+                 many=True)
+
+
+def _staged_write(db_file: str, sql: str, columns: List[str],
+                  rows: Iterable[Any], chunk_size: int) -> int:
+    """Stage rows into a temporary table, then run sql against it."""
+    chunks = _chunked(rows, chunk_size)
+
+    def work(conn: sqlite3.Connection) -> int:
+        _stage(conn, columns, chunks)
+        try:
+            with _statement(conn, sql) as cursor:
+                return cursor.rowcount
+        finally:
+            _execute(conn, f"DROP TABLE IF EXISTS {_STAGE};")
+    return _write(db_file, sql, work)
+
+
+def update_many_staged(db_file: str, table: str, key_columns: List[str],
+                       set_columns: List[str], rows: Iterable[Any],
+                       chunk_size: int = 1000) -> int:
+    """Update many rows with one set-based UPDATE ... FROM.
+
+    The rows (key values followed by the new values) are first inserted
+    into a temporary table, then a single UPDATE joins it on the key
+    columns, so SQLite runs one statement instead of one per row.
+
+    Args:
+        db_file (str): database file path
+        table (str): table to update
+        key_columns (list[str]): columns identifying a row
+        set_columns (list[str]): columns to set
+        rows (iterable[tuple]): key values followed by set_columns values
+        chunk_size (int): rows per executemany() into the staging table
+
+    Raises:
+        err: sqlite3.Error as an exception; nothing is updated.
+
+    Return:
+        rows_affected (int): total number of rows updated
+    """
+    assignments = ", ".join(f"{_quote(c)} = s.{_quote(c)}"
+                            for c in set_columns)
+    join = " AND ".join(f"{_quote(table)}.{_quote(c)} = s.{_quote(c)}"
+                        for c in key_columns)
+    sql = (f"UPDATE {_quote(table)} SET {assignments} "
+           f"FROM {_STAGE} AS s WHERE {join};")
+    return _staged_write(db_file, sql, key_columns + set_columns, rows,
+                         chunk_size)
+
+
+def delete_many_staged(db_file: str, table: str, key_columns: List[str],
+                       keys: Iterable[Any], chunk_size: int = 1000) -> int:
+    """Delete many rows with one DELETE ... WHERE key IN (SELECT ...).
+
+    See update_many_staged.
+
+    Args:
+        db_file (str): database file path
+        table (str): table to delete from
+        key_columns (list[str]): columns identifying a row
+        keys (iterable[tuple]): key values of the rows to delete
+        chunk_size (int): keys per executemany() into the staging table
+
+    Return:
+        rows_affected (int): total number of rows deleted
+    """
+    names = ", ".join(_quote(column) for column in key_columns)
+    sql = (f"DELETE FROM {_quote(table)} WHERE ({names}) IN "
+           f"(SELECT {names} FROM {_STAGE});")
+    return _staged_write(db_file, sql, key_columns, keys, chunk_size)
+
+
+def _upsert_sql(table: str, columns: List[str],
+                key_columns: List[str]) -> str:
+    """INSERT ... SELECT from the staging table that only updates rows
+    whose non-key values differ."""
+    names = ", ".join(_quote(column) for column in columns)
+    keys = ", ".join(_quote(column) for column in key_columns)
+    values = [_quote(c) for c in columns if c not in key_columns]
+    sql = (f"INSERT INTO {_quote(table)} ({names}) "
+           f"SELECT {names} FROM {_STAGE} WHERE true "
+           f"ON CONFLICT ({keys}) DO ")
+    if not values:
+        return sql + "NOTHING;"
+    assignments = ", ".join(f"{c} = excluded.{c}" for c in values)
+    changed = " OR ".join(f"{_quote(table)}.{c} IS NOT excluded.{c}"
+                          for c in values)
+    return sql + f"UPDATE SET {assignments} WHERE {changed};"
+
+
+def upsert(db_file: str, table: str, columns: List[str],
+           key_columns: List[str], rows: Iterable[Any],
+           chunk_size: int = 1000) -> Dict[str, int]:
+    """Insert new rows and update changed ones, by key.
+
+    The rows are staged into a temporary table, then merged with one
+    INSERT ... ON CONFLICT (keys) DO UPDATE whose WHERE clause skips
+    rows whose values are all unchanged, so a re-import only writes the
+    pages of new and changed rows. A key repeated in rows is merged in
+    order: the last row wins.
+
+    Args:
+        db_file (str): database file path
+        table (str): table to merge into; key_columns must be its
+            primary key or have a unique index
+        columns (list[str]): columns of rows, including key_columns
+        key_columns (list[str]): columns identifying a row
+        rows (iterable[tuple]): values in the order of columns
+        chunk_size (int): rows per executemany() into the staging table
+
+    Raises:
+        err: sqlite3.Error as an exception; nothing is written.
+
+    Return:
+        counts (dict): "inserted", "updated" and "unchanged" rows
+    """
+    chunks = _chunked(rows, chunk_size)
+    keys = ", ".join(_quote(column) for column in key_columns)
+    match = " AND ".join(f"t.{_quote(c)} = s.{_quote(c)}"
+                         for c in key_columns)
+    new_sql = (f"SELECT count(*) FROM (SELECT DISTINCT {keys} FROM "
+               f"{_STAGE} AS s WHERE NOT EXISTS (SELECT 1 FROM "
+               f"{_quote(table)} AS t WHERE {match}));")
+    sql = _upsert_sql(table, columns, key_columns)
+
+    def work(conn: sqlite3.Connection) -> Dict[str, int]:
+        _stage(conn, columns, chunks)
+        try:
+            with _statement(conn, new_sql) as cursor:
+                inserted = int(cursor.fetchone()[0])
+            with _statement(conn, sql) as cursor:
+                changes = cursor.rowcount
+        finally:
+            _execute(conn, f"DROP TABLE IF EXISTS {_STAGE};")
+        total = sum(len(chunk) for chunk in chunks)
+        return {"inserted": inserted, "updated": changes - inserted,
+                "unchanged": total - changes}
+    return _write(db_file, sql, work)
 
 
 def execute_non_query(db_file: str, sql: str) -> None:
@@ -237,11 +2865,5 @@ def execute_non_query(db_file: str, sql: str) -> None:
     Return:
       None
     """
-    conn = create_connection(db_file)
-    with conn:
-        try:
-            cursor = conn.cursor()
-            cursor.execute(sql)
-            conn.commit()
-        except Error as err:
-            raise err
+    # no BEGIN IMMEDIATE: statements like VACUUM can't run in a transaction
+    _write(db_file, sql, lambda conn: _execute(conn, sql), immediate=False)
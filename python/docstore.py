@@ -0,0 +1,259 @@
+"""JSON document collections on top of db.py.
+
+A Collection keeps one JSON document per row of a table with the
+columns id (INTEGER PRIMARY KEY) and doc (TEXT, checked with
+json_valid). Documents are filtered with a small MongoDB-like syntax
+that is translated to json_extract() calls:
+
+    {"name": "Ann"}                        equality
+    {"address.city": {"$in": ["Oslo"]}}    nested path, operators
+    {"age": {"$gte": 18, "$lt": 65}}       $eq $ne $gt $gte $lt $lte $in
+
+Without an index every query parses the JSON of every row. An indexed
+path is materialised as a VIRTUAL generated column over json_extract()
+with an index on it; filters and sorts on that path then use the column,
+so SQLite seeks in the index instead of scanning the table.
+
+Example:
+    from python.docstore import Collection
+
+    people = Collection("people.db", "people")
+    people.create_index("address.city")
+    people.insert({"name": "Ann", "address": {"city": "Oslo"}})
+    people.find({"address.city": "Oslo"}, sort=[("name", 1)])
+"""
+
+
+import json
+import re
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from . import db
+
+_OPERATORS = {"$eq": "=", "$ne": "IS NOT", "$gt": ">", "$gte": ">=",
+              "$lt": "<", "$lte": "<="}
+_PATH = re.compile(r"^[A-Za-z_][\w]*(?:\.[A-Za-z_]\w*|\[\d+\])*$")
+
+Filter = Optional[Dict[str, Any]]
+
+
+def json_path(path: str) -> str:
+    """Turn a dotted path such as "address.city" into "$.address.city".
+
+    Raises:
+        ValueError: path contains anything but names, dots and [n].
+    """
+    if not _PATH.match(path):
+        raise ValueError(f"invalid document path {path!r}")
+    return "$." + path
+
+
+class Collection:
+    """Documents stored as JSON in one table of db_file.
+
+    The table and the bookkeeping table of indexed paths are created on
+    first use.
+
+    Args:
+        db_file (str): database file path
+        name (str): table name of the collection
+
+    Raises:
+        ValueError: name is not an identifier.
+    """
+
+    def __init__(self, db_file: str, name: str) -> None:
+        if not name.isidentifier():
+            raise ValueError(f"invalid collection name {name!r}")
+        self.db_file = db_file
+        self.name = name
+        db.create_table(db_file, f'CREATE TABLE IF NOT EXISTS "{name}" ('
+                                 "id INTEGER PRIMARY KEY, "
+                                 "doc TEXT NOT NULL CHECK (json_valid(doc)));")
+        db.create_table(db_file, "CREATE TABLE IF NOT EXISTS "
+                                 "docstore_paths (collection TEXT, "
+                                 "path TEXT, col TEXT, "
+                                 "PRIMARY KEY (collection, path));")
+        self._columns = self._load_columns()
+
+    def _load_columns(self) -> Dict[str, str]:
+        rows = db.select_many_rows(
+            self.db_file,
+            "SELECT path, col FROM docstore_paths WHERE collection = ?;",
+            (self.name,))
+        return dict(rows)
+
+    def indexes(self) -> List[str]:
+        """Return the indexed paths."""
+        return list(self._columns)
+
+    def create_index(self, path: str, unique: bool = False) -> None:
+        """Index a path through a generated column.
+
+        Adds a VIRTUAL column computed as json_extract(doc, path), which
+        takes no space in the rows, and an index on it. Indexing a path
+        twice does nothing.
+
+        Args:
+            path (str): dotted document path, e.g. "address.city"
+            unique (bool): reject documents repeating an indexed value
+
+        Raises:
+            ValueError: invalid path.
+            err: sqlite3.Error, e.g. existing duplicates with unique.
+        """
+        expr = json_path(path)
+        if path in self._columns:
+            return
+        column = "p_" + re.sub(r"\W", "_", path)
+        kind = "UNIQUE INDEX" if unique else "INDEX"
+        with db.transaction(self.db_file) as tx:
+            tx.execute_non_query(
+                f'ALTER TABLE "{self.name}" ADD COLUMN "{column}" '
+                f"GENERATED ALWAYS AS (json_extract(doc, '{expr}')) VIRTUAL;")
+            tx.execute_non_query(
+                f'CREATE {kind} "idx_{self.name}_{column}" '
+                f'ON "{self.name}" ("{column}");')
+            tx.insert_one_row("INSERT INTO docstore_paths VALUES (?, ?, ?);",
+                              (self.name, path, column))
+        self._columns[path] = column
+
+    def _operand(self, path: str) -> Tuple[str, Tuple[Any, ...]]:
+        """SQL expression (and its parameters) for a document path."""
+        if path in self._columns:
+            return f'"{self._columns[path]}"', ()
+        return "json_extract(doc, ?)", (json_path(path),)
+
+    def _where(self, where: Filter) -> Tuple[str, Tuple[Any, ...]]:
+        """Translate a filter into a WHERE clause and its parameters."""
+        terms: List[str] = []
+        params: List[Any] = []
+        for path, condition in (where or {}).items():
+            if not isinstance(condition, dict):
+                condition = {"$eq": condition}
+            for op, value in condition.items():
+                expr, expr_params = self._operand(path)
+                if op == "$in":
+                    marks = ", ".join("?" for _ in value)
+                    terms.append(f"{expr} IN ({marks})")
+                    params += [*expr_params, *map(_sql_value, value)]
+                elif op in _OPERATORS:
+                    sql_op = _OPERATORS[op]
+                    if value is None:
+                        sql_op = "IS" if op == "$eq" else sql_op
+                    terms.append(f"{expr} {sql_op} ?")
+                    params += [*expr_params, _sql_value(value)]
+                else:
+                    raise ValueError(f"unknown operator {op!r}")
+        clause = " WHERE " + " AND ".join(terms) if terms else ""
+        return clause, tuple(params)
+
+    def _select(self, what: str, where: Filter,
+                sort: Optional[List[Tuple[str, int]]],
+                limit: Optional[int]) -> Tuple[str, Tuple[Any, ...]]:
+        clause, params = self._where(where)
+        sql = f'SELECT {what} FROM "{self.name}"{clause}'
+        if sort:
+            keys = []
+            for path, direction in sort:
+                expr, expr_params = self._operand(path)
+                keys.append(expr + (" DESC" if direction < 0 else ""))
+                params += expr_params
+            sql += " ORDER BY " + ", ".join(keys)
+        if limit is not None:
+            sql += " LIMIT ?"
+            params += (limit,)
+        return sql + ";", params
+
+    def insert(self, doc: Dict[str, Any]) -> Optional[int]:
+        """Insert a document and return its _id."""
+        return db.insert_one_row(
+            self.db_file, f'INSERT INTO "{self.name}" (doc) VALUES (?);',
+            (_dumps(doc),))
+
+    def insert_many(self, docs: Iterable[Dict[str, Any]]) -> int:
+        """Insert documents in one transaction and return their count."""
+        rows = [(_dumps(doc),) for doc in docs]
+        db.insert_many_rows(
+            self.db_file, f'INSERT INTO "{self.name}" (doc) VALUES (?);',
+            rows)
+        return len(rows)
+
+    def find(self, where: Filter = None,
+             sort: Optional[List[Tuple[str, int]]] = None,
+             limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Return the documents matching where, with their _id.
+
+        Args:
+            where (dict): filter, see the module doc; None matches all
+            sort (list[tuple]): (path, 1 or -1) pairs
+            limit (int): maximum number of documents
+
+        Raises:
+            ValueError: invalid path or operator.
+
+        Returns:
+            list[dict]: documents with an added "_id" key
+        """
+        sql, params = self._select("id, doc", where, sort, limit)
+        return [{**json.loads(doc), "_id": doc_id}
+                for doc_id, doc in db.select_many_rows(self.db_file, sql,
+                                                       params)]
+
+    def find_one(self, where: Filter = None) -> Optional[Dict[str, Any]]:
+        """Return the first document matching where, or None."""
+        found = self.find(where, limit=1)
+        return found[0] if found else None
+
+    def count(self, where: Filter = None) -> int:
+        """Return the number of documents matching where."""
+        sql, params = self._select("count(*)", where, None, None)
+        return int(db.select_one_row(self.db_file, sql, params)[0])
+
+    def update(self, where: Filter, values: Dict[str, Any]) -> int:
+        """Set paths of the matching documents with json_set().
+
+        Args:
+            where (dict): filter, see the module doc
+            values (dict): dotted path to its new JSON value
+
+        Returns:
+            int: number of documents updated
+        """
+        assignments = ", ".join("?, json(?)" for _ in values)
+        clause, params = self._where(where)
+        set_params: List[Any] = []
+        for path, value in values.items():
+            set_params += [json_path(path), json.dumps(value)]
+        return int(db.update_record(
+            self.db_file,
+            f'UPDATE "{self.name}" SET doc = json_set(doc, {assignments})'
+            f"{clause};", (*set_params, *params)) or 0)
+
+    def delete(self, where: Filter) -> int:
+        """Delete the matching documents and return their count."""
+        clause, params = self._where(where)
+        return db.delete_record(
+            self.db_file, f'DELETE FROM "{self.name}"{clause};', params)
+
+    def explain(self, where: Filter = None,
+                sort: Optional[List[Tuple[str, int]]] = None) -> List[str]:
+        """Return the query plan of a find(), e.g. to check index use."""
+        sql, params = self._select("id, doc", where, sort, None)
+        with db.pooled_connection(self.db_file) as conn:
+            return db.explain_query_plan(conn, sql, params) or []
+
+
+def _dumps(doc: Dict[str, Any]) -> str:
+    return json.dumps({key: value for key, value in doc.items()
+                       if key != "_id"})
+
+
+def _sql_value(value: Any) -> Any:
+    """Value as json_extract() returns it: bools are 0/1, JSON text
+    for lists and objects."""
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, separators=(",", ":"))
+    return value
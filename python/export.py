@@ -0,0 +1,316 @@
+"""Streaming export of query results and tables to flat files.
+
+Rows are fetched with fetchmany() in batches and written straight to
+the file, so memory stays bounded by one batch and the file buffer
+whatever the size of the table. Supported formats:
+
+    tsv    tab-separated with a header line; backslash, tab, newline
+           and carriage return in values are written as \\, \t, \n
+           and \r, so every row is one line (bulk_load reads files
+           without such values)
+    csv    comma-separated with a header line, quoted where needed
+    jsonl  one JSON object per row
+
+NULL is written as an empty field in TSV/CSV and as null in JSONL;
+BLOBs are written as hex. A path ending in .gz, or compress=True,
+writes gzip-compressed output.
+
+export_tables dumps several tables concurrently, one process per table,
+each with its own read-only connection (see db.read_only_uri).
+
+Example:
+    from python import export
+
+    stats = export.export_tables("data/chinook.sqlite",
+                                 ["tracks", "invoices"], "out",
+                                 fmt="csv", compress=True)
+    print(export.format_report(stats))
+
+or from the command line:
+
+    python -m python.export data/chinook.sqlite out [tsv|csv|jsonl]
+"""
+
+
+import csv
+import gzip
+import json
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Iterable, List, Optional, Sequence
+from typing import TextIO, Tuple
+
+from . import db
+
+FORMATS = ("tsv", "csv", "jsonl")
+_TSV_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n",
+                              "\r": "\\r"})
+
+
+@dataclass
+class ExportStats:
+    """Result of exporting one query or table.
+
+    Args:
+        name (str): table name, or the path for a query
+        path (str): file written
+        rows (int): number of rows written
+        bytes (int): size of the file written
+        seconds (float): wall time including opening and closing
+    """
+
+    name: str
+    path: str
+    rows: int
+    bytes: int
+    seconds: float
+
+    @property
+    def mb_per_sec(self) -> float:
+        """Megabytes (10^6 bytes) of output written per second."""
+        return self.bytes / 1e6 / self.seconds if self.seconds > 0 else 0.0
+
+
+def _format(path: str, fmt: Optional[str]) -> str:
+    """Return fmt or the format named by the extension of path."""
+    if fmt is None:
+        base = path[:-3] if path.endswith(".gz") else path
+        fmt = os.path.splitext(base)[1].lstrip(".").lower()
+    if fmt not in FORMATS:
+        raise ValueError(f"unknown export format {fmt!r}, "
+                         f"expected one of {', '.join(FORMATS)}")
+    return fmt
+
+
+def _open_output(path: str, compress: bool) -> TextIO:
+    if compress:
+        return gzip.open(path, "wt", encoding="utf-8", newline="",
+                         compresslevel=6)
+    return open(path, "w", encoding="utf-8", newline="")
+
+
+def open_reader(db_file: str) -> sqlite3.Connection:
+    """Open a dedicated read-only connection for exporting.
+
+    Raises:
+        err: sqlite3.Error, e.g. when db_file doesn't exist.
+    """
+    conn = sqlite3.connect(db.read_only_uri(db_file), uri=True)
+    db.apply_pragmas(conn, db.PROFILES["read_only"])
+    return conn
+
+
+def _text_rows(rows: List[Any]) -> Iterable[Any]:
+    """Rows with BLOBs turned into hex for the csv module."""
+    # one cheap scan per batch keeps the common BLOB-free case at the
+    # speed of writerows() on the fetched tuples
+    if not any(bytes in map(type, row) for row in rows):
+        return rows
+    return ([value.hex() if isinstance(value, bytes) else value
+             for value in row] for row in rows)
+
+
+def _tsv_field(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        return value.translate(_TSV_ESCAPES)
+    if isinstance(value, bytes):
+        return value.hex()
+    return str(value)
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, bytes):
+        return value.hex()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _row_writer(out: TextIO, fmt: str,
+                columns: List[str]) -> Callable[[List[Any]], None]:
+    """Write the header, if any, and return a function writing a batch."""
+    if fmt == "jsonl":
+        def write_json(rows: List[Any]) -> None:
+            out.writelines(json.dumps(dict(zip(columns, row)),
+                                      default=_json_default,
+                                      ensure_ascii=False) + "\n"
+                           for row in rows)
+        return write_json
+    if fmt == "tsv":
+        def write_tsv(rows: List[Any]) -> None:
+            out.writelines("\t".join(map(_tsv_field, row)) + "\n"
+                           for row in rows)
+        write_tsv([columns])
+        return write_tsv
+    writer = csv.writer(out, lineterminator="\n")
+    writer.writerow(columns)
+    return lambda rows: writer.writerows(_text_rows(rows))
+
+
+def write_rows(cursor: sqlite3.Cursor, out: TextIO, fmt: str,
+               batch_size: int = 1000) -> int:
+    """Write the rows of an executed cursor to out.
+
+    Args:
+        cursor (Cursor): cursor of an executed SELECT
+        out (TextIO): text file to write to
+        fmt (str): "tsv", "csv" or "jsonl"
+        batch_size (int): rows per fetchmany() call
+
+    Returns:
+        int: number of rows written
+    """
+    columns = [description[0] for description in cursor.description]
+    write = _row_writer(out, fmt, columns)
+    count = 0
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return count
+        write(rows)
+        count += len(rows)
+
+
+def export_query(db_file: str, sql: str, params: Tuple[Any, ...],
+                 path: str, fmt: Optional[str] = None,
+                 compress: Optional[bool] = None, batch_size: int = 1000,
+                 name: Optional[str] = None) -> ExportStats:
+    """Stream the rows of a query to a file.
+
+    Args:
+        db_file (str): database file path
+        sql (str): SELECT statement
+        params (tuple): parameters of sql
+        path (str): output file; an existing file is overwritten
+        fmt (str): "tsv", "csv" or "jsonl", defaults to the extension
+            of path (before a .gz)
+        compress (bool): gzip the output, defaults to path ending in .gz
+        batch_size (int): rows per fetchmany() call
+        name (str): name in the stats, defaults to path
+
+    Raises:
+        ValueError: unknown format.
+        err: sqlite3.Error as an exception.
+
+    Returns:
+        ExportStats: rows, bytes and time
+    """
+    start = time.perf_counter()
+    fmt = _format(path, fmt)
+    if compress is None:
+        compress = path.endswith(".gz")
+    conn = open_reader(db_file)
+    try:
+        cursor = conn.execute(sql, params)
+        with _open_output(path, compress) as out:
+            rows = write_rows(cursor, out, fmt, batch_size)
+    finally:
+        db.close_connection(conn)
+    return ExportStats(name or path, path, rows, os.path.getsize(path),
+                       time.perf_counter() - start)
+
+
+def export_table(db_file: str, table: str, path: str,
+                 fmt: Optional[str] = None, compress: Optional[bool] = None,
+                 batch_size: int = 1000) -> ExportStats:
+    """Stream every row of table to a file; see export_query."""
+    quoted = '"' + table.replace('"', '""') + '"'
+    return export_query(db_file, f"SELECT * FROM {quoted};", (), path, fmt,
+                        compress, batch_size, name=table)
+
+
+def table_names(db_file: str) -> List[str]:
+    """Return the user tables of db_file in name order."""
+    conn = open_reader(db_file)
+    try:
+        rows = conn.execute("SELECT name FROM sqlite_master WHERE type = "
+                            "'table' AND name NOT LIKE 'sqlite_%' "
+                            "ORDER BY name;").fetchall()
+    finally:
+        db.close_connection(conn)
+    return [name for name, in rows]
+
+
+def export_tables(db_file: str, tables: Optional[Sequence[str]],
+                  directory: str, fmt: str = "tsv", compress: bool = False,
+                  workers: Optional[int] = None,
+                  batch_size: int = 1000) -> List[ExportStats]:
+    """Export tables concurrently, one file per table.
+
+    The files are named <table>.<fmt>, plus .gz when compressed. Each
+    table is exported by a worker process with its own read-only
+    connection, so formatting, compression and SQLite all run in
+    parallel.
+
+    Args:
+        db_file (str): database file path
+        tables (list[str]): tables to export, None for every table
+        directory (str): output directory, created if missing
+        fmt (str): "tsv", "csv" or "jsonl"
+        compress (bool): gzip the files
+        workers (int): worker processes, defaults to the CPU count
+        batch_size (int): rows per fetchmany() call
+
+    Raises:
+        ValueError: unknown format.
+        err: sqlite3.Error as an exception.
+
+    Returns:
+        list[ExportStats]: one entry per table, in the order of tables
+    """
+    _format("", fmt)
+    if tables is None:
+        tables = table_names(db_file)
+    os.makedirs(directory, exist_ok=True)
+    suffix = "." + fmt + (".gz" if compress else "")
+    workers = min(workers or os.cpu_count() or 1, max(1, len(tables)))
+    with ProcessPoolExecutor(max_workers=workers,
+                             mp_context=db.MP_CONTEXT) as executor:
+        futures = [executor.submit(export_table, db_file, table,
+                                   os.path.join(directory, table + suffix),
+                                   fmt, compress, batch_size)
+                   for table in tables]
+        return [future.result() for future in futures]
+
+
+def format_report(stats: Iterable[ExportStats],
+                  seconds: Optional[float] = None) -> str:
+    """Return a text table of rows, MB and MB/s per export.
+
+    Args:
+        stats (iterable[ExportStats]): exports to list
+        seconds (float): wall time of the whole run, for a total line
+    """
+    stats = list(stats)
+    lines = [f"{'table':20} {'rows':>10} {'MB':>9} {'seconds':>9} "
+             f"{'MB/s':>8}"]
+    for item in stats:
+        lines.append(f"{item.name:20} {item.rows:10d} "
+                     f"{item.bytes / 1e6:9.2f} {item.seconds:9.3f} "
+                     f"{item.mb_per_sec:8.1f}")
+    if seconds:
+        total = sum(item.bytes for item in stats)
+        lines.append(f"{'total':20} {sum(item.rows for item in stats):10d} "
+                     f"{total / 1e6:9.2f} {seconds:9.3f} "
+                     f"{total / 1e6 / seconds:8.1f}")
+    return "\n".join(lines)
+
+
+def main(argv: List[str]) -> None:
+    """Command line entry: export <db_file> <directory> [format]."""
+    if len(argv) < 3:
+        print("usage: python -m python.export <db_file> <directory> "
+              "[tsv|csv|jsonl]")
+        sys.exit(2)
+    fmt = argv[3] if len(argv) > 3 else "tsv"
+    start = time.perf_counter()
+    stats = export_tables(argv[1], None, argv[2], fmt)
+    print(format_report(stats, time.perf_counter() - start))
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,321 @@
+"""Parallel multi-table TSV import.
+
+Files are split into line-aligned byte ranges that are parsed and
+validated in a process pool, while a single writer thread owns the only
+SQLite connection and inserts the parsed batches. Tables are written in
+foreign-key order (parents before children) so that the load also works
+with PRAGMA foreign_keys = ON; parsing of later tables runs ahead while
+earlier ones are being written.
+
+Example:
+    from python import import_pipeline
+
+    stats = import_pipeline.import_directory("supply.db", "SupplyChainDB")
+
+or from the command line:
+
+    python -m python.import_pipeline supply.db SupplyChainDB
+"""
+
+
+import glob
+import os
+import queue
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from graphlib import TopologicalSorter
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional
+from typing import Sequence, Tuple
+
+from . import bulk_load, db
+
+# child table -> parent tables it references
+SUPPLY_CHAIN_DEPENDENCIES: Dict[str, Tuple[str, ...]] = {
+    "ProductsN": ("Categories", "Suppliers"),
+    "OrdersN": ("Customers", "Employees", "Shippers"),
+    "OrderDetailsN": ("OrdersN", "ProductsN"),
+}
+
+_END_TABLE = object()
+
+
+def load_order(tables: Iterable[str],
+               dependencies: Dict[str, Tuple[str, ...]]) -> List[str]:
+    """Order tables so that every parent comes before its children.
+
+    Dependencies on tables not in tables are ignored.
+
+    Args:
+        tables (iterable[str]): tables to load
+        dependencies (dict): child table to the parent tables it references
+
+    Raises:
+        ValueError: the dependencies contain a cycle.
+
+    Returns:
+        list[str]: tables in load order
+    """
+    wanted = set(tables)
+    sorter: TopologicalSorter[str] = TopologicalSorter()
+    for table in sorted(wanted):
+        parents = [p for p in dependencies.get(table, ()) if p in wanted]
+        sorter.add(table, *parents)
+    return list(sorter.static_order())
+
+
+def add_references(schemas: Dict[str, bulk_load.TableSchema],
+                   dependencies: Dict[str, Tuple[str, ...]]) -> None:
+    """Declare REFERENCES for columns named after a parent's primary key.
+
+    Args:
+        schemas (dict): table name to schema, updated in place
+        dependencies (dict): child table to the parent tables it references
+    """
+    for table, schema in schemas.items():
+        for parent in dependencies.get(table, ()):
+            key = schemas[parent].primary_key if parent in schemas else None
+            if key is not None and key in schema.columns:
+                schema.references[key] = parent
+
+
+def split_ranges(tsv_path: str,
+                 chunk_bytes: int) -> List[Tuple[int, int]]:
+    """Split a TSV file after its header into line-aligned byte ranges.
+
+    Args:
+        tsv_path (str): path of the TSV file
+        chunk_bytes (int): approximate size of each range
+
+    Returns:
+        list[tuple[int, int]]: (start, end) byte offsets
+    """
+    ranges = []
+    size = os.path.getsize(tsv_path)
+    with open(tsv_path, "rb") as tsv_file:
+        tsv_file.readline()
+        start = tsv_file.tell()
+        while start < size:
+            tsv_file.seek(min(start + chunk_bytes, size))
+            tsv_file.readline()
+            end = tsv_file.tell()
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+def parse_range(tsv_path: str, schema: bulk_load.TableSchema,
+                start: int, end: int) -> List[Tuple[Any, ...]]:
+    """Parse and validate the rows between two byte offsets.
+
+    Runs in a worker process.
+
+    Args:
+        tsv_path (str): path of the TSV file
+        schema (TableSchema): schema the rows must match
+        start (int): offset of the first line
+        end (int): offset just past the last line
+
+    Raises:
+        ValueError: a row doesn't match the schema.
+
+    Returns:
+        list[tuple]: typed rows
+    """
+    with open(tsv_path, "rb") as tsv_file:
+        tsv_file.seek(start)
+        data = tsv_file.read(end - start).decode("utf-8")
+    rows = []
+    for line in data.split("\n"):
+        line = line.rstrip("\r")
+        if line:
+            rows.append(bulk_load.convert_row(
+                schema, line.split("\t"), f"{tsv_path}@{start}"))
+    return rows
+
+
+class _Writer(threading.Thread):
+    """Single thread that owns the connection and inserts parsed rows.
+
+    The queue carries a TableSchema to start a table, lists of rows,
+    _END_TABLE to commit the table and None to stop.
+    """
+
+    def __init__(self, db_file: str, chunk_size: int, foreign_keys: bool,
+                 pragmas: Optional[Dict[str, Any]],
+                 queue_size: int) -> None:
+        super().__init__(name="import-writer", daemon=True)
+        self.queue: "queue.Queue[Any]" = queue.Queue(maxsize=queue_size)
+        self.stats: List[bulk_load.LoadStats] = []
+        self.error: Optional[BaseException] = None
+        self._stopped = False
+        self._db_file = db_file
+        self._chunk_size = chunk_size
+        self._foreign_keys = foreign_keys
+        self._pragmas = pragmas
+
+    def _rows(self) -> Iterator[Tuple[Any, ...]]:
+        batch = self.queue.get()
+        while batch is not _END_TABLE:
+            if batch is None:
+                self._stopped = True
+                raise RuntimeError("import aborted before table was complete")
+            yield from batch
+            batch = self.queue.get()
+
+    def _drain(self) -> None:
+        while not self._stopped:
+            self._stopped = self.queue.get() is None
+
+    def run(self) -> None:
+        conn = bulk_load.open_loader(self._db_file, self._pragmas)
+        try:
+            if self._foreign_keys:
+                conn.execute("PRAGMA foreign_keys = ON;")
+            schema = self.queue.get()
+            while schema is not None:
+                start = time.perf_counter()
+                rows = bulk_load.load_rows(conn, schema, self._rows(),
+                                           self._chunk_size)
+                self.stats.append(bulk_load.LoadStats(
+                    schema.table, rows, time.perf_counter() - start))
+                schema = self.queue.get()
+        except BaseException as err:
+            self.error = err
+            self._drain()
+        finally:
+            db.close_connection(conn)
+
+
+def _drop_tables(db_file: str, tables: Sequence[str]) -> None:
+    """Drop tables children first so foreign keys never dangle."""
+    conn = db.create_connection(db_file)
+    try:
+        with conn:
+            for table in reversed(tables):
+                conn.execute(f'DROP TABLE IF EXISTS "{table}";')
+    finally:
+        db.close_connection(conn)
+
+
+def _tasks(order: Sequence[str],
+           schemas: Dict[str, bulk_load.TableSchema],
+           paths: Dict[str, str],
+           chunk_bytes: int) -> Iterator[Tuple[Any, ...]]:
+    """Yield ('table', schema), ('range', path, schema, start, end) and
+    ('end',) steps in the order the writer must see them."""
+    for table in order:
+        yield ("table", schemas[table])
+        for start, end in split_ranges(paths[table], chunk_bytes):
+            yield ("range", paths[table], schemas[table], start, end)
+        yield ("end",)
+
+
+def _feed(writer: _Writer, executor: ProcessPoolExecutor,
+          tasks: Iterator[Tuple[Any, ...]], lookahead: int) -> None:
+    """Submit parse jobs up to lookahead ahead and pass results in order."""
+    pending: Deque[Any] = deque()
+    for task in tasks:
+        if task[0] == "range":
+            pending.append(executor.submit(parse_range, *task[1:]))
+        else:
+            pending.append(_END_TABLE if task[0] == "end" else task[1])
+        while len(pending) > lookahead and writer.error is None:
+            _put(writer, pending.popleft())
+    while pending and writer.error is None:
+        _put(writer, pending.popleft())
+
+
+def _put(writer: _Writer, item: Any) -> None:
+    if isinstance(item, Future):
+        item = item.result()
+    writer.queue.put(item)
+
+
+def import_files(db_file: str, tsv_paths: Iterable[str],
+                 dependencies: Optional[Dict[str, Tuple[str, ...]]] = None,
+                 workers: Optional[int] = None,
+                 chunk_bytes: int = 1 << 20, chunk_size: int = 5000,
+                 replace: bool = True, foreign_keys: bool = True,
+                 pragmas: Optional[Dict[str, Any]] = None
+                 ) -> List[bulk_load.LoadStats]:
+    """Import TSV files in parallel, one table per file.
+
+    Args:
+        db_file (str): database file path
+        tsv_paths (iterable[str]): TSV files named after their tables
+        dependencies (dict): child table to parent tables, defaults to
+            SUPPLY_CHAIN_DEPENDENCIES
+        workers (int): parser processes, defaults to the CPU count
+        chunk_bytes (int): approximate bytes parsed per job
+        chunk_size (int): rows passed to each executemany() call
+        replace (bool): drop existing tables first
+        foreign_keys (bool): declare and enforce foreign keys
+        pragmas (dict): PRAGMAs for the load, defaults to LOAD_PRAGMAS
+
+    Raises:
+        ValueError: a file doesn't match its inferred schema.
+        err: sqlite3.Error as an exception.
+
+    Returns:
+        list[LoadStats]: one entry per table in load order
+    """
+    if dependencies is None:
+        dependencies = SUPPLY_CHAIN_DEPENDENCIES
+    paths = {os.path.splitext(os.path.basename(p))[0]: p for p in tsv_paths}
+    schemas = {t: bulk_load.infer_schema(p) for t, p in paths.items()}
+    if foreign_keys:
+        add_references(schemas, dependencies)
+    order = load_order(paths, dependencies)
+    if replace:
+        _drop_tables(db_file, order)
+    workers = workers or os.cpu_count() or 1
+    writer = _Writer(db_file, chunk_size, foreign_keys, pragmas,
+                     queue_size=2 * workers)
+    with ProcessPoolExecutor(max_workers=workers,
+                             mp_context=db.MP_CONTEXT) as executor:
+        writer.start()
+        try:
+            _feed(writer, executor,
+                  _tasks(order, schemas, paths, chunk_bytes), 2 * workers)
+        finally:
+            writer.queue.put(None)
+            writer.join()
+    if writer.error is not None:
+        raise writer.error
+    return writer.stats
+
+
+def import_directory(db_file: str, directory: str,
+                     pattern: str = "*.tsv",
+                     **kwargs: Any) -> List[bulk_load.LoadStats]:
+    """Import every TSV file in a directory with import_files.
+
+    Args:
+        db_file (str): database file path
+        directory (str): directory containing the TSV files
+        pattern (str): glob pattern selecting the files
+        **kwargs: options passed to import_files
+
+    Returns:
+        list[LoadStats]: one entry per table in load order
+    """
+    paths = sorted(glob.glob(os.path.join(directory, pattern)))
+    return import_files(db_file, paths, **kwargs)
+
+
+def main(argv: List[str]) -> None:
+    """Command line entry: import_pipeline <db_file> [directory]."""
+    if len(argv) < 2:
+        print("usage: python -m python.import_pipeline <db_file> "
+              "[directory]")
+        sys.exit(2)
+    directory = argv[2] if len(argv) > 2 else "SupplyChainDB"
+    stats = import_directory(argv[1], directory)
+    print(bulk_load.format_report(stats))
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,521 @@
+"""Index advisor driven by a recorded query workload.
+
+The advisor reads the WHERE, JOIN, ORDER BY and SELECT clauses of each
+SELECT statement in a workload, proposes single-column, multi-column and
+covering indexes for the tables involved, and checks every candidate
+against SQLite's own planner on an in-memory copy of the database:
+
+    estimated speedup  planner cost before / after, where the cost of a
+                       plan is the number of rows its SCAN and SEARCH
+                       steps visit, taken from sqlite_stat1 (ANALYZE)
+    actual speedup     replay time of the affected queries before / after
+
+Candidates the planner doesn't use or that don't lower the cost are
+dropped. The database itself is never modified.
+
+Example:
+    from python import db, index_advisor
+
+    profiler = db.enable_profiling()
+    ...  # run the application's queries
+    report = index_advisor.advise("data/chinook.sqlite",
+                                  profiler.samples())
+    print(index_advisor.format_report(report))
+"""
+
+
+import re
+import sqlite3
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from . import db
+
+Query = Tuple[str, Any]
+
+_NAME = r"([A-Za-z_]\w*|\"[^\"]+\"|\[[^\]]+\]|`[^`]+`)"
+_REF = r"(?:" + _NAME + r"\s*\.\s*)?" + _NAME
+_TABLES = re.compile(r"\b(?:FROM|JOIN)\s+" + _NAME +
+                     r"(?:\s+(?:AS\s+)?([A-Za-z_]\w*))?", re.I)
+_PREDICATE = re.compile(
+    _REF + r"\s*(==?|<=|>=|<>|!=|<|>|\bIS\s+NOT\b|\bIS\b|\bNOT\s+IN\b|"
+    r"\bIN\b|\bBETWEEN\b)", re.I)
+_JOIN = re.compile(_REF + r"\s*==?\s*" + _REF + r"(?!\s*\()")
+_COLUMN = re.compile(_REF + r"(?!\s*[(.])")
+_SELECT_LIST = re.compile(r"^\s*SELECT\s+(?:DISTINCT\s+)?(.*?)\bFROM\b",
+                          re.I | re.S)
+_ORDER_BY = re.compile(r"\bORDER\s+BY\s+(.*?)(?:\bLIMIT\b|;|$)",
+                       re.I | re.S)
+_STEP = re.compile(r"(SCAN|SEARCH) (\S+)(?: USING (?:COVERING )?INDEX "
+                   r"(\S+)| USING INTEGER PRIMARY KEY)?(?: \((.*)\))?$")
+_KEYWORDS = {"where", "on", "join", "inner", "left", "right", "full",
+             "cross", "natural", "outer", "group", "order", "limit",
+             "using", "union", "window", "having", "indexed", "not"}
+_EQUALITY_OPS = {"=", "==", "is", "in"}
+_RANGE_OPS = {"<", "<=", ">", ">=", "between"}
+_MAX_COVERING = 8
+
+
+@dataclass
+class IndexCandidate:
+    """Index proposed for the queries in a workload.
+
+    Args:
+        table (str): indexed table
+        columns (tuple[str]): indexed columns in order
+        covering (bool): the trailing columns only make it covering
+        queries (list[int]): positions of the queries it was proposed for
+    """
+
+    table: str
+    columns: Tuple[str, ...]
+    covering: bool = False
+    queries: List[int] = field(default_factory=list)
+
+    @property
+    def name(self) -> str:
+        """Index name derived from the table and columns."""
+        parts = [self.table, *self.columns]
+        return "idx_advisor_" + "_".join(
+            re.sub(r"\W", "", part).lower() for part in parts)
+
+    def create_sql(self) -> str:
+        """Return a CREATE INDEX IF NOT EXISTS statement."""
+        columns = ", ".join(f'"{column}"' for column in self.columns)
+        return (f'CREATE INDEX IF NOT EXISTS "{self.name}" '
+                f'ON "{self.table}" ({columns});')
+
+
+@dataclass
+class Recommendation:
+    """Candidate that the planner uses, with its measured effect.
+
+    Args:
+        candidate (IndexCandidate): the index
+        queries (list[str]): fingerprints of the queries using it
+        estimated_speedup (float): planner cost before / after
+        actual_speedup (float): replay time before / after
+        plans (dict): fingerprint to its (before, after) query plans
+    """
+
+    candidate: IndexCandidate
+    queries: List[str]
+    estimated_speedup: float
+    actual_speedup: float
+    plans: Dict[str, Tuple[List[str], List[str]]]
+
+
+@dataclass
+class AdvisorReport:
+    """Recommendations and the replay time of the whole workload.
+
+    Args:
+        recommendations (list[Recommendation]): indexes worth creating,
+            best estimated speedup first
+        rejected (int): candidates the planner ignored, that didn't help
+            or that a recommended index supersedes
+        seconds_before (float): workload replay time without the indexes
+        seconds_after (float): workload replay time with all of them
+    """
+
+    recommendations: List[Recommendation]
+    rejected: int
+    seconds_before: float
+    seconds_after: float
+
+    @property
+    def speedup(self) -> float:
+        """Workload speedup with every recommended index."""
+        return self.seconds_before / (self.seconds_after or 1e-9)
+
+
+def _unquote(name: str) -> str:
+    return name.strip("\"`[]")
+
+
+class _Schema:
+    """Column names, row counts and index statistics of a database."""
+
+    def __init__(self, conn: sqlite3.Connection) -> None:
+        self.conn = conn
+        self._columns: Dict[str, Optional[Dict[str, str]]] = {}
+        self._rowids: Dict[str, Optional[str]] = {}
+        self._rows: Dict[str, float] = {}
+
+    def columns(self, table: str) -> Optional[Dict[str, str]]:
+        """Map lower-case column names of table to their spelling."""
+        key = table.lower()
+        if key not in self._columns:
+            info = self.conn.execute(
+                f'PRAGMA table_info("{table}");').fetchall()
+            self._columns[key] = {row[1].lower(): row[1]
+                                  for row in info} or None
+            keys = [row for row in info if row[5]]
+            rowid = len(keys) == 1 and keys[0][2].upper() == "INTEGER"
+            self._rowids[key] = keys[0][1].lower() if rowid else None
+        return self._columns[key]
+
+    def is_rowid(self, table: str, column: str) -> bool:
+        """Tell whether column is the INTEGER PRIMARY KEY of table."""
+        self.columns(table)
+        return self._rowids.get(table.lower()) == column.lower()
+
+    def rows(self, table: str) -> float:
+        """Number of rows in table (1 for unknown tables)."""
+        key = table.lower()
+        if key not in self._rows:
+            try:
+                count = self.conn.execute(
+                    f'SELECT count(*) FROM "{table}";').fetchone()[0]
+            except sqlite3.Error:
+                count = 1
+            self._rows[key] = max(float(count), 1.0)
+        return self._rows[key]
+
+    def rows_per_key(self, index: str, equalities: int) -> Optional[float]:
+        """Average rows matching the first equalities columns of index."""
+        try:
+            row = self.conn.execute(
+                "SELECT stat FROM sqlite_stat1 WHERE idx = ?;",
+                (index,)).fetchone()
+        except sqlite3.Error:
+            return None
+        if row is None:
+            return None
+        stat = row[0].split()
+        try:
+            return float(stat[min(equalities, len(stat) - 1)])
+        except ValueError:
+            return None
+
+    def existing_indexes(self, table: str) -> List[Tuple[str, ...]]:
+        """Column lists of the indexes already on table."""
+        indexes = []
+        for row in self.conn.execute(f'PRAGMA index_list("{table}");'):
+            info = self.conn.execute(
+                f'PRAGMA index_info("{row[1]}");').fetchall()
+            indexes.append(tuple(str(col[2]).lower() for col in info))
+        return indexes
+
+
+class _QueryShape:
+    """Columns a SELECT filters, joins, sorts and returns, per table."""
+
+    def __init__(self, sql: str, schema: _Schema) -> None:
+        self.aliases: Dict[str, str] = {}
+        for match in _TABLES.finditer(sql):
+            table = _unquote(match.group(1))
+            if schema.columns(table) is None:
+                continue
+            alias = match.group(2)
+            self.aliases[table.lower()] = table
+            if alias and alias.lower() not in _KEYWORDS:
+                self.aliases[alias.lower()] = table
+        self.schema = schema
+        self.equal: Dict[str, List[str]] = {}
+        self.range: Dict[str, List[str]] = {}
+        self.order: List[Tuple[str, str]] = []
+        self.used: Dict[str, List[str]] = {}
+        self.star = False
+        self._parse(sql)
+
+    def resolve(self, qualifier: Optional[str],
+                column: str) -> Optional[Tuple[str, str]]:
+        """Return (table, column) for a column reference, if known."""
+        column = _unquote(column).lower()
+        if qualifier:
+            table = self.aliases.get(_unquote(qualifier).lower())
+            tables = [table] if table else []
+        else:
+            tables = list(dict.fromkeys(self.aliases.values()))
+        found = []
+        for table in tables:
+            columns = self.schema.columns(table) or {}
+            if column in columns:
+                found.append((table, columns[column]))
+        return found[0] if len(found) == 1 else None
+
+    def _add(self, where: Dict[str, List[str]],
+             ref: Optional[Tuple[str, str]]) -> None:
+        if ref is not None and ref[1] not in where.setdefault(ref[0], []):
+            where[ref[0]].append(ref[1])
+
+    def _parse(self, sql: str) -> None:
+        body = sql[sql.upper().find("FROM"):]
+        for match in _JOIN.finditer(body):
+            self._add(self.equal, self.resolve(*match.group(1, 2)))
+            self._add(self.equal, self.resolve(*match.group(3, 4)))
+        for match in _PREDICATE.finditer(body):
+            op = " ".join(match.group(3).lower().split())
+            ref = self.resolve(*match.group(1, 2))
+            if op in _EQUALITY_OPS:
+                self._add(self.equal, ref)
+            elif op in _RANGE_OPS:
+                self._add(self.range, ref)
+        order = _ORDER_BY.search(body)
+        for term in order.group(1).split(",") if order else ():
+            found = _COLUMN.search(term)
+            ref = self.resolve(*found.group(1, 2)) if found else None
+            if ref is not None:
+                self.order.append(ref)
+        select = _SELECT_LIST.search(sql)
+        self.star = select is None or "*" in select.group(1)
+        for match in _COLUMN.finditer(sql):
+            self._add(self.used, self.resolve(*match.group(1, 2)))
+
+    def candidates(self, table: str) -> List[Tuple[Tuple[str, ...], bool]]:
+        """Return (columns, covering) index candidates for table."""
+        key = [column for column in self.equal.get(table, [])
+               if not self.schema.is_rowid(table, column)]
+        ranges = [column for column in self.range.get(table, [])
+                  if not self.schema.is_rowid(table, column)]
+        if ranges:
+            key.append(ranges[0])
+        elif self.order and {t for t, _ in self.order} == {table}:
+            key += [c for _, c in self.order if c not in key]
+        if not key:
+            return []
+        found = [(tuple(key), False)]
+        extra = [c for c in self.used.get(table, []) if c not in key
+                 and not self.schema.is_rowid(table, c)]
+        if extra and not self.star and len(key) + len(extra) <= \
+                _MAX_COVERING:
+            found.append((tuple(key + extra), True))
+        return found
+
+
+def candidate_indexes(conn: sqlite3.Connection,
+                      workload: Sequence[Query]) -> List[IndexCandidate]:
+    """Propose indexes for the SELECT statements of a workload.
+
+    Candidates already served by an existing index (same leading
+    columns) are left out.
+
+    Args:
+        conn (sqlite3.Connection): connection to the database
+        workload (list[tuple]): (sql, params) of the recorded queries
+
+    Returns:
+        list[IndexCandidate]: proposed indexes
+    """
+    schema = _Schema(conn)
+    found: Dict[Tuple[str, Tuple[str, ...]], IndexCandidate] = {}
+    for position, (sql, _) in enumerate(workload):
+        if not sql.lstrip().upper().startswith("SELECT"):
+            continue
+        shape = _QueryShape(sql, schema)
+        for table in dict.fromkeys(shape.aliases.values()):
+            existing = schema.existing_indexes(table)
+            for columns, covering in shape.candidates(table):
+                lowered = tuple(column.lower() for column in columns)
+                if any(index[:len(lowered)] == lowered
+                       for index in existing):
+                    continue
+                key = (table.lower(), lowered)
+                if key not in found:
+                    found[key] = IndexCandidate(table, columns, covering)
+                found[key].queries.append(position)
+    return list(found.values())
+
+
+def _step_rows(schema: _Schema, shape: _QueryShape,
+               detail: str) -> Optional[float]:
+    """Rows a SCAN or SEARCH plan step visits, None for other steps."""
+    match = _STEP.match(detail)
+    if match is None:
+        return None
+    kind, name, index, condition = match.groups()
+    table = shape.aliases.get(name.lower(), name)
+    rows = schema.rows(table)
+    if kind == "SCAN":
+        return rows
+    condition = condition or ""
+    equalities = condition.count("=?") - condition.count("<=?") \
+        - condition.count(">=?")
+    is_range = any(op in condition for op in ("<", ">"))
+    if index is None:
+        estimate = 1.0 if not is_range else rows / 4
+    else:
+        per_key = schema.rows_per_key(index, equalities)
+        if per_key is None:
+            per_key = max(rows / 10 ** equalities, 1.0)
+        estimate = per_key / 4 if is_range else per_key
+    return max(estimate, 1.0)
+
+
+def plan_cost(conn: sqlite3.Connection, sql: str, params: Any = (),
+              schema: Optional[_Schema] = None) -> Tuple[float, List[str]]:
+    """Estimate the rows a statement visits from its query plan.
+
+    Sibling plan steps are nested loops: each one runs once per row of
+    the steps before it. Sorting with a temporary b-tree costs one unit
+    per sorted row.
+
+    Args:
+        conn (sqlite3.Connection): connection to plan the statement on
+        sql (str): a SELECT statement
+        params (tuple): its parameters
+
+    Returns:
+        tuple: (estimated rows visited, plan steps)
+    """
+    schema = schema or _Schema(conn)
+    shape = _QueryShape(sql, schema)
+    rows = conn.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+    loops: Dict[int, float] = {}
+    cost = 0.0
+    for _, parent, _, detail in rows:
+        loop = loops.get(parent, 1.0)
+        if detail.startswith("USE TEMP B-TREE"):
+            cost += loop
+            continue
+        visited = _step_rows(schema, shape, detail)
+        if visited is not None:
+            cost += loop * visited
+            loops[parent] = loop * visited
+    return cost, db.explain_query_plan(conn, sql, params) or []
+
+
+def _replay(conn: sqlite3.Connection, query: Query, repeat: int) -> float:
+    """Best time of repeat runs of a query, fetching every row."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        conn.execute(*query).fetchall()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _uses(plan: Iterable[str], index: str) -> bool:
+    return any(f"INDEX {index}" in step for step in plan)
+
+
+class _Evaluation:
+    """Planner cost and replay time of each query without new indexes."""
+
+    def __init__(self, conn: sqlite3.Connection, workload: Sequence[Query],
+                 repeat: int) -> None:
+        self.conn = conn
+        self.workload = workload
+        self.repeat = repeat
+        self.schema = _Schema(conn)
+        self.before = [self.measure(query) for query in workload]
+
+    def measure(self, query: Query) -> Tuple[float, List[str], float]:
+        """Return (planner cost, plan, replay time) of a query."""
+        cost, plan = plan_cost(self.conn, query[0], query[1], self.schema)
+        return cost, plan, _replay(self.conn, query, self.repeat)
+
+    def evaluate(self, candidate: IndexCandidate
+                 ) -> Optional[Recommendation]:
+        """Create candidate, measure its queries and drop it again."""
+        self.conn.execute(candidate.create_sql())
+        self.conn.execute(f'ANALYZE "{candidate.name}";')
+        try:
+            costs = [0.0, 0.0, 0.0, 0.0]
+            plans = {}
+            for position in candidate.queries:
+                after = self.measure(self.workload[position])
+                before = self.before[position]
+                if not _uses(after[1], candidate.name) \
+                        or after[0] >= before[0]:
+                    continue
+                key = db.fingerprint(self.workload[position][0])
+                plans[key] = (before[1], after[1])
+                costs = [costs[0] + before[0], costs[1] + after[0],
+                         costs[2] + before[2], costs[3] + after[2]]
+        finally:
+            self.conn.execute(f'DROP INDEX "{candidate.name}";')
+            self.conn.execute("DELETE FROM sqlite_stat1 WHERE idx = ?;",
+                              (candidate.name,))
+        if not plans:
+            return None
+        return Recommendation(candidate, list(plans),
+                              costs[0] / max(costs[1], 1.0),
+                              costs[2] / (costs[3] or 1e-9), plans)
+
+
+def _dominated(candidate: IndexCandidate,
+               chosen: Iterable[IndexCandidate]) -> bool:
+    """Tell whether a chosen index starts with candidate's columns."""
+    columns = tuple(column.lower() for column in candidate.columns)
+    return any(other.table.lower() == candidate.table.lower()
+               and tuple(c.lower() for c in other.columns)[:len(columns)]
+               == columns for other in chosen)
+
+
+def _copy(db_file: str) -> sqlite3.Connection:
+    """Copy db_file into memory, with fresh ANALYZE statistics."""
+    source = db.create_connection(db_file)
+    try:
+        conn = sqlite3.connect(":memory:", isolation_level=None)
+        source.backup(conn)
+    finally:
+        db.close_connection(source)
+    conn.execute("ANALYZE;")
+    return conn
+
+
+def advise(db_file: str, workload: Sequence[Query],
+           repeat: int = 5) -> AdvisorReport:
+    """Recommend indexes for a workload and measure their effect.
+
+    Every candidate is created on its own on an in-memory copy of
+    db_file and kept if the planner uses it and its estimated cost is
+    lower. Candidates whose columns are a prefix of an equally good or
+    better recommendation on the same table are left out. Finally the whole
+    workload is replayed with and without all recommended indexes.
+
+    Args:
+        db_file (str): database file path, left unchanged
+        workload (list[tuple]): (sql, params) of the recorded queries,
+            e.g. QueryProfiler.samples(); non-SELECTs are ignored
+        repeat (int): runs per query, the best time counts
+
+    Returns:
+        AdvisorReport: recommendations and workload timings
+    """
+    workload = [query for query in workload
+                if query[0].lstrip().upper().startswith("SELECT")]
+    conn = _copy(db_file)
+    try:
+        evaluation = _Evaluation(conn, workload, repeat)
+        candidates = candidate_indexes(conn, workload)
+        found = [evaluation.evaluate(candidate) for candidate in candidates]
+        accepted = sorted((r for r in found if r is not None),
+                          key=lambda r: (r.estimated_speedup,
+                                         len(r.candidate.columns)),
+                          reverse=True)
+        chosen: List[Recommendation] = []
+        for recommendation in accepted:
+            if not _dominated(recommendation.candidate,
+                              (r.candidate for r in chosen)):
+                chosen.append(recommendation)
+        before = sum(measured[2] for measured in evaluation.before)
+        for recommendation in chosen:
+            conn.execute(recommendation.candidate.create_sql())
+        conn.execute("ANALYZE;")
+        after = sum(_replay(conn, query, repeat) for query in workload)
+    finally:
+        conn.close()
+    return AdvisorReport(chosen, len(candidates) - len(chosen), before,
+                         after)
+
+
+def format_report(report: AdvisorReport) -> str:
+    """Return a text report of the recommendations."""
+    lines = []
+    for item in report.recommendations:
+        kind = "covering " if item.candidate.covering else ""
+        lines.append(f"{item.candidate.create_sql()}  -- {kind}"
+                     f"est {item.estimated_speedup:.1f}x, "
+                     f"actual {item.actual_speedup:.1f}x")
+        for query in item.queries:
+            lines.append(f"    {query}")
+    lines.append(f"{len(report.recommendations)} recommended, "
+                 f"{report.rejected} rejected; workload "
+                 f"{report.seconds_before * 1000:.2f} ms -> "
+                 f"{report.seconds_after * 1000:.2f} ms "
+                 f"({report.speedup:.1f}x)")
+    return "\n".join(lines)
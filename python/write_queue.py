@@ -0,0 +1,253 @@
+"""Write-behind queue for single-row inserts.
+
+db.insert_one_row commits every row, and every commit waits for the disk
+(fsync). WriteBehindQueue accepts rows from any thread and hands them to
+one background writer that commits them in groups: a group is written in
+a single transaction once batch_size rows are waiting or flush_interval
+seconds after its first row arrived, so many rows share one fsync.
+
+Each insert returns a Future that resolves to the row's lastrowid once
+the transaction holding it has committed, or to the row's exception if
+it failed. A failing row does not affect the other rows of its group;
+if the COMMIT itself fails, every future of the group fails.
+
+durability sets PRAGMA synchronous on the writer connection:
+
+    full    fsync on every commit, survives power loss
+    normal  in WAL mode a commit may be lost on power loss, never on a
+            process crash (default)
+    off     leave flushing to the OS, fastest, may lose recent commits
+            on power loss or an OS crash
+
+Example:
+    from python.write_queue import WriteBehindQueue
+
+    with WriteBehindQueue("data/events.db", batch_size=500) as writes:
+        future = writes.insert_one_row(
+            "INSERT INTO events (name) VALUES (?);", ("login",))
+        ...
+    print(future.result())
+"""
+
+
+import atexit
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError
+from types import TracebackType
+from typing import Any, List, Optional, Tuple, Type
+
+from . import db
+
+DURABILITY = {"off": "OFF", "normal": "NORMAL", "full": "FULL"}
+
+_STOP = object()
+
+
+class QueueClosedError(sqlite3.Error):
+    """Raised when inserting into a closed WriteBehindQueue."""
+
+
+def _resolve(future: "Future[Any]", value: Any, ok: bool) -> None:
+    """Set the result or exception of future, unless it is already done;
+    the writer thread must survive a caller's misuse of its future."""
+    try:
+        if ok:
+            future.set_result(value)
+        else:
+            future.set_exception(value)
+    except InvalidStateError:
+        pass
+
+
+class WriteBehindQueue:
+    """Background writer that commits single-row inserts in groups.
+
+    Args:
+        db_file (str): database file path
+        batch_size (int): commit once this many rows are waiting
+        flush_interval (float): commit at most this many seconds after
+            the first row of a group arrived
+        max_pending (int): rows that may wait before insert_one_row
+            blocks the caller
+        durability (str): "off", "normal" or "full", see the module doc
+
+    Raises:
+        ValueError: durability is not one of DURABILITY.
+        err: sqlite3.Error as an exception, when the writer thread can't
+            open db_file.
+    """
+
+    def __init__(self, db_file: str, batch_size: int = 500,
+                 flush_interval: float = 0.05, max_pending: int = 10000,
+                 durability: str = "normal") -> None:
+        if durability not in DURABILITY:
+            raise ValueError(f"unknown durability {durability!r}")
+        self.db_file = db_file
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.durability = durability
+        self.stats = {"rows": 0, "failed": 0, "commits": 0}
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=max_pending)
+        self._closed = False
+        self._lock = threading.Lock()
+        opened: "Future[None]" = Future()
+        self._thread = threading.Thread(target=self._run, args=(opened,),
+                                        name="write-behind", daemon=True)
+        self._thread.start()
+        error = opened.exception()
+        if error is not None:
+            self._thread.join()
+            raise error
+        atexit.register(self.close)
+
+    def __enter__(self) -> "WriteBehindQueue":
+        return self
+
+    def __exit__(self, exc_type: Optional[Type[BaseException]],
+                 exc: Optional[BaseException],
+                 traceback: Optional[TracebackType]) -> None:
+        self.close()
+
+    def insert_one_row(self, insert_row_sql: str,
+                       row: Tuple[Any, ...]) -> "Future[Optional[int]]":
+        """Queue a row for insertion.
+
+        Args:
+            insert_row_sql (str): insert statement
+            row (tuple): values of the row
+
+        Raises:
+            QueueClosedError: the queue has been closed.
+
+        Returns:
+            Future: resolves to the lastrowid after the commit
+        """
+        future: "Future[Optional[int]]" = Future()
+        with self._lock:
+            if self._closed:
+                raise QueueClosedError("write-behind queue is closed")
+            self._queue.put((insert_row_sql, row, future))
+        return future
+
+    def flush(self, timeout: Optional[float] = None) -> None:
+        """Commit everything queued so far and wait for it.
+
+        Args:
+            timeout (float): seconds to wait, None waits forever
+        """
+        done: "Future[None]" = Future()
+        with self._lock:
+            if self._closed:
+                return
+            self._queue.put(done)
+        done.result(timeout)
+
+    def close(self) -> None:
+        """Commit the queued rows and stop the writer thread."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        atexit.unregister(self.close)
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def _open(self) -> sqlite3.Connection:
+        conn = db.create_connection(self.db_file)
+        conn.isolation_level = None
+        conn.execute(f"PRAGMA synchronous = {DURABILITY[self.durability]};")
+        return conn
+
+    def _collect(self, first: Any) -> Tuple[List[Any], List[Any]]:
+        """Gather rows after first until the group is full or due.
+
+        Returns the rows and the flush/stop markers seen on the way;
+        a marker ends the group early.
+        """
+        rows: List[Any] = []
+        markers: List[Any] = []
+        item = first
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            if isinstance(item, tuple):
+                rows.append(item)
+            else:
+                markers.append(item)
+                return rows, markers
+            remaining = deadline - time.monotonic()
+            if len(rows) >= self.batch_size or remaining <= 0:
+                return rows, markers
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                return rows, markers
+
+    def _insert(self, conn: sqlite3.Connection,
+                rows: List[Any]) -> List[Tuple[Any, Any, bool]]:
+        """Execute each row, keeping (future, lastrowid or error, ok)."""
+        results: List[Tuple[Any, Any, bool]] = []
+        cursor = conn.cursor()
+        try:
+            for sql, row, future in rows:
+                try:
+                    cursor.execute(sql, row)
+                    results.append((future, cursor.lastrowid, True))
+                except sqlite3.Error as err:
+                    results.append((future, err, False))
+        finally:
+            cursor.close()
+        return results
+
+    def _commit(self, conn: sqlite3.Connection, rows: List[Any]) -> None:
+        """Insert rows in one transaction and resolve their futures.
+
+        Rows whose future was cancelled are skipped; the futures of the
+        others can't be cancelled from here on.
+        """
+        rows = [(sql, row, future) for sql, row, future in rows
+                if future.set_running_or_notify_cancel()]
+        if not rows:
+            return
+        try:
+            with db._retry_busy_timeout(conn):
+                db._with_retry(self.db_file,
+                               lambda: conn.execute("BEGIN IMMEDIATE;"))
+            results = self._insert(conn, rows)
+            conn.execute("COMMIT;")
+        except sqlite3.Error as err:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK;")
+            results = [(future, err, False) for _, _, future in rows]
+        else:
+            self.stats["commits"] += 1
+        for future, value, ok in results:
+            self.stats["rows" if ok else "failed"] += 1
+            _resolve(future, value, ok)
+        for sql in {sql for sql, _, _ in rows}:
+            db.invalidate_results(self.db_file, sql)
+
+    def _run(self, opened: "Future[None]") -> None:
+        # the connection belongs to this thread; __init__ waits for the
+        # outcome so that an unusable db_file fails there
+        try:
+            conn = self._open()
+        except BaseException as err:
+            opened.set_exception(err)
+            return
+        opened.set_result(None)
+        try:
+            stopping = False
+            while not stopping:
+                rows, markers = self._collect(self._queue.get())
+                if rows:
+                    self._commit(conn, rows)
+                for marker in markers:
+                    if marker is _STOP:
+                        stopping = True
+                    else:
+                        _resolve(marker, None, True)
+        finally:
+            db.close_connection(conn)
@@ -0,0 +1,115 @@
+"""Test module for async_db.py
+"""
+
+
+import asyncio
+import os
+import sqlite3
+import threading
+import unittest
+from python import db
+from python.async_db import AsyncDB
+
+
+class TestAsyncDB(unittest.IsolatedAsyncioTestCase):
+    """Test class for async_db.py
+    """
+
+    def setUp(self) -> None:
+        """Setup
+        """
+        self.db_file = "sqlite.db"
+
+    def tearDown(self) -> None:
+        """Teardown
+        """
+        db.close_all_pools()
+        if os.path.exists(self.db_file):
+            os.remove(self.db_file)
+
+    async def test_crud(self) -> None:
+        """Test the coroutine helpers end to end.
+        """
+        async with AsyncDB(max_workers=2) as adb:
+            sql = """CREATE TABLE IF NOT EXISTS test (
+                id integer PRIMARY KEY,
+                name text NOT NULL
+            );"""
+            await adb.create_table(self.db_file, sql)
+            sql = """INSERT INTO test (name) VALUES (?);"""
+            self.assertEqual(1, await adb.insert_one_row(self.db_file, sql,
+                                                         ("John",)))
+            await adb.insert_many_rows(self.db_file, sql,
+                                       [("Jane",), ("Jim",)])
+            sql = """UPDATE test SET name = ? WHERE id = ?;"""
+            self.assertEqual(1, await adb.update_record(self.db_file, sql,
+                                                        ("Joe", 1)))
+            sql = """DELETE FROM test WHERE id = ?;"""
+            self.assertEqual(1, await adb.delete_record(self.db_file, sql,
+                                                        (3,)))
+            sql = """SELECT name FROM test WHERE id = ?;"""
+            self.assertEqual(("Joe",), await adb.select_one_row(
+                self.db_file, sql, (1,)))
+            sql = """SELECT name FROM test ORDER BY id;"""
+            self.assertEqual([("Joe",), ("Jane",)],
+                             await adb.select_many_rows(self.db_file, sql,
+                                                        ()))
+            metrics = adb.metrics()
+            self.assertEqual(7, metrics["completed"])
+            self.assertEqual(0, metrics["queue_depth"])
+
+    async def test_iter_rows(self) -> None:
+        """Test async iteration and early exit releasing the connection.
+        """
+        sql = """CREATE TABLE IF NOT EXISTS test (id integer PRIMARY KEY);"""
+        db.create_table(self.db_file, sql)
+        db.insert_many_rows(self.db_file, "INSERT INTO test VALUES (?);",
+                            [(i,) for i in range(25)])
+        sql = """SELECT id FROM test ORDER BY id;"""
+        async with AsyncDB() as adb:
+            rows = [row async for row in adb.iter_rows(self.db_file, sql,
+                                                       (), 10)]
+            self.assertEqual([(i,) for i in range(25)], rows)
+            sizes = [len(batch) async for batch in
+                     adb.stream_rows(self.db_file, sql, (), 10)]
+            self.assertEqual([10, 10, 5], sizes)
+            rows_iter = adb.iter_rows(self.db_file, sql, (), 10)
+            async for row in rows_iter:
+                break
+            await rows_iter.aclose()
+            pool = db.get_pool(self.db_file)
+            self.assertEqual(pool.size, pool.idle_count)
+
+    async def test_stream_rows_unpooled(self) -> None:
+        """Test streaming on connections that are bound to one thread.
+        """
+        sql = """CREATE TABLE IF NOT EXISTS test (id integer PRIMARY KEY);"""
+        db.create_table(self.db_file, sql)
+        db.insert_many_rows(self.db_file, "INSERT INTO test VALUES (?);",
+                            [(i,) for i in range(10)])
+        sql = """SELECT id FROM test ORDER BY id;"""
+        db.configure_pool(enabled=False)
+        try:
+            async with AsyncDB(max_workers=2) as adb:
+                rows_iter = adb.iter_rows(self.db_file, sql, (), 2)
+                rows = [await rows_iter.__anext__()]
+                # the idle worker that opened the connection takes this
+                # call, so the rest of the stream can't run on it
+                release = threading.Event()
+                task = asyncio.ensure_future(adb.run(release.wait, 5.0))
+                await asyncio.sleep(0.05)
+                rows += [row async for row in rows_iter]
+                release.set()
+                await task
+                self.assertEqual([(i,) for i in range(10)], rows)
+                rows_iter = adb.iter_rows(self.db_file, sql, (), 2)
+                async for row in rows_iter:
+                    break
+                await rows_iter.aclose()
+                with self.assertRaises(sqlite3.OperationalError):
+                    async for row in adb.iter_rows(self.db_file,
+                                                   "SELECT * FROM nope;", ()):
+                        pass
+                self.assertEqual(0, adb.metrics()["running"])
+        finally:
+            db.configure_pool(enabled=True)
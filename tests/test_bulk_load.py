@@ -0,0 +1,101 @@
+"""Test module for bulk_load.py
+"""
+
+
+import os
+import tempfile
+import unittest
+from python import bulk_load, db
+
+
+class TestBulkLoad(unittest.TestCase):
+    """Test class for bulk_load.py
+    """
+
+    def setUp(self) -> None:
+        """Setup
+        """
+        self.db_file = "sqlite.db"
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        """Teardown
+        """
+        db.close_all_pools()
+        self.tmp_dir.cleanup()
+        if os.path.exists(self.db_file):
+            os.remove(self.db_file)
+
+    def write_tsv(self, name: str, text: str) -> str:
+        """Write a TSV file into the temporary directory.
+        """
+        path = os.path.join(self.tmp_dir.name, name)
+        with open(path, "w", encoding="utf-8") as tsv_file:
+            tsv_file.write(text)
+        return path
+
+    def test_infer_schema(self) -> None:
+        """Test infer_schema on the SupplyChainDB files.
+        """
+        schema = bulk_load.infer_schema("SupplyChainDB/ProductsN.tsv")
+        self.assertEqual("ProductsN", schema.table)
+        self.assertEqual("ProductID", schema.primary_key)
+        self.assertEqual(["INTEGER", "TEXT", "INTEGER", "INTEGER",
+                          "TEXT", "REAL"], schema.types)
+        schema = bulk_load.infer_schema("SupplyChainDB/Customers.tsv")
+        # postal codes like 05021 must keep their leading zero
+        self.assertEqual("TEXT", schema.types[5])
+        path = self.write_tsv("Zips.tsv", "Zip\tRate\n05021\t0.5\n"
+                                          "12345\t-0.25e1\n")
+        self.assertEqual(["TEXT", "REAL"],
+                         bulk_load.infer_schema(path, sample_size=2).types)
+        bulk_load.load_tsv(self.db_file, path)
+        sql = """SELECT Zip, Rate FROM Zips ORDER BY Zip;"""
+        self.assertEqual([("05021", 0.5), ("12345", -2.5)],
+                         db.select_many_rows(self.db_file, sql, ()))
+
+    def test_load_directory(self) -> None:
+        """Test loading every SupplyChainDB file.
+        """
+        stats = bulk_load.load_directory(self.db_file, "SupplyChainDB")
+        self.assertEqual(8, len(stats))
+        for item in stats:
+            with open(os.path.join("SupplyChainDB", item.table + ".tsv"),
+                      encoding="utf-8") as tsv_file:
+                expected = sum(1 for _ in tsv_file) - 1
+            sql = f'SELECT COUNT(*) FROM "{item.table}";'
+            self.assertEqual(expected, item.rows)
+            self.assertEqual((expected,),
+                             db.select_one_row(self.db_file, sql, ()))
+        report = bulk_load.format_report(stats)
+        self.assertIn("OrderDetailsN", report)
+
+    def test_load_tsv_chunks_and_indexes(self) -> None:
+        """Test chunked loading and index creation after the load.
+        """
+        path = self.write_tsv(
+            "People.tsv", "PersonID\tName\tAge\n" +
+            "".join(f"{i}\tname{i}\t{i % 90}\n" for i in range(1, 101)))
+        index = "CREATE INDEX idx_people_age ON People (Age);"
+        stats = bulk_load.load_tsv(self.db_file, path, chunk_size=7,
+                                   indexes=[index])
+        self.assertEqual(100, stats.rows)
+        # reloading keeps the index and replaces the rows
+        stats = bulk_load.load_tsv(self.db_file, path, replace=True)
+        self.assertEqual(100, stats.rows)
+        sql = """SELECT COUNT(*) FROM sqlite_master
+                 WHERE type = 'index' AND name = 'idx_people_age';"""
+        self.assertEqual((1,), db.select_one_row(self.db_file, sql, ()))
+        sql = """SELECT COUNT(*) FROM People;"""
+        self.assertEqual((100,), db.select_one_row(self.db_file, sql, ()))
+
+    def test_load_tsv_invalid_row(self) -> None:
+        """Test that a row not matching the schema rolls back the load.
+        """
+        path = self.write_tsv(
+            "People.tsv", "PersonID\tAge\n1\t20\n2\t25\n3\tunknown\n")
+        self.assertRaisesRegex(ValueError, "People.tsv:4", bulk_load.load_tsv,
+                               self.db_file, path,
+                               column_types={"Age": "INTEGER"})
+        sql = """SELECT name FROM sqlite_master WHERE name = 'People';"""
+        self.assertIsNone(db.select_one_row(self.db_file, sql, ()))
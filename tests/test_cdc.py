@@ -0,0 +1,107 @@
+"""Test module for cdc.py
+"""
+
+
+import os
+import unittest
+from python import cdc, db
+
+
+class TestCdc(unittest.TestCase):
+    """Test class for cdc.py
+    """
+
+    def setUp(self) -> None:
+        """Setup
+        """
+        self.db_file = "sqlite.db"
+        db.create_table(self.db_file, "CREATE TABLE people (id INTEGER "
+                                      "PRIMARY KEY, name TEXT NOT NULL);")
+        db.insert_one_row(self.db_file,
+                          "INSERT INTO people (name) VALUES (?);", ("Ann",))
+
+    def tearDown(self) -> None:
+        """Teardown
+        """
+        db.close_all_pools()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(self.db_file + suffix):
+                os.remove(self.db_file + suffix)
+
+    def test_capture(self) -> None:
+        """Test that inserts, updates, key changes and deletes are logged.
+        """
+        cdc.track(self.db_file, "people", values=True)
+        self.assertEqual(["people"], cdc.tracked(self.db_file))
+        consumer = cdc.ChangeConsumer(self.db_file, "cache", since=0)
+        db.insert_one_row(self.db_file,
+                          "INSERT INTO people (name) VALUES (?);", ("Bob",))
+        db.update_record(self.db_file,
+                         "UPDATE people SET name = ? WHERE id = ?;",
+                         ("Ann B", 1))
+        db.update_record(self.db_file,
+                         "UPDATE people SET id = 10 WHERE id = ?;", (2,))
+        db.delete_record(self.db_file, "DELETE FROM people WHERE id = ?;",
+                         (1,))
+        changes = consumer.poll()
+        self.assertEqual([("insert", (2,)), ("update", (1,)),
+                          ("delete", (2,)), ("update", (10,)),
+                          ("delete", (1,))],
+                         [(c.op, c.key) for c in changes])
+        self.assertEqual({"id": 1, "name": "Ann B"}, changes[1].values)
+        self.assertIsNone(changes[4].values)
+        self.assertEqual(list(range(1, 6)), [c.seq for c in changes])
+        cdc.untrack(self.db_file, "people")
+        self.assertEqual([], cdc.tracked(self.db_file))
+        db.delete_record(self.db_file, "DELETE FROM people WHERE id > ?;",
+                         (0,))
+        self.assertEqual(5, cdc.latest_seq(self.db_file))
+
+    def test_blobs(self) -> None:
+        """Test that BLOB keys and values are logged as hex.
+        """
+        db.create_table(self.db_file, "CREATE TABLE files (name BLOB "
+                                      "PRIMARY KEY, body BLOB);")
+        cdc.track(self.db_file, "files", values=True)
+        consumer = cdc.ChangeConsumer(self.db_file, "sync")
+        db.insert_one_row(self.db_file, "INSERT INTO files VALUES (?, ?);",
+                          (b"\x01", b"\x00\xff"))
+        db.update_record(self.db_file,
+                         "UPDATE files SET name = ?, body = NULL;",
+                         (b"\x02",))
+        self.assertEqual([("insert", ("01",), {"name": "01", "body": "00ff"}),
+                          ("delete", ("01",), None),
+                          ("update", ("02",), {"name": "02", "body": None})],
+                         [(c.op, c.key, c.values) for c in consumer.poll()])
+
+    def test_consumers(self) -> None:
+        """Test batches, stored positions and pruning.
+        """
+        cdc.track(self.db_file, "people")
+        fast = cdc.ChangeConsumer(self.db_file, "fast")
+        slow = cdc.ChangeConsumer(self.db_file, "slow")
+        db.insert_many_rows(self.db_file,
+                            "INSERT INTO people (name) VALUES (?);",
+                            [(f"p{i}",) for i in range(5)])
+        self.assertEqual([2, 2, 1],
+                         [len(batch) for batch in fast.batches(2)])
+        self.assertEqual([], fast.poll())
+        self.assertEqual(5, fast.position)
+        slow.acknowledge(slow.poll(3)[-1].seq)
+        self.assertEqual(3, cdc.prune(self.db_file))
+        resumed = cdc.ChangeConsumer(self.db_file, "slow")
+        self.assertEqual([4, 5], [c.seq for c in resumed.poll()])
+        resumed.close()
+        self.assertEqual(2, cdc.prune(self.db_file))
+        fast.close()
+        db.insert_one_row(self.db_file,
+                          "INSERT INTO people (name) VALUES (?);", ("Zed",))
+        self.assertEqual(1, cdc.prune(self.db_file))
+        # sequence numbers are not reused after the log was emptied
+        late = cdc.ChangeConsumer(self.db_file, "late")
+        self.assertEqual(6, late.position)
+        db.insert_one_row(self.db_file,
+                          "INSERT INTO people (name) VALUES (?);", ("Amy",))
+        self.assertEqual([7], [c.seq for c in late.poll()])
+        with self.assertRaises(ValueError):
+            cdc.track(self.db_file, "missing")
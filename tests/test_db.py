@@ -3,6 +3,8 @@
 
 
 import os
+import threading
+import time
 import unittest
 import sqlite3
 from typing import Tuple
@@ -21,8 +23,10 @@ class TestDB(unittest.TestCase):
     def tearDown(self) -> None:
         """Teardown
         """
-        if os.path.exists(self.db_file):
-            os.remove(self.db_file)
+        db.close_all_pools()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(self.db_file + suffix):
+                os.remove(self.db_file + suffix)
 
     def test_create_connection(self) -> None:
         """Test create_connection function.
@@ -249,3 +253,862 @@ class TestDB(unittest.TestCase):
         data_out = cursor.fetchone()
         self.assertEqual(5, len(data_out))
         db.close_connection(conn)
+
+    def test_pool_reuses_connection(self) -> None:
+        """Test that helpers borrow the same pooled connection.
+        """
+        pool = db.get_pool(self.db_file)
+        with pool.connection() as conn1:
+            pass
+        with pool.connection() as conn2:
+            pass
+        self.assertIs(conn1, conn2)
+        db.select_one_row(self.db_file, "SELECT 1", ())
+        self.assertEqual(1, pool.size)
+
+    def test_pool_timeout(self) -> None:
+        """Test that a full pool raises PoolTimeoutError.
+        """
+        pool = db.ConnectionPool(self.db_file, max_size=1,
+                                 checkout_timeout=0.05)
+        conn = pool.acquire()
+        self.assertRaises(db.PoolTimeoutError, pool.acquire)
+        pool.release(conn)
+        pool.release(pool.acquire())
+        pool.close()
+
+    def test_pool_opens_outside_lock(self) -> None:
+        """Test that a slow or failing open doesn't hold up the pool.
+        """
+        opening = threading.Event()
+        proceed = threading.Event()
+
+        class SlowPool(db.ConnectionPool):
+            fail = False
+
+            def _open(self) -> "db._PoolEntry":
+                if threading.current_thread().name == "slow":
+                    opening.set()
+                    proceed.wait(5)
+                    if self.fail:
+                        raise sqlite3.OperationalError("cannot open")
+                return super()._open()
+
+        pool = SlowPool(self.db_file, max_size=2, checkout_timeout=0.1)
+        pool.release(pool.acquire())
+        errors = []
+
+        def acquire() -> None:
+            try:
+                pool.acquire()
+            except sqlite3.OperationalError as err:
+                errors.append(err)
+
+        slow = threading.Thread(target=acquire, name="slow")
+        held = pool.acquire()
+        slow.start()
+        self.assertTrue(opening.wait(5))
+        # the idle connection moves in and out while the other opens
+        pool.release(held)
+        held = pool.acquire()
+        self.assertRaises(db.PoolTimeoutError, pool.acquire)
+        pool.fail = True
+        proceed.set()
+        slow.join()
+        self.assertEqual(1, len(errors))
+        # the failed open gave its slot back
+        pool.release(pool.acquire())
+        pool.release(held)
+        self.assertEqual(2, pool.size)
+        pool.close()
+
+    def test_pool_idle_eviction(self) -> None:
+        """Test that idle connections are closed after idle_timeout.
+        """
+        pool = db.ConnectionPool(self.db_file, idle_timeout=0.0)
+        conn1 = pool.acquire()
+        pool.release(conn1)
+        time.sleep(0.01)
+        conn2 = pool.acquire()
+        self.assertIsNot(conn1, conn2)
+        self.assertRaises(sqlite3.ProgrammingError,
+                          conn1.execute, "SELECT 1")
+        pool.release(conn2)
+        pool.close()
+
+    def test_pool_replaced_file(self) -> None:
+        """Test that pooled connections to a deleted file are not reused.
+        """
+        sql = """CREATE TABLE IF NOT EXISTS test (id integer PRIMARY KEY);"""
+        db.create_table(self.db_file, sql)
+        os.remove(self.db_file)
+        sql_check = """SELECT name FROM sqlite_master WHERE name = 'test';"""
+        self.assertIsNone(db.select_one_row(self.db_file, sql_check, ()))
+
+    def test_pool_disabled(self) -> None:
+        """Test helpers with pooling turned off.
+        """
+        db.configure_pool(enabled=False)
+        try:
+            sql = """CREATE TABLE IF NOT EXISTS test (
+                id integer PRIMARY KEY,
+                name text NOT NULL
+            );"""
+            db.create_table(self.db_file, sql)
+            db.insert_one_row(self.db_file,
+                              "INSERT INTO test (name) VALUES (?);",
+                              ("John",))
+            row = db.select_one_row(self.db_file,
+                                    "SELECT name FROM test;", ())
+            self.assertEqual(("John",), row)
+            self.assertEqual({}, db._POOLS)
+        finally:
+            db.configure_pool(enabled=True)
+
+    def test_resource_tracking(self) -> None:
+        """Test that helpers release connections, cursors and statements.
+        """
+        db.set_resource_tracking(True)
+        try:
+            sql = """CREATE TABLE IF NOT EXISTS test (
+                id integer PRIMARY KEY,
+                name text NOT NULL
+            );"""
+            db.create_table(self.db_file, sql)
+            db.insert_many_rows(self.db_file,
+                                "INSERT INTO test (name) VALUES (?);",
+                                [("John",), ("Jane",)])
+            db.select_many_rows(self.db_file, "SELECT * FROM test;", ())
+            db.update_record(self.db_file,
+                             "UPDATE test SET name = ? WHERE id = ?;",
+                             ("Jim", 1))
+            db.delete_record(self.db_file,
+                             "DELETE FROM test WHERE id = ?;", (2,))
+            # the pooled connection stays open, nothing else does
+            self.assertEqual({"connections": 1, "cursors": 0,
+                              "statements": 0},
+                             db.resource_counts(self.db_file))
+            conn = db.create_connection(self.db_file)
+            cursor = conn.cursor()
+            cursor.execute("SELECT * FROM test;")
+            self.assertEqual({"connections": 2, "cursors": 1,
+                              "statements": 1},
+                             db.resource_counts(self.db_file))
+            cursor.close()
+            db.close_connection(conn)
+            db.close_all_pools()
+            self.assertEqual({"connections": 0, "cursors": 0,
+                              "statements": 0},
+                             db.resource_counts(self.db_file))
+        finally:
+            db.set_resource_tracking(False)
+
+    def test_stream_rows(self) -> None:
+        """Test stream_rows and iter_rows functions.
+        """
+        sql = """CREATE TABLE IF NOT EXISTS test (
+            id integer PRIMARY KEY,
+            name text NOT NULL,
+            age integer
+        );"""
+        db.create_table(self.db_file, sql)
+        sql = """INSERT INTO test (name, age) VALUES (?, ?);"""
+        data_in = [(f"name{i}", i) for i in range(25)]
+        db.insert_many_rows(self.db_file, sql, data_in)
+        sql = """SELECT name, age FROM test WHERE age >= ?;"""
+        batches = list(db.stream_rows(self.db_file, sql, (0,), 10))
+        self.assertEqual([10, 10, 5], [len(batch) for batch in batches])
+        self.assertEqual(data_in, [row for batch in batches for row in batch])
+        self.assertEqual(data_in[20:],
+                         list(db.iter_rows(self.db_file, sql, (20,), 2)))
+
+    def test_iter_rows_early_break(self) -> None:
+        """Test that breaking out of iter_rows returns the connection.
+        """
+        sql = """CREATE TABLE IF NOT EXISTS test (id integer PRIMARY KEY);"""
+        db.create_table(self.db_file, sql)
+        db.insert_many_rows(self.db_file, "INSERT INTO test VALUES (?);",
+                            [(i,) for i in range(100)])
+        pool = db.get_pool(self.db_file)
+        rows = db.iter_rows(self.db_file, "SELECT id FROM test;", (), 10)
+        self.assertEqual((0,), next(rows))
+        self.assertEqual(0, pool.idle_count)
+        rows.close()
+        self.assertEqual(1, pool.idle_count)
+
+    def test_named_queries(self) -> None:
+        """Test register_query, load_queries and get_query functions.
+        """
+        db.register_query("one", "  SELECT 1;  ")
+        self.assertEqual("SELECT 1;", db.get_query("one"))
+        self.assertRaises(KeyError, db.get_query, "missing")
+        sql_file = "queries.sql"
+        with open(sql_file, "w", encoding="utf-8") as queries:
+            queries.write("-- name: by_id\n"
+                          "SELECT * FROM test\nWHERE id = ?;\n\n"
+                          "-- name: count\nSELECT COUNT(*) FROM test;\n")
+        try:
+            self.assertEqual(["by_id", "count"],
+                             db.load_queries(sql_file))
+        finally:
+            os.remove(sql_file)
+        self.assertEqual("SELECT * FROM test\nWHERE id = ?;",
+                         db.get_query("by_id"))
+        self.assertEqual("SELECT COUNT(*) FROM test;", db.get_query("count"))
+
+    def test_statement_cache_stats(self) -> None:
+        """Test prepared statement hits and misses on pooled connections.
+        """
+        db.reset_statement_cache_stats()
+        sql = """SELECT ? + 1;"""
+        for i in range(5):
+            db.select_one_row(self.db_file, sql, (i,))
+        self.assertEqual({"hits": 4, "misses": 1, "size": 128},
+                         db.statement_cache_stats(self.db_file))
+        db.configure_statement_cache(1)
+        try:
+            db.reset_statement_cache_stats()
+            for i in range(3):
+                db.select_one_row(self.db_file, sql, (i,))
+                db.select_one_row(self.db_file, "SELECT 2;", ())
+            stats = db.statement_cache_stats()
+            self.assertEqual((0, 6, 1),
+                             (stats["hits"], stats["misses"], stats["size"]))
+        finally:
+            db.configure_statement_cache(128)
+
+    def create_people(self) -> None:
+        """Create test and other tables with two rows each.
+        """
+        for table in ("test", "other"):
+            sql = f"""CREATE TABLE IF NOT EXISTS {table} (
+                id integer PRIMARY KEY,
+                name text NOT NULL
+            );"""
+            db.create_table(self.db_file, sql)
+            sql = f"""INSERT INTO {table} (name) VALUES (?);"""
+            db.insert_many_rows(self.db_file, sql, [("John",), ("Jane",)])
+
+    def test_result_cache_table_invalidation(self) -> None:
+        """Test that writes only invalidate results of the written table.
+        """
+        self.create_people()
+        cache = db.enable_result_cache(check_data_version=False)
+        try:
+            sql_test = """SELECT name FROM test WHERE id = ?;"""
+            sql_other = """SELECT name FROM "other" ORDER BY id;"""
+            self.assertEqual(("John",),
+                             db.select_one_row(self.db_file, sql_test, (1,)))
+            rows = db.select_many_rows(self.db_file, sql_other, ())
+            rows.append(("mutated",))
+            self.assertEqual([("John",), ("Jane",)],
+                             db.select_many_rows(self.db_file, sql_other, ()))
+            self.assertEqual(1, cache.stats["hits"])
+            db.update_record(self.db_file,
+                             "UPDATE test SET name = ? WHERE id = ?;",
+                             ("Jim", 1))
+            self.assertEqual(("Jim",),
+                             db.select_one_row(self.db_file, sql_test, (1,)))
+            db.select_many_rows(self.db_file, sql_other, ())
+            self.assertEqual(2, cache.stats["hits"])
+            self.assertEqual(1, cache.stats["invalidations"])
+        finally:
+            db.disable_result_cache()
+
+    def test_result_cache_data_version(self) -> None:
+        """Test that commits from another connection invalidate results.
+        """
+        self.create_people()
+        cache = db.enable_result_cache(check_data_version=True)
+        try:
+            sql = """SELECT COUNT(*) FROM test;"""
+            self.assertEqual((2,), db.select_one_row(self.db_file, sql, ()))
+            # the helpers' own commits still invalidate per table
+            db.update_record(self.db_file,
+                             "UPDATE other SET name = ? WHERE id = ?;",
+                             ("Jim", 1))
+            self.assertEqual((2,), db.select_one_row(self.db_file, sql, ()))
+            conn = db.create_connection(self.db_file)
+            with conn:
+                conn.execute("DELETE FROM test;")
+            db.close_connection(conn)
+            self.assertEqual((0,), db.select_one_row(self.db_file, sql, ()))
+            self.assertEqual((1, 2), (cache.stats["hits"],
+                                      cache.stats["misses"]))
+        finally:
+            db.disable_result_cache()
+
+    def test_result_cache_named_params(self) -> None:
+        """Test that named parameters are part of the cache key.
+        """
+        cache = db.enable_result_cache()
+        try:
+            sql = """SELECT :x;"""
+            self.assertEqual((1,), db.select_one_row(self.db_file, sql,
+                                                     {"x": 1}))
+            self.assertEqual((2,), db.select_one_row(self.db_file, sql,
+                                                     {"x": 2}))
+            self.assertEqual((1,), db.select_one_row(self.db_file, sql,
+                                                     {"x": 1}))
+            self.assertEqual(1, cache.stats["hits"])
+        finally:
+            db.disable_result_cache()
+
+    def test_result_cache_limits(self) -> None:
+        """Test ttl expiry and max_entries eviction of the result cache.
+        """
+        cache = db.enable_result_cache(max_entries=2, ttl=0.05)
+        try:
+            for i in range(3):
+                db.select_one_row(self.db_file, "SELECT ?;", (i,))
+            self.assertEqual(2, len(cache))
+            self.assertEqual(1, cache.stats["evictions"])
+            time.sleep(0.06)
+            db.select_one_row(self.db_file, "SELECT ?;", (2,))
+            self.assertEqual(0, cache.stats["hits"])
+            small = db.enable_result_cache(max_bytes=10)
+            db.select_one_row(self.db_file, "SELECT ?;", (2,))
+            self.assertEqual(0, len(small))
+        finally:
+            db.disable_result_cache()
+
+    def test_result_cache_read_tables(self) -> None:
+        """Test invalidation through comma joins, subqueries and views.
+        """
+        self.create_people()
+        db.create_table(self.db_file, """CREATE VIEW people AS
+            SELECT o.name FROM "other" o WHERE o.id IN (SELECT id FROM
+            test);""")
+        queries = ["""SELECT o.name FROM test t, "other" o
+                      WHERE t.id = o.id ORDER BY o.id;""",
+                   """SELECT name FROM people ORDER BY name;"""]
+        db.enable_result_cache()
+        try:
+            self.assertEqual([[("John",), ("Jane",)], [("Jane",), ("John",)]],
+                             [db.select_many_rows(self.db_file, sql, ())
+                              for sql in queries])
+            db.update_record(self.db_file,
+                             'UPDATE "other" SET name = ? WHERE id = ?;',
+                             ("Zoe", 1))
+            self.assertEqual([[("Zoe",), ("Jane",)], [("Jane",), ("Zoe",)]],
+                             [db.select_many_rows(self.db_file, sql, ())
+                              for sql in queries])
+        finally:
+            db.disable_result_cache()
+
+    def test_table_names(self) -> None:
+        """Test written table name extraction used for cache invalidation.
+        """
+        sql = """INSERT INTO test (id) VALUES (1)
+                 ON CONFLICT (id) DO UPDATE SET id = 2;"""
+        self.assertEqual({"test"}, db._table_names(db._WRITE_TABLES, sql))
+        self.assertEqual({"t"}, db._table_names(
+            db._WRITE_TABLES, "UPDATE OR IGNORE t SET a = 1;"))
+        self.assertEqual(frozenset(), db._table_names(
+            db._WRITE_TABLES, "DROP TABLE t;"))
+
+    def test_connection_profiles(self) -> None:
+        """Test that profiles configure pooled and new connections.
+        """
+        db.use_profile("read_heavy", self.db_file)
+        try:
+            sql = """PRAGMA journal_mode;"""
+            self.assertEqual(("wal",),
+                             db.select_one_row(self.db_file, sql, ()))
+            sql = """PRAGMA busy_timeout;"""
+            self.assertEqual((5000,),
+                             db.select_one_row(self.db_file, sql, ()))
+            conn = db.create_connection(self.db_file, "durable")
+            self.assertEqual(
+                (2,), conn.execute("PRAGMA synchronous;").fetchone())
+            db.close_connection(conn)
+        finally:
+            db.use_profile("default", self.db_file)
+        self.assertRaises(KeyError, db.use_profile, "missing")
+        self.assertRaises(KeyError, db.create_connection, self.db_file,
+                          "missing")
+
+    def test_checkpoint(self) -> None:
+        """Test checkpoint and checkpoint_if_needed on a WAL database.
+        """
+        db.use_profile("durable", self.db_file)
+        try:
+            sql = """CREATE TABLE IF NOT EXISTS test (
+                id integer PRIMARY KEY,
+                name text NOT NULL
+            );"""
+            db.create_table(self.db_file, sql)
+            db.insert_many_rows(self.db_file,
+                                "INSERT INTO test (name) VALUES (?);",
+                                [("x" * 100,) for _ in range(1000)])
+            wal_file = self.db_file + "-wal"
+            self.assertGreater(os.path.getsize(wal_file), 0)
+            self.assertFalse(db.checkpoint_if_needed(self.db_file,
+                                                     max_wal_bytes=1 << 30))
+            self.assertTrue(db.checkpoint_if_needed(self.db_file,
+                                                    max_wal_bytes=0))
+            self.assertEqual(0, os.path.getsize(wal_file))
+            busy, _, _ = db.checkpoint(self.db_file)
+            self.assertEqual(0, busy)
+            self.assertRaises(ValueError, db.checkpoint, self.db_file,
+                              "SOMETIMES")
+        finally:
+            db.use_profile("default", self.db_file)
+
+    def test_wal_checkpointer(self) -> None:
+        """Test the background WAL checkpointer thread.
+        """
+        db.use_profile("durable", self.db_file)
+        checkpointer = db.WalCheckpointer(self.db_file, interval=0.01,
+                                          max_wal_bytes=0)
+        checkpointer.start()
+        try:
+            sql = """CREATE TABLE IF NOT EXISTS test (id integer);"""
+            db.create_table(self.db_file, sql)
+            deadline = time.monotonic() + 5
+            while checkpointer.checkpoints == 0 \
+                    and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertGreater(checkpointer.checkpoints, 0)
+        finally:
+            checkpointer.stop()
+            db.use_profile("default", self.db_file)
+
+    def hold_write_lock(self, seconds: float) -> threading.Thread:
+        """Hold the database write lock from another thread for seconds.
+        """
+        locked = threading.Event()
+
+        def hold() -> None:
+            conn = sqlite3.connect(self.db_file, isolation_level=None)
+            conn.execute("BEGIN IMMEDIATE;")
+            locked.set()
+            time.sleep(seconds)
+            conn.execute("COMMIT;")
+            conn.close()
+
+        thread = threading.Thread(target=hold)
+        thread.start()
+        locked.wait()
+        return thread
+
+    def test_retry_on_locked(self) -> None:
+        """Test that write helpers retry while another writer holds the lock.
+        """
+        sql = """CREATE TABLE IF NOT EXISTS test (
+            id integer PRIMARY KEY,
+            name text NOT NULL
+        );"""
+        db.create_table(self.db_file, sql)
+        db.reset_retry_stats()
+        db.set_retry_policy(db.RetryPolicy(base_delay=0.01, max_delay=0.05))
+        try:
+            thread = self.hold_write_lock(0.2)
+            sql = """INSERT INTO test (name) VALUES (?);"""
+            self.assertEqual(1, db.insert_one_row(self.db_file, sql,
+                                                  ("John",)))
+            thread.join()
+            stats = db.retry_stats(self.db_file)
+            self.assertGreater(stats["retries"], 0)
+            self.assertGreater(stats["lock_wait"], 0.1)
+            self.assertEqual(0, stats["failures"])
+            # the connection keeps its own busy timeout for other work
+            self.assertEqual((5000,), db.select_one_row(
+                self.db_file, "PRAGMA busy_timeout;", ()))
+
+            db.set_retry_policy(db.RetryPolicy(base_delay=0.01,
+                                               max_wait=0.05))
+            thread = self.hold_write_lock(0.3)
+            sql = """UPDATE test SET name = ? WHERE id = ?;"""
+            self.assertRaises(sqlite3.OperationalError, db.update_record,
+                              self.db_file, sql, ("Jim", 1))
+            thread.join()
+            self.assertEqual(1, db.retry_stats()["failures"])
+        finally:
+            db.set_retry_policy(db.RetryPolicy())
+
+    def test_retry_delay(self) -> None:
+        """Test exponential backoff with jitter.
+        """
+        policy = db.RetryPolicy(base_delay=0.01, max_delay=0.05, jitter=0)
+        self.assertEqual([0.01, 0.02, 0.04, 0.05],
+                         [policy.delay(n) for n in range(1, 5)])
+        policy = db.RetryPolicy(base_delay=0.01, jitter=0.5)
+        for _ in range(20):
+            self.assertTrue(0.005 <= policy.delay(1) <= 0.01)
+
+    def create_accounts(self) -> None:
+        """Create an accounts table with checking and savings balances.
+        """
+        sql = """CREATE TABLE IF NOT EXISTS accounts (
+            id integer PRIMARY KEY,
+            name text NOT NULL,
+            balance integer NOT NULL CHECK (balance >= 0)
+        );"""
+        db.create_table(self.db_file, sql)
+        sql = """INSERT INTO accounts (name, balance) VALUES (?, ?);"""
+        db.insert_many_rows(self.db_file, sql,
+                            [("CHECKING", 100), ("SAVINGS", 0)])
+
+    def balances(self) -> list[tuple[int]]:
+        """Return account balances ordered by id.
+        """
+        sql = """SELECT balance FROM accounts ORDER BY id;"""
+        rows: list[tuple[int]] = db.select_many_rows(self.db_file, sql, ())
+        return rows
+
+    def test_transaction(self) -> None:
+        """Test that a transfer commits atomically or not at all.
+        """
+        self.create_accounts()
+        debit = """UPDATE accounts SET balance = balance - ? WHERE id = ?;"""
+        credit = """UPDATE accounts SET balance = balance + ? WHERE id = ?;"""
+        with db.transaction(self.db_file) as tx:
+            tx.update_record(debit, (30, 1))
+            tx.update_record(credit, (30, 2))
+            sql = """SELECT balance FROM accounts WHERE id = ?;"""
+            self.assertEqual((70,), tx.select_one_row(sql, (1,)))
+            # other connections don't see uncommitted changes
+            conn = db.create_connection(self.db_file)
+            self.assertEqual((100,), conn.execute(
+                "SELECT balance FROM accounts WHERE id = 1;").fetchone())
+            db.close_connection(conn)
+        self.assertEqual([(70,), (30,)], self.balances())
+        with self.assertRaises(sqlite3.IntegrityError):
+            with db.transaction(self.db_file) as tx:
+                tx.update_record(credit, (100, 2))
+                tx.update_record(debit, (100, 1))
+        self.assertEqual([(70,), (30,)], self.balances())
+
+    def test_transaction_joins_helpers(self) -> None:
+        """Test that helpers called inside a transaction join it.
+        """
+        self.create_accounts()
+        sql = """INSERT INTO accounts (name, balance) VALUES (?, ?);"""
+        with self.assertRaises(RuntimeError):
+            with db.transaction(self.db_file):
+                db.insert_one_row(self.db_file, sql, ("LOAN", 5))
+                self.assertEqual(3, len(self.balances()))
+                raise RuntimeError("abort")
+        self.assertEqual(2, len(self.balances()))
+
+    def test_transaction_savepoints(self) -> None:
+        """Test savepoints and nested transactions.
+        """
+        self.create_accounts()
+        sql = """UPDATE accounts SET balance = ? WHERE id = ?;"""
+        with db.transaction(self.db_file) as tx:
+            tx.update_record(sql, (1, 1))
+            with self.assertRaises(sqlite3.IntegrityError):
+                with tx.savepoint():
+                    tx.update_record(sql, (2, 2))
+                    tx.update_record(sql, (-1, 1))
+            with self.assertRaises(RuntimeError):
+                with db.transaction(self.db_file) as inner:
+                    self.assertIs(tx, inner)
+                    inner.update_record(sql, (3, 2))
+                    raise RuntimeError("abort")
+            with db.transaction(self.db_file):
+                db.update_record(self.db_file, sql, (4, 2))
+        self.assertEqual([(1,), (4,)], self.balances())
+
+    def test_transaction_invalidates_cache(self) -> None:
+        """Test that a committed transaction invalidates cached results.
+        """
+        self.create_accounts()
+        db.enable_result_cache(check_data_version=False)
+        try:
+            self.assertEqual([(100,), (0,)], self.balances())
+            with db.transaction(self.db_file) as tx:
+                tx.execute_non_query("UPDATE accounts SET balance = 50;")
+                self.assertEqual([(50,), (50,)], self.balances())
+            self.assertEqual([(50,), (50,)], self.balances())
+        finally:
+            db.disable_result_cache()
+
+    def test_fingerprint(self) -> None:
+        """Test that literals don't split fingerprints.
+        """
+        self.assertEqual(
+            "SELECT * FROM test WHERE id IN (?...) AND name = ?",
+            db.fingerprint("SELECT *  FROM test\n WHERE id IN (1, 2, 3)"
+                           " AND name = 'O''Brien';"))
+        self.assertEqual(db.fingerprint("SELECT a1 FROM t2 WHERE x = 5;"),
+                         db.fingerprint("SELECT a1 FROM t2 WHERE x = ?"))
+
+    def test_profiling(self) -> None:
+        """Test timings, row counts and plan capture of the profiler.
+        """
+        self.create_people()
+        profiler = db.enable_profiling(plan_threshold=0.0)
+        try:
+            for i in (1, 2):
+                db.select_one_row(self.db_file,
+                                  f"SELECT name FROM test WHERE id = {i};",
+                                  ())
+            db.select_many_rows(self.db_file,
+                                "SELECT name FROM test WHERE name = ?;",
+                                ("Jane",))
+            db.select_one_row(self.db_file,
+                              "SELECT name FROM test WHERE id = (SELECT id "
+                              "FROM other WHERE name = ?);", ("Jane",))
+            for batch in db.stream_rows(self.db_file,
+                                        "SELECT * FROM other;", (), 1):
+                pass
+            db.update_record(self.db_file, "UPDATE test SET name = ?;",
+                             ("Jim",))
+            stats = profiler.stats()
+            lookup = stats["SELECT name FROM test WHERE id = ?"]
+            self.assertEqual((2, 2), (lookup["calls"], lookup["rows"]))
+            self.assertFalse(lookup["full_scan"])
+            self.assertEqual(2, stats["SELECT * FROM other"]["rows"])
+            self.assertEqual(2, stats["UPDATE test SET name = ?"]["rows"])
+            self.assertEqual(["SELECT * FROM other",
+                              "SELECT name FROM test WHERE id = (SELECT id "
+                              "FROM other WHERE name = ?)",
+                              "SELECT name FROM test WHERE name = ?",
+                              "UPDATE test SET name = ?"],
+                             sorted(profiler.full_scans()))
+            self.assertIn("[SCAN]", profiler.report())
+            self.assertIn('"p95_ms"', profiler.to_json())
+        finally:
+            db.disable_profiling()
+        db.select_one_row(self.db_file, "SELECT 1;", ())
+        self.assertNotIn("SELECT ?", profiler.stats())
+
+    def test_select_page(self) -> None:
+        """Test keyset pagination over a table and over a query.
+        """
+        self.create_people()
+        db.insert_many_rows(self.db_file,
+                            """INSERT INTO test (name) VALUES (?);""",
+                            [("Jim",), ("Joe",), ("Jane",)])
+        rows, token = db.select_page(self.db_file, "test", ["id"], 2)
+        self.assertEqual([(1, "John"), (2, "Jane")], rows)
+        rows, token = db.select_page(self.db_file, "test", ["id"], 2, token)
+        self.assertEqual([(3, "Jim"), (4, "Joe")], rows)
+        rows, token = db.select_page(self.db_file, "test", ["id"], 2, token)
+        self.assertEqual(([(5, "Jane")], None), (rows, token))
+        sql = """SELECT name, id FROM test WHERE id > ?;"""
+        pages = list(db.iter_pages(self.db_file, sql, ["name", "id"], 2,
+                                   (1,), descending=True))
+        self.assertEqual([[("Joe", 4), ("Jim", 3)],
+                          [("Jane", 5), ("Jane", 2)]], pages)
+        _, token = db.select_page(self.db_file, "test", ["id"], 1)
+        with self.assertRaises(ValueError):
+            db.select_page(self.db_file, "other", ["id"], 1, token)
+        with self.assertRaises(ValueError):
+            db.select_page(self.db_file, "test", ["id"], 1, "not a token")
+
+    def test_select_columns(self) -> None:
+        """Test column-wise fetching into typed arrays with null masks.
+        """
+        sql = """CREATE TABLE IF NOT EXISTS test (
+            id integer PRIMARY KEY,
+            name text,
+            score real
+        );"""
+        db.create_table(self.db_file, sql)
+        db.insert_many_rows(
+            self.db_file,
+            """INSERT INTO test (name, score) VALUES (?, ?);""",
+            [("John", 1), (None, 2.5), ("Jane", None)])
+        columns = db.select_columns(self.db_file,
+                                    """SELECT * FROM test;""", (), 2)
+        self.assertEqual(["id", "name", "score"], list(columns))
+        ids, names, scores = columns.values()
+        self.assertEqual(("q", [1, 2, 3], False),
+                         (ids.values.typecode, list(ids.values),
+                          ids.has_nulls))
+        self.assertEqual(["John", None, "Jane"], names.values)
+        self.assertEqual(("d", [1.0, 2.5, 0.0], bytearray(b"\0\0\1")),
+                         (scores.values.typecode, list(scores.values),
+                          scores.mask))
+        self.assertEqual(3, len(scores))
+        sql = """CREATE TABLE IF NOT EXISTS other (mixed, big);"""
+        db.create_table(self.db_file, sql)
+        db.insert_many_rows(
+            self.db_file, """INSERT INTO other VALUES (?, ?);""",
+            [(1, 2 ** 60 + 1), (None, 0.5), ("a", None)])
+        columns = db.select_columns(self.db_file,
+                                    """SELECT * FROM other;""", (), 2)
+        # compare reprs: 1 == 1.0
+        self.assertEqual("[1, None, 'a']", repr(columns["mixed"].values))
+        self.assertEqual([2 ** 60 + 1, 0.5, None], columns["big"].values)
+        db.create_table(self.db_file, """CREATE TABLE seq (v);""")
+        db.insert_many_rows(self.db_file, """INSERT INTO seq VALUES (?);""",
+                            [(1,), (2,), (1.5,), (2 ** 60 + 1,), ("a",)])
+        # one row per batch: ints, a float, a big int and text arrive
+        # separately
+        sql = """SELECT v FROM seq WHERE rowid <= ?;"""
+        columns = db.select_columns(self.db_file, sql, (3,), 1)
+        self.assertEqual(("d", [1.0, 2.0, 1.5]),
+                         (columns["v"].values.typecode,
+                          list(columns["v"].values)))
+        for last in (4, 5):
+            columns = db.select_columns(self.db_file, sql, (last,), 1)
+            self.assertEqual(repr([1, 2, 1.5, 2 ** 60 + 1, "a"][:last]),
+                             repr(columns["v"].values))
+
+    def test_row_factories(self) -> None:
+        """Test tuple, sqlite3.Row, slots and dict rows.
+        """
+        self.create_people()
+        sql = """SELECT id, name, count(*) FROM test GROUP BY id;"""
+        self.assertEqual((1, "John", 1),
+                         db.select_one_row(self.db_file, sql, ()))
+        row = db.select_one_row(self.db_file, sql, (), rows="row")
+        self.assertIsInstance(row, sqlite3.Row)
+        self.assertEqual("John", row["name"])
+        self.assertEqual({"id": 1, "name": "John", "count(*)": 1},
+                         db.select_one_row(self.db_file, sql, (),
+                                           rows="dict"))
+        first, second = db.select_many_rows(self.db_file, sql, (),
+                                            rows="slots")
+        self.assertIs(type(first), type(second))
+        self.assertIs(type(first), db.row_class(("id", "name", "count(*)")))
+        self.assertEqual((2, "Jane", 1),
+                         (second.id, second.name, second.count___))
+        self.assertFalse(hasattr(first, "__dict__"))
+        batches = db.stream_rows(self.db_file, sql, (), 1, rows="dict")
+        self.assertEqual(["John", "Jane"],
+                         [batch[0]["name"] for batch in batches])
+        with self.assertRaises(ValueError):
+            db.select_many_rows(self.db_file, sql, (), rows="list")
+
+    def test_read_only(self) -> None:
+        """Test read-only mode with mmap for the helpers and connections.
+        """
+        self.create_people()
+        db.use_read_only(self.db_file, mmap_size=1024 * 1024)
+        try:
+            sql = """SELECT name FROM test WHERE id = ?;"""
+            self.assertEqual(("John",),
+                             db.select_one_row(self.db_file, sql, (1,)))
+            with self.assertRaises(sqlite3.OperationalError):
+                db.update_record(self.db_file,
+                                 "UPDATE test SET name = ?;", ("Jim",))
+            with db.pooled_connection(self.db_file) as conn:
+                self.assertEqual(
+                    (1024 * 1024,),
+                    conn.execute("PRAGMA mmap_size;").fetchone())
+            db.use_read_only(self.db_file, mmap_size=0, immutable=True)
+            conn = db.create_connection(self.db_file)
+            self.assertEqual((0,),
+                             conn.execute("PRAGMA mmap_size;").fetchone())
+            db.close_connection(conn)
+        finally:
+            db.use_profile("default", self.db_file)
+        db.update_record(self.db_file, "UPDATE test SET name = ?;", ("Jim",))
+        self.assertEqual(
+            "file:/a%20b.db?mode=ro&immutable=1&cache=shared",
+            db.read_only_uri("/a b.db", immutable=True, shared_cache=True))
+
+    def test_update_delete_many(self) -> None:
+        """Test chunked and staged multi-row updates and deletes.
+        """
+        self.create_people()
+        db.insert_many_rows(self.db_file,
+                            "INSERT INTO test (name) VALUES (?);",
+                            [(f"p{i}",) for i in range(10)])
+        sql = """SELECT name FROM test WHERE id = ?;"""
+        self.assertEqual(("John",), db.select_one_row(self.db_file, sql, (1,)))
+        updated = db.update_many(self.db_file,
+                                 "UPDATE test SET name = ? WHERE id = ?;",
+                                 (("x" + str(i), i) for i in range(1, 6)),
+                                 chunk_size=2)
+        self.assertEqual(5, updated)
+        self.assertEqual(("x1",), db.select_one_row(self.db_file, sql, (1,)))
+        self.assertEqual(3, db.delete_many(
+            self.db_file, "DELETE FROM test WHERE id = ?;",
+            [(1,), (2,), (3,), (99,)], chunk_size=3))
+        self.assertEqual(2, db.update_many_staged(
+            self.db_file, "test", ["id"], ["name"],
+            [(4, "y4"), (5, "y5"), (99, "none")], chunk_size=2))
+        self.assertEqual([("y4",), ("y5",)], db.select_many_rows(
+            self.db_file, "SELECT name FROM test WHERE id IN (4, 5);", ()))
+        self.assertEqual(2, db.delete_many_staged(
+            self.db_file, "test", ["id"], [(4,), (5,), (99,)]))
+        self.assertEqual((7,), db.select_one_row(
+            self.db_file, "SELECT count(*) FROM test;", ()))
+        with self.assertRaises(sqlite3.IntegrityError):
+            db.update_many(self.db_file,
+                           "UPDATE test SET name = ? WHERE id = ?;",
+                           [("z", 6), (None, 7)])
+        self.assertNotEqual(("z",),
+                            db.select_one_row(self.db_file, sql, (6,)))
+
+    def test_upsert(self) -> None:
+        """Test upsert counts and that unchanged rows are not written.
+        """
+        self.create_people()
+        columns = ["id", "name"]
+        self.assertEqual(
+            {"inserted": 1, "updated": 1, "unchanged": 1},
+            db.upsert(self.db_file, "test", columns, ["id"],
+                      [(1, "John"), (2, "Joan"), (3, "Jim")], chunk_size=2))
+        self.assertEqual([("John",), ("Joan",), ("Jim",)], db.select_many_rows(
+            self.db_file, "SELECT name FROM test ORDER BY id;", ()))
+        conn = db.create_connection(self.db_file)
+        try:
+            before = conn.execute("PRAGMA data_version;").fetchone()
+            self.assertEqual(
+                {"inserted": 0, "updated": 0, "unchanged": 3},
+                db.upsert(self.db_file, "test", columns, ["id"],
+                          [(1, "John"), (2, "Joan"), (3, "Jim")]))
+            # nothing changed, so no page of the file was written
+            self.assertEqual(before, conn.execute(
+                "PRAGMA data_version;").fetchone())
+            self.assertEqual(
+                {"inserted": 1, "updated": 1, "unchanged": 0},
+                db.upsert(self.db_file, "test", columns, ["id"],
+                          [(4, "Ann"), (4, "Anna")]))
+        finally:
+            db.close_connection(conn)
+        self.assertEqual(("Anna",), db.select_one_row(
+            self.db_file, "SELECT name FROM test WHERE id = 4;", ()))
+
+    def test_backup(self) -> None:
+        """Test throttled backups under writes, verification and snapshots.
+        """
+        db.use_profile("read_heavy", self.db_file)
+        try:
+            self.create_people()
+            db.insert_many_rows(self.db_file,
+                                "INSERT INTO test (name) VALUES (?);",
+                                [("x" * 500,) for _ in range(200)])
+            target = self.db_file + ".bak"
+            seen = []
+
+            def progress(done: int, total: int) -> None:
+                seen.append((done, total))
+                # commits during the copy are not part of the snapshot
+                db.insert_one_row(self.db_file,
+                                  "INSERT INTO test (name) VALUES (?);",
+                                  ("late",))
+
+            stats = db.backup(self.db_file, target, pages=4, sleep=0.001,
+                              progress=progress, verify=True)
+            self.assertGreater(stats["steps"], 1)
+            self.assertEqual(stats["pages"], seen[-1][0])
+            self.assertEqual(stats["steps"], len(seen))
+            self.assertFalse(os.path.exists(target + ".tmp"))
+            self.assertEqual((202,), db.select_one_row(
+                target, "SELECT count(*) FROM test;", ()))
+            memory = db.snapshot(target, verify=True)
+            self.assertEqual((202,), memory.execute(
+                "SELECT count(*) FROM test;").fetchone())
+            memory.close()
+            missing = self.db_file + ".missing"
+            with self.assertRaises(sqlite3.OperationalError):
+                db.backup(missing, target)
+            with self.assertRaises(sqlite3.OperationalError):
+                db.snapshot(missing)
+            self.assertFalse(os.path.exists(missing))
+            self.assertEqual((202,), db.select_one_row(
+                target, "SELECT count(*) FROM test;", ()))
+        finally:
+            db.use_profile("default", self.db_file)
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(self.db_file + ".bak" + suffix):
+                    os.remove(self.db_file + ".bak" + suffix)
@@ -0,0 +1,82 @@
+"""Test module for docstore.py
+"""
+
+
+import os
+import sqlite3
+import unittest
+from python import db
+from python.docstore import Collection, json_path
+
+
+class TestDocstore(unittest.TestCase):
+    """Test class for docstore.py
+    """
+
+    def setUp(self) -> None:
+        """Setup
+        """
+        self.db_file = "sqlite.db"
+        self.people = Collection(self.db_file, "people")
+        self.people.insert_many([
+            {"name": "Ann", "age": 31, "address": {"city": "Oslo"}},
+            {"name": "Bob", "age": 17, "address": {"city": "Bergen"}},
+            {"name": "Cid", "age": 45, "tags": ["admin"]},
+        ])
+
+    def tearDown(self) -> None:
+        """Teardown
+        """
+        db.close_all_pools()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(self.db_file + suffix):
+                os.remove(self.db_file + suffix)
+
+    def test_find(self) -> None:
+        """Test filters, operators, sorting and limits.
+        """
+        self.assertEqual({"_id": 1, "name": "Ann", "age": 31,
+                          "address": {"city": "Oslo"}},
+                         self.people.find_one({"address.city": "Oslo"}))
+        names = [doc["name"] for doc in self.people.find(
+            {"age": {"$gte": 18, "$lt": 100}}, sort=[("age", -1)])]
+        self.assertEqual(["Cid", "Ann"], names)
+        self.assertEqual(2, self.people.count(
+            {"address.city": {"$in": ["Oslo", "Bergen"]}}))
+        self.assertEqual(1, self.people.count({"address": None}))
+        self.assertEqual(2, self.people.count({"name": {"$ne": "Bob"}}))
+        self.assertEqual(1, self.people.count({"tags": ["admin"]}))
+        self.assertEqual(1, len(self.people.find(limit=1)))
+        with self.assertRaises(ValueError):
+            self.people.find({"age": {"$regex": "1"}})
+        with self.assertRaises(ValueError):
+            json_path("age') OR 1=1 --")
+
+    def test_update_delete(self) -> None:
+        """Test json_set updates and deletes.
+        """
+        self.assertEqual(2, self.people.update(
+            {"age": {"$gt": 20}}, {"address.zip": "0150", "active": True}))
+        ann = self.people.find_one({"name": "Ann"})
+        assert ann is not None
+        self.assertEqual({"city": "Oslo", "zip": "0150"}, ann["address"])
+        self.assertEqual(2, self.people.count({"active": True}))
+        self.assertEqual(1, self.people.delete({"name": "Bob"}))
+        self.assertEqual(2, self.people.count())
+
+    def test_index(self) -> None:
+        """Test that indexed paths are queried through the index.
+        """
+        where = {"address.city": "Oslo"}
+        self.assertTrue(self.people.explain(where)[0].startswith("SCAN"))
+        self.people.create_index("address.city")
+        self.people.create_index("name", unique=True)
+        self.assertIn("USING INDEX idx_people_p_address_city",
+                      self.people.explain(where)[0])
+        self.assertIn("idx_people_p_name",
+                      self.people.explain(sort=[("name", 1)])[0])
+        self.assertEqual("Ann", self.people.find(where)[0]["name"])
+        self.assertEqual(["address.city", "name"],
+                         Collection(self.db_file, "people").indexes())
+        with self.assertRaises(sqlite3.IntegrityError):
+            self.people.insert({"name": "Ann"})
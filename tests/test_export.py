@@ -0,0 +1,91 @@
+"""Test module for export.py
+"""
+
+
+import csv
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from python import bulk_load, db, export
+
+
+class TestExport(unittest.TestCase):
+    """Test class for export.py
+    """
+
+    def setUp(self) -> None:
+        """Setup
+        """
+        self.directory = tempfile.mkdtemp()
+        self.db_file = os.path.join(self.directory, "sqlite.db")
+        db.create_table(self.db_file, "CREATE TABLE notes (id INTEGER "
+                                      "PRIMARY KEY, body TEXT, raw BLOB);")
+        db.create_table(self.db_file, "CREATE TABLE nums (n INTEGER, "
+                                      "x REAL);")
+        db.insert_many_rows(self.db_file,
+                            "INSERT INTO notes (body, raw) VALUES (?, ?);",
+                            [("a\tb\nc, \"d\"\\", b"\x01\xff"),
+                             (None, None)])
+        db.insert_many_rows(self.db_file, "INSERT INTO nums VALUES (?, ?);",
+                            [(i, i / 4) for i in range(2500)])
+
+    def tearDown(self) -> None:
+        """Teardown
+        """
+        db.close_all_pools()
+        shutil.rmtree(self.directory)
+
+    def path(self, name: str) -> str:
+        """Return the path of name in the temporary directory.
+        """
+        return os.path.join(self.directory, name)
+
+    def test_formats(self) -> None:
+        """Test escaping, NULLs and BLOBs in every format.
+        """
+        export.export_table(self.db_file, "notes", self.path("notes.tsv"))
+        with open(self.path("notes.tsv"), encoding="utf-8") as tsv:
+            self.assertEqual(["id\tbody\traw\n",
+                              "1\ta\\tb\\nc, \"d\"\\\\\t01ff\n", "2\t\t\n"],
+                             tsv.readlines())
+        export.export_table(self.db_file, "notes", self.path("notes.csv"))
+        with open(self.path("notes.csv"), newline="",
+                  encoding="utf-8") as csv_file:
+            self.assertEqual([["id", "body", "raw"],
+                              ["1", "a\tb\nc, \"d\"\\", "01ff"],
+                              ["2", "", ""]], list(csv.reader(csv_file)))
+        stats = export.export_query(
+            self.db_file, "SELECT * FROM notes WHERE id = ?;", (1,),
+            self.path("notes.jsonl.gz"))
+        self.assertEqual(1, stats.rows)
+        self.assertEqual(os.path.getsize(self.path("notes.jsonl.gz")),
+                         stats.bytes)
+        with gzip.open(self.path("notes.jsonl.gz"), "rt",
+                       encoding="utf-8") as jsonl:
+            self.assertEqual([{"id": 1, "body": "a\tb\nc, \"d\"\\",
+                               "raw": "01ff"}],
+                             [json.loads(line) for line in jsonl])
+        with self.assertRaises(ValueError):
+            export.export_table(self.db_file, "notes", self.path("n.xml"))
+
+    def test_export_tables(self) -> None:
+        """Test concurrent dumps and reloading a TSV dump with bulk_load.
+        """
+        out = self.path("out")
+        stats = export.export_tables(self.db_file, None, out, workers=2,
+                                     batch_size=100)
+        self.assertEqual(["notes", "nums"], [item.name for item in stats])
+        self.assertEqual([2, 2500], [item.rows for item in stats])
+        report = export.format_report(stats, 1.0)
+        self.assertIn("total", report)
+        copy = self.path("copy.db")
+        bulk_load.load_tsv(copy, os.path.join(out, "nums.tsv"))
+        self.assertEqual(
+            db.select_many_rows(self.db_file, "SELECT * FROM nums;", ()),
+            db.select_many_rows(copy, "SELECT * FROM nums;", ()))
+        stats = export.export_tables(self.db_file, ["nums"], out,
+                                     fmt="csv", compress=True)
+        self.assertTrue(stats[0].path.endswith("nums.csv.gz"))
@@ -0,0 +1,89 @@
+"""Test module for import_pipeline.py
+"""
+
+
+import os
+import tempfile
+import unittest
+from python import bulk_load, db, import_pipeline
+
+
+class TestImportPipeline(unittest.TestCase):
+    """Test class for import_pipeline.py
+    """
+
+    def setUp(self) -> None:
+        """Setup
+        """
+        self.db_file = "sqlite.db"
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        """Teardown
+        """
+        db.close_all_pools()
+        self.tmp_dir.cleanup()
+        if os.path.exists(self.db_file):
+            os.remove(self.db_file)
+
+    def write_tsv(self, name: str, text: str) -> str:
+        """Write a TSV file into the temporary directory.
+        """
+        path = os.path.join(self.tmp_dir.name, name)
+        with open(path, "w", encoding="utf-8") as tsv_file:
+            tsv_file.write(text)
+        return path
+
+    def test_load_order(self) -> None:
+        """Test that parents are ordered before their children.
+        """
+        tables = ["OrderDetailsN", "OrdersN", "ProductsN", "Shippers",
+                  "Customers", "Employees", "Categories", "Suppliers"]
+        order = import_pipeline.load_order(
+            tables, import_pipeline.SUPPLY_CHAIN_DEPENDENCIES)
+        self.assertEqual(sorted(tables), sorted(order))
+        for child, parents in \
+                import_pipeline.SUPPLY_CHAIN_DEPENDENCIES.items():
+            for parent in parents:
+                self.assertLess(order.index(parent), order.index(child))
+        self.assertRaises(ValueError, import_pipeline.load_order,
+                          ["a", "b"], {"a": ("b",), "b": ("a",)})
+
+    def test_split_ranges(self) -> None:
+        """Test that ranges cover every data line exactly once.
+        """
+        path = "SupplyChainDB/OrderDetailsN.tsv"
+        schema = bulk_load.infer_schema(path)
+        ranges = import_pipeline.split_ranges(path, 500)
+        self.assertGreater(len(ranges), 1)
+        rows = [row for start, end in ranges
+                for row in import_pipeline.parse_range(path, schema,
+                                                       start, end)]
+        expected = list(bulk_load.read_rows(path, schema))
+        self.assertEqual(expected, rows)
+
+    def test_import_directory(self) -> None:
+        """Test a parallel import of SupplyChainDB with foreign keys.
+        """
+        stats = import_pipeline.import_directory(
+            self.db_file, "SupplyChainDB", workers=2, chunk_bytes=2048)
+        self.assertEqual(8, len(stats))
+        self.assertEqual({"OrderDetailsN": 518, "OrdersN": 196},
+                         {s.table: s.rows for s in stats
+                          if s.table.startswith("Order")})
+        sql = """SELECT "table" FROM pragma_foreign_key_list('OrdersN')
+                 ORDER BY "table";"""
+        self.assertEqual([("Customers",), ("Employees",), ("Shippers",)],
+                         db.select_many_rows(self.db_file, sql, ()))
+
+    def test_import_invalid_row(self) -> None:
+        """Test that a parse error stops the import without hanging.
+        """
+        parent = self.write_tsv("Parent.tsv", "ParentID\tName\n1\ta\n")
+        child = self.write_tsv("Child.tsv",
+                               "ChildID\tParentID\n1\t1\n2\t1\t3\n")
+        self.assertRaises(ValueError, import_pipeline.import_files,
+                          self.db_file, [child, parent],
+                          {"Child": ("Parent",)}, workers=2)
+        sql = """SELECT COUNT(*) FROM Parent;"""
+        self.assertEqual((1,), db.select_one_row(self.db_file, sql, ()))
@@ -0,0 +1,91 @@
+"""Test module for index_advisor.py
+"""
+
+
+import os
+import unittest
+from python import db, index_advisor
+
+
+class TestIndexAdvisor(unittest.TestCase):
+    """Test class for index_advisor.py
+    """
+
+    def setUp(self) -> None:
+        """Setup
+        """
+        self.db_file = "sqlite.db"
+        db.create_table(self.db_file, """CREATE TABLE people (
+            id integer PRIMARY KEY,
+            email text NOT NULL,
+            city text NOT NULL,
+            age integer NOT NULL
+        );""")
+        db.insert_many_rows(
+            self.db_file,
+            """INSERT INTO people (email, city, age) VALUES (?, ?, ?);""",
+            [(f"p{i}@example.com", f"city{i % 50}", i % 90)
+             for i in range(2000)])
+        self.workload = [
+            ("SELECT * FROM people WHERE email = ?;", ("p7@example.com",)),
+            ("SELECT age FROM people p WHERE p.city = ? AND p.age > ?;",
+             ("city3", 40)),
+            ("SELECT * FROM people WHERE id = ?;", (3,)),
+        ]
+
+    def tearDown(self) -> None:
+        """Teardown
+        """
+        db.close_all_pools()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(self.db_file + suffix):
+                os.remove(self.db_file + suffix)
+
+    def test_candidate_indexes(self) -> None:
+        """Test single, multi-column and covering candidates.
+        """
+        conn = db.create_connection(self.db_file)
+        try:
+            candidates = index_advisor.candidate_indexes(conn, self.workload)
+        finally:
+            db.close_connection(conn)
+        self.assertEqual([(("email",), False), (("city", "age"), False)],
+                         [(c.columns, c.covering) for c in candidates])
+        self.assertEqual([1], candidates[1].queries)
+
+    def test_advise(self) -> None:
+        """Test that useful indexes are recommended and the file is kept.
+        """
+        report = index_advisor.advise(self.db_file, self.workload, repeat=2)
+        self.assertEqual(
+            ['CREATE INDEX IF NOT EXISTS "idx_advisor_people_email" '
+             'ON "people" ("email");',
+             'CREATE INDEX IF NOT EXISTS "idx_advisor_people_city_age" '
+             'ON "people" ("city", "age");'],
+            sorted((r.candidate.create_sql()
+                    for r in report.recommendations), reverse=True))
+        for item in report.recommendations:
+            self.assertGreater(item.estimated_speedup, 1.0)
+            before, after = next(iter(item.plans.values()))
+            self.assertTrue(before[0].startswith("SCAN"))
+            self.assertIn(item.candidate.name, after[0])
+        self.assertIn("2 recommended",
+                      index_advisor.format_report(report))
+        conn = db.create_connection(self.db_file)
+        try:
+            self.assertEqual([], conn.execute(
+                "SELECT name FROM sqlite_master "
+                "WHERE type = 'index';").fetchall())
+        finally:
+            db.close_connection(conn)
+
+    def test_profiler_samples(self) -> None:
+        """Test that profiled helper calls can be replayed as a workload.
+        """
+        profiler = db.enable_profiling()
+        try:
+            for sql, params in self.workload * 2:
+                db.select_many_rows(self.db_file, sql, params)
+        finally:
+            db.disable_profiling()
+        self.assertEqual(self.workload, profiler.samples())
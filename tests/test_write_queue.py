@@ -0,0 +1,90 @@
+"""Test module for write_queue.py
+"""
+
+
+import os
+import sqlite3
+import unittest
+from python import db
+from python.write_queue import QueueClosedError, WriteBehindQueue
+
+
+class TestWriteQueue(unittest.TestCase):
+    """Test class for write_queue.py
+    """
+
+    def setUp(self) -> None:
+        """Setup
+        """
+        self.db_file = "sqlite.db"
+        db.create_table(self.db_file, """CREATE TABLE IF NOT EXISTS test (
+            id integer PRIMARY KEY,
+            name text NOT NULL UNIQUE
+        );""")
+
+    def tearDown(self) -> None:
+        """Teardown
+        """
+        db.close_all_pools()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(self.db_file + suffix):
+                os.remove(self.db_file + suffix)
+
+    def test_group_commit(self) -> None:
+        """Test rows are committed in groups and futures get rowids.
+        """
+        sql = """INSERT INTO test (name) VALUES (?);"""
+        with WriteBehindQueue(self.db_file, batch_size=10,
+                              flush_interval=1.0) as writes:
+            futures = [writes.insert_one_row(sql, (f"name{i}",))
+                       for i in range(25)]
+            writes.flush()
+            self.assertTrue(all(f.done() for f in futures))
+        self.assertEqual(list(range(1, 26)), [f.result() for f in futures])
+        self.assertEqual(25, writes.stats["rows"])
+        self.assertEqual(3, writes.stats["commits"])
+        sql = """SELECT count(*) FROM test;"""
+        self.assertEqual((25,), db.select_one_row(self.db_file, sql, ()))
+
+    def test_failed_row(self) -> None:
+        """Test a failing row only fails its own future.
+        """
+        sql = """INSERT INTO test (name) VALUES (?);"""
+        with WriteBehindQueue(self.db_file, flush_interval=1.0) as writes:
+            first = writes.insert_one_row(sql, ("John",))
+            duplicate = writes.insert_one_row(sql, ("John",))
+            last = writes.insert_one_row(sql, ("Jane",))
+        self.assertEqual(1, first.result())
+        self.assertIsInstance(duplicate.exception(), sqlite3.IntegrityError)
+        self.assertEqual(2, last.result())
+        self.assertEqual(1, writes.stats["failed"])
+
+    def test_cancelled_row(self) -> None:
+        """Test a cancelled row is skipped and the writer keeps going.
+        """
+        sql = """INSERT INTO test (name) VALUES (?);"""
+        with WriteBehindQueue(self.db_file, flush_interval=60.0) as writes:
+            cancelled = writes.insert_one_row(sql, ("John",))
+            self.assertTrue(cancelled.cancel())
+            future = writes.insert_one_row(sql, ("Jane",))
+            writes.flush(3)
+            self.assertEqual(1, future.result(0))
+        sql = """SELECT name FROM test;"""
+        self.assertEqual([("Jane",)],
+                         db.select_many_rows(self.db_file, sql, ()))
+
+    def test_close(self) -> None:
+        """Test close commits pending rows and rejects new ones.
+        """
+        sql = """INSERT INTO test (name) VALUES (?);"""
+        writes = WriteBehindQueue(self.db_file, flush_interval=60.0,
+                                  durability="full")
+        future = writes.insert_one_row(sql, ("John",))
+        writes.close()
+        self.assertEqual(1, future.result(0))
+        with self.assertRaises(QueueClosedError):
+            writes.insert_one_row(sql, ("Jane",))
+        with self.assertRaises(ValueError):
+            WriteBehindQueue(self.db_file, durability="sometimes")
+        with self.assertRaises(sqlite3.OperationalError):
+            WriteBehindQueue("/nonexistent/dir/x.db")